@@ -70,10 +70,10 @@ import astropy.units as u
 from castor_etc.background import Background
 from flask import jsonify, request
 
-from utils import DataHolder, app, bad_request, log_traceback, logger, server_error
+from cache import make_key
+from utils import bad_request, log_traceback, logger, server_error, get_data_holder
 
 
-@app.route("/background", methods=["PUT"])
 def put_background_json():
     """
     Create a `Background` object from the JSON request and return some attributes of the
@@ -91,6 +91,7 @@ def put_background_json():
         Some attributes (i.e., mags_per_sq_arcsec, geo_flux, geo_wavelength,
         geo_linewidth) of the `Background` object as a JSON response.
     """
+    data_holder = get_data_holder()
     # Flask will raise exception 500 if any code raises an error
     try:
         #
@@ -142,10 +143,10 @@ def put_background_json():
         #
         BackgroundObj = Background(mags_per_sq_arcsec=mags_per_sq_arcsec)
         if (
-            use_default_sky_background and DataHolder.TelescopeObj is not None
+            use_default_sky_background and data_holder.TelescopeObj is not None
         ):  # will always have a TelescopeObj now
             mags_per_sq_arcsec = BackgroundObj.calc_mags_per_sq_arcsec(
-                DataHolder.TelescopeObj
+                data_holder.TelescopeObj
             )
         if geo_emission_params:  # non-empty list
             for item in geo_emission_params:  # item is a dictionary
@@ -179,7 +180,20 @@ def put_background_json():
             "calculated mags_per_sq_arcsec (excl. geocoronal emission): "
             + str(mags_per_sq_arcsec)
         )
-        DataHolder.BackgroundObj = BackgroundObj
+        data_holder.BackgroundObj = BackgroundObj
+        # The default sky background depends on the telescope, so its key includes the
+        # telescope key (the background cannot be cached without one)
+        if use_default_sky_background:
+            if data_holder.telescope_key is None:
+                data_holder.background_key = None
+            else:
+                data_holder.background_key = make_key(
+                    "default", data_holder.telescope_key, geo_emission_params
+                )
+        else:
+            data_holder.background_key = make_key(
+                "custom", custom_sky_background, geo_emission_params
+            )
         # if mags_per_sq_arcsec is None:
         #     # No user-inputted sky background & no telescope defined yet (won't happen since I disabled tabs)
         #     mags_per_sq_arcsec = {
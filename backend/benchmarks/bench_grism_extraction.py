@@ -0,0 +1,198 @@
+"""
+bench_grism_extraction.py
+
+Benchmark of the peak memory and time of the grism 1D/2D SNR extraction.
+
+Compares the previous extraction of `grism_route.simulate_grism()` (two sums over the
+same source rows, a squared copy of the noise rows, and a float64 2D SNR) with
+`extraction.extract_grism()` in float64 and float32 for every grism channel. Most of
+the memory is the 2D SNR, so float64 saves next to nothing over the previous extraction
+and the reduction comes from float32 (`grism_route.GRISM_SNR_DTYPE`, the default). If
+castor_etc is installed, the grism boxes of a default point source are simulated,
+otherwise random boxes of representative shapes are used. Run from the `backend`
+directory with `python benchmarks/bench_grism_extraction.py`.
+
+---
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import extract_grism, grism_source_rows  # noqa: E402
+
+GRISM_CHANNELS = ("uv", "u")
+# (rows, columns) of the grism boxes used if castor_etc is not installed
+SYNTHETIC_SHAPES = {"uv": (201, 3000), "u": (201, 2000)}
+SOURCE_SIZE = 15  # rows of the synthetic source image
+
+
+def simulated_boxes():
+    """
+    Return the signal, noise, and source rows of each grism channel for a default point
+    source and a 100 s exposure.
+    """
+    import astropy.units as u
+    from castor_etc.background import Background
+    from castor_etc.grism import Grism
+    from castor_etc.sources import PointSource
+    from castor_etc.telescope import Telescope
+
+    TelescopeObj = Telescope()
+    SourceObj = PointSource()
+    SourceObj.generate_bb(
+        T=6000 * u.K,
+        wavelengths=np.arange(900.0, 12005.0, 10.0) * u.AA,
+        radius=1,
+        dist=1 * u.kpc,
+    )
+    SourceObj.norm_to_AB_mag(ab_mag=20, passband=None, TelescopeObj=None)
+    BackgroundObj = Background()
+    boxes = {}
+    for channel in GRISM_CHANNELS:
+        GrismObj = Grism(TelescopeObj, SourceObj, BackgroundObj)
+        GrismObj.disperse(grism_channel=channel, check=False)
+        GrismObj.expose(exposure_time=100.0)
+        GrismObj.total_noise(Nreads=1, Nbin=1)
+        boxes[channel] = (
+            np.asarray(GrismObj.integrated_grism_box_count),
+            np.asarray(GrismObj.grism_noise_total),
+            grism_source_rows(GrismObj),
+        )
+    return boxes
+
+
+def synthetic_boxes():
+    rng = np.random.default_rng(0)
+    boxes = {}
+    for channel in GRISM_CHANNELS:
+        shape = SYNTHETIC_SHAPES[channel]
+        signal = rng.gamma(2.0, 50.0, size=shape)
+        noise = np.sqrt(signal + 100.0)
+        center = (shape[0] - 1) // 2
+        half_source_size = (SOURCE_SIZE - 1) // 2
+        rows = slice(center - half_source_size, center + half_source_size + 1)
+        boxes[channel] = (signal, noise, rows)
+    return boxes
+
+
+def previous_extraction(signal, noise, rows):
+    """
+    The extraction used before `extract_grism()`.
+    """
+    grism_1d = np.sum(signal[rows], axis=0)
+    sum_signal_1d = np.sum(signal[rows], axis=0)
+    quad_error_1d = np.sqrt(np.sum(noise[rows] ** 2, axis=0))
+    snr_1d = sum_signal_1d / quad_error_1d
+    grism_2d = signal / noise
+    return grism_1d, snr_1d, grism_2d
+
+
+def peak_memory(func):
+    """
+    Return the peak memory (bytes) allocated while calling `func`.
+    """
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main(number=20):
+    try:
+        boxes = simulated_boxes()
+        print("Using simulated grism boxes")
+    except ImportError:
+        boxes = synthetic_boxes()
+        print("castor_etc is not installed: using synthetic grism boxes")
+    for channel, (signal, noise, rows) in boxes.items():
+        # Same results as before
+        _, snr_1d, snr_2d = previous_extraction(signal, noise, rows)
+        _, _, new_snr_1d, new_snr_2d = extract_grism(signal, noise, rows)
+        assert np.allclose(snr_1d, new_snr_1d, equal_nan=True)
+        assert np.allclose(snr_2d, new_snr_2d, equal_nan=True)
+        print(f"Channel {channel!r}, grism box of shape {signal.shape}:")
+        for label, func in (
+            ("previous", lambda: previous_extraction(signal, noise, rows)),
+            ("extract_grism f8", lambda: extract_grism(signal, noise, rows)),
+            (
+                "extract_grism f4",
+                lambda: extract_grism(signal, noise, rows, dtype=np.float32),
+            ),
+        ):
+            seconds = min(timeit.repeat(func, number=number, repeat=5)) / number
+            peak = peak_memory(func) / 2**20
+            print(f"{label:>20s}: {seconds * 1e3:7.2f} ms, peak {peak:7.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+bench_routing.py
+
+Microbenchmark of the per-request routing overhead of `connector.redirect()`.
+
+Compares the previous sequential `re.search()` chain with the precompiled `Router`.
+Run from the `backend` directory with `python benchmarks/bench_routing.py`.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from routing import Router  # noqa: E402
+
+API_ROUTES = {
+    "passbands": ["GET"],
+    "telescope": ["PUT"],
+    "background": ["PUT"],
+    "source": ["PUT"],
+    "photometry": ["PUT"],
+    "uvmos": ["PUT"],
+    "transit": ["PUT"],
+    "grism": ["PUT"],
+}
+STATIC_FILES = ["manifest.json", "favicon.ico", "robots.txt"]
+PATHS = [
+    "session/contrib/abc123def456/telescope",
+    "session/contrib/abc123def456/photometry",
+    "session/contrib/abc123def456/transit",
+    "session/contrib/abc123def456/static/js/main.1a2b3c4d.js",
+    "session/contrib/abc123def456/static/css/main.5e6f7a8b.css",
+    "session/contrib/abc123def456/static/media/logo-fullsize.9c0d1e2f.png",
+    "session/contrib/abc123def456/favicon.ico",
+    "session/contrib/abc123def456/does-not-exist",
+]
+
+
+def sequential_regex(path):
+    """
+    The routing logic used before the `Router` (minus the logging).
+    """
+    for name in API_ROUTES:
+        if re.search(rf"\b{name}\b", path) is not None:
+            return name
+    for filename in STATIC_FILES:
+        if re.search(rf"\b{filename}\b", path) is not None:
+            return filename
+    filename = re.search(r"[^/?]*\.(?:gif|png|jpeg|jpg|ico|js|css)$", path)
+    return None if filename is None else "file"
+
+
+def build_router():
+    router = Router()
+    for name, methods in API_ROUTES.items():
+        router.add(name, None, methods)
+    for filename in STATIC_FILES:
+        router.add(filename, None, ["GET"])
+    router.add_files(("gif", "png", "jpeg", "jpg", "ico", "js", "css"), None)
+    return router
+
+
+def main(number=20000):
+    router = build_router()
+    for path in PATHS:
+        match = router.resolve(path)
+        assert (match.name if match is not None else None) == sequential_regex(path), path
+
+    def run_sequential():
+        for path in PATHS:
+            sequential_regex(path)
+
+    def run_router():
+        for path in PATHS:
+            router.resolve(path)
+
+    for label, func in (("sequential re.search", run_sequential), ("Router", run_router)):
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        per_request = seconds / (number * len(PATHS)) * 1e6
+        print(f"{label:>20s}: {per_request:.2f} us per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+cache.py
+
+Small in-memory caches shared by the CASTOR Flask API.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe, bounded least-recently-used cache with optional time-to-live (TTL)
+    eviction.
+
+    Parameters
+    ----------
+      maxsize :: int
+        The maximum number of entries to keep. When a new entry would exceed this limit,
+        the least-recently-used entry is evicted.
+
+      ttl :: float or None
+        The number of seconds an entry stays valid after it was last accessed. If None,
+        entries never expire (they can still be evicted by the size limit).
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be a positive integer")
+        self.maxsize = int(maxsize)
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expiry time, value)
+        self._lock = threading.RLock()
+
+    def _expiry(self):
+        return None if self.ttl is None else time.monotonic() + self.ttl
+
+    def _is_expired(self, expiry):
+        return expiry is not None and expiry <= time.monotonic()
+
+    def get(self, key, default=None):
+        """
+        Return the value stored under `key` (refreshing its recency and TTL) or `default`
+        if there is no valid entry.
+        """
+        with self._lock:
+            try:
+                expiry, value = self._data[key]
+            except KeyError:
+                return default
+            if self._is_expired(expiry):
+                del self._data[key]
+                return default
+            self._data[key] = (self._expiry(), value)
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """
+        Store `value` under `key`, evicting the least-recently-used entries if needed.
+        """
+        with self._lock:
+            self._data[key] = (self._expiry(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Remove and return the value stored under `key`, or `default` if not present.
+        """
+        with self._lock:
+            try:
+                expiry, value = self._data.pop(key)
+            except KeyError:
+                return default
+            return default if self._is_expired(expiry) else value
+
+    def purge_expired(self):
+        """
+        Remove all expired entries. Returns the number of entries removed.
+        """
+        if self.ttl is None:
+            return 0
+        with self._lock:
+            expired = [
+                key for key, (expiry, _) in self._data.items() if self._is_expired(expiry)
+            ]
+            for key in expired:
+                del self._data[key]
+            return len(expired)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and not self._is_expired(item[0])
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+def make_key(*parts):
+    """
+    Return a content-addressed key (hex SHA-256 digest) for the given JSON-serializable
+    parts. Dictionaries are hashed independently of their key order.
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
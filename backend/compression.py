@@ -0,0 +1,166 @@
+"""
+compression.py
+
+Transparent compression of API responses, negotiated via `Accept-Encoding`.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import gzip
+import os
+
+from flask import request
+
+from utils import app
+
+try:
+    import brotli  # optional
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # optional
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this (in bytes) are not worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("ETC_COMPRESSION_MIN_SIZE", "1024"))
+# Compression levels. The defaults favour speed since responses are compressed on the fly
+GZIP_LEVEL = int(os.getenv("ETC_GZIP_LEVEL", "6"))  # 1-9
+BROTLI_LEVEL = int(os.getenv("ETC_BROTLI_LEVEL", "4"))  # 0-11
+ZSTD_LEVEL = int(os.getenv("ETC_ZSTD_LEVEL", "3"))  # 1-22
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/octet-stream",  # e.g., transit scene tiles (static files are skipped)
+    "application/x-ndjson",
+    "text/html",
+    "text/plain",
+}
+
+
+def _compress_gzip(data):
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _compress_brotli(data):
+    return brotli.compress(data, quality=BROTLI_LEVEL)
+
+
+def _compress_zstd(data):
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+
+
+# Available encodings in order of preference (used to break ties in `Accept-Encoding`)
+COMPRESSORS = {}
+if zstandard is not None:
+    COMPRESSORS["zstd"] = _compress_zstd
+if brotli is not None:
+    COMPRESSORS["br"] = _compress_brotli
+COMPRESSORS["gzip"] = _compress_gzip
+
+
+def choose_encoding(accept_encodings):
+    """
+    Return the content encoding in `COMPRESSORS` with the highest quality in the given
+    `Accept-Encoding` header (a werkzeug `Accept` object), or None if the client accepts
+    none of them.
+    """
+    best_encoding = None
+    best_quality = 0
+    for encoding in COMPRESSORS:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best_encoding, best_quality = encoding, quality
+    return best_encoding
+
+
+@app.after_request
+def compress_response(response):
+    """
+    Compress JSON (and other text) responses larger than `COMPRESSION_MIN_SIZE` with the
+    best encoding accepted by the client.
+    """
+    if (
+        response.status_code < 200
+        or response.status_code in (204, 206, 304)
+        or response.direct_passthrough  # e.g., files (already precompressed, if at all)
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_SIZE:
+        return response
+    response.set_data(COMPRESSORS[encoding](data))
+    response.headers["Content-Encoding"] = encoding
+    # The compressed bytes differ from the original ones, so a strong ETag (if any) must
+    # become weak. `If-None-Match` uses weak comparison, so conditional requests still work
+    etag, is_weak = response.get_etag()
+    if etag is not None and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
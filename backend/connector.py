@@ -70,18 +70,91 @@ License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
 ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
-import re
+import importlib
+import os
 
-from flask import abort, request, send_from_directory
+from flask import abort, request
 
+import compression  # noqa: F401 (registers the response compression hook)
+from routing import Router
+from static_files import send_static
 from utils import app, cors, bad_route, logger
-from telescope_route import put_telescope_json
-from background_route import put_background_json
-from source_route import put_source_json
-from photometry_route import put_photometry_json
-from uvmos_route import put_uvmos_json
-from transit_route import put_transit_json
-from grism_route import put_grism_json
+
+# Request handlers, as (module name, function name, allowed HTTP methods). The route
+# modules import the heavy castor_etc compute backends (and astropy), so they are only
+# imported on first use (see `get_handler()`) unless `preload()` is called.
+ROUTE_HANDLERS = {
+    "passbands": ("telescope_route", "get_passband_curves_json", ["GET"]),
+    "telescope": ("telescope_route", "put_telescope_json", ["PUT"]),
+    "background": ("background_route", "put_background_json", ["PUT"]),
+    "source": ("source_route", "put_source_json", ["PUT"]),
+    "photometry": ("photometry_route", "put_photometry_json", ["PUT"]),
+    "photometrySweep": (
+        "photometry_route",
+        "put_photometry_sweep_json",
+        ["PUT"],
+    ),
+    "photometryBatch": (
+        "photometry_batch_route",
+        "put_photometry_batch_json",
+        ["PUT"],
+    ),
+    "uvmos": ("uvmos_route", "put_uvmos_json", ["PUT"]),
+    "transit": ("transit_route", "put_transit_json", ["PUT"]),
+    "grism": ("grism_route", "put_grism_json", ["PUT"]),
+    "grismSweep": ("grism_route", "put_grism_sweep_json", ["PUT"]),
+    "transitLightCurve": ("transit_route", "get_light_curve_stream", ["GET"]),
+    "transitScene": ("scene_route", "get_scene_json", ["GET"]),
+    "transitSceneTile": ("scene_route", "get_scene_tile", ["GET"]),
+    "job": ("jobs_route", "get_job_json", ["GET", "DELETE"]),
+    "jobResult": ("jobs_route", "get_job_result_json", ["GET"]),
+}
+# Path patterns of the handlers with parameters (see `Router.add()`). The other handlers
+# are selected by the last path segment, which must match their name.
+ROUTE_PATTERNS = {
+    "transitLightCurve": r"transit/lightcurve/(?P<light_curve_id>\w+)",
+    "transitScene": r"transit/scene/(?P<scene_id>\w+)",
+    "transitSceneTile": (
+        r"transit/scene/(?P<scene_id>\w+)/"
+        + r"(?P<level>\d+)/(?P<tile_x>\d+)/(?P<tile_y>\d+)"
+    ),
+    "job": r"jobs/(?P<job_id>[\w-]+)",
+    "jobResult": r"jobs/(?P<job_id>[\w-]+)/result",
+}
+_loaded_handlers = {}
+
+
+def get_handler(name):
+    """
+    Return the request handler registered under `name` in `ROUTE_HANDLERS`, importing its
+    module if this has not been done yet.
+    """
+    try:
+        return _loaded_handlers[name]
+    except KeyError:
+        module_name, function_name, _ = ROUTE_HANDLERS[name]
+        logger.debug(f"Importing {module_name} to handle /{name}")
+        handler = getattr(importlib.import_module(module_name), function_name)
+        _loaded_handlers[name] = handler
+        return handler
+
+
+def preload():
+    """
+    Import all route modules (and their castor_etc backends) and build the data that are
+    computed at import (e.g., the serialized passband curves).
+
+    When gunicorn is started with `--preload`, calling this in the master process means
+    the import cost is only paid once and the memory is shared copy-on-write by all forked
+    workers.
+    """
+    for name in ROUTE_HANDLERS:
+        get_handler(name)
+    logger.debug("Preloaded all route handlers.")
+
+
+if os.getenv("ETC_PRELOAD_BACKENDS", "false").lower() == "true":
+    preload()
 
 if __name__ != "__main__":
     logger.debug("Assuming app is configured for gunicorn in Docker container.")
@@ -93,14 +166,59 @@ if __name__ != "__main__":
         <http://localhost:5000/>).
         """
         logger.info(f"Serving index.html because client requested {app.static_url_path}/")
-        return app.send_static_file("index.html")
+        return send_static("index.html")
+
+
+def _api_handler(name):
+    """
+    Return a function that calls the (lazily imported) handler registered under `name` in
+    `ROUTE_HANDLERS`.
+    """
+
+    def handler(**params):
+        return get_handler(name)(**params)
+
+    return handler
+
+
+def _serve_static_file(filename):
+    """
+    Return a function that serves the given file from the static folder.
+    """
+
+    def handler():
+        return send_static(filename)
+
+    return handler
+
+
+def _serve_asset(path, filename):
+    """
+    Serve an image/js/css file from the static folder.
+    """
+    if app.static_folder is None:
+        return bad_route(path)
+    return send_static(path)
+
+
+#
+# Build the router once at import time
+#
+router = Router()
+for _name, (_, _, _methods) in ROUTE_HANDLERS.items():
+    router.add(_name, _api_handler(_name), _methods, pattern=ROUTE_PATTERNS.get(_name))
+for _filename in ("manifest.json", "favicon.ico", "robots.txt"):
+    router.add(_filename, _serve_static_file(_filename), ["GET"])
+router.add_files(("gif", "png", "jpeg", "jpg", "ico", "js", "css"), _serve_asset)
 
 
 # N.B. only use GET requests for default path
 # See <https://flask.palletsprojects.com/en/2.0.x/api/#url-route-registrations>
 @app.route("/", defaults={"path": ""})
-@app.route("/<string:path>", methods=["GET", "PUT"])  # needed to redirect everything else
-@app.route("/<path:path>", methods=["GET", "PUT"])
+@app.route(
+    "/<string:path>", methods=["GET", "PUT", "DELETE"]
+)  # needed to redirect everything else
+@app.route("/<path:path>", methods=["GET", "PUT", "DELETE"])
 def redirect(path):
     """
     Redirects request to the appropriate function based on the path. This is required
@@ -113,81 +231,14 @@ def redirect(path):
         `https://ws-uv.canfar.net/castor/<sessionID>/foo`, the path is
         `castor/<sessionID>/foo`.
     """
-
-    logger.info(f"Parsing request for /{path}")
-    logger.info("URL of request: " + str(request.url))
-
-    if re.search(r"\btelescope\b", path) is not None:  # match whole word
-        logger.info("Redirecting request to /telescope")
-        if request.method != "PUT":
-            abort(405)
-        return put_telescope_json()
-
-    if re.search(r"\bbackground\b", path) is not None:  # match whole word
-        logger.info("Redirecting request to /background")
-        if request.method != "PUT":
-            abort(405)
-        return put_background_json()
-
-    if re.search(r"\bsource\b", path) is not None:  # match whole word
-        logger.info("Redirecting request to /source")
-        if request.method != "PUT":
-            abort(405)
-        return put_source_json()
-
-    elif re.search(r"\bphotometry\b", path) is not None:  # match whole word
-        logger.info(request.method)
-        if request.method != "PUT":
-            abort(405)
-        return put_photometry_json()
-    
-    elif re.search(r"\buvmos\b", path) is not None:  # match whole word
-        logger.info(request.method)
-        if request.method != "PUT":
-            abort(405)
-        return put_uvmos_json()
-    
-    elif re.search(r"\bgrism\b", path) is not None:  # match whole word
-        logger.info(request.method)
-        if request.method != "PUT":
-            abort(405)
-        return put_grism_json()
-    
-    elif re.search(r"\btransit\b", path) is not None:  # match whole word
-        logger.info(request.method)
-        if request.method != "PUT":
-            abort(405)
-        return put_transit_json()
-
-    elif re.search(r"\bmanifest.json\b", path) is not None:  # match whole word
-        logger.info("Serving manifest.json")
-        if request.method != "GET":
-            abort(405)
-        return app.send_static_file("manifest.json")
-
-    elif re.search(r"\bfavicon.ico\b", path) is not None:  # match whole word
-        logger.info("Serving favicon.ico")
-        if request.method != "GET":
-            abort(405)
-        return app.send_static_file("favicon.ico")
-
-    elif re.search(r"\brobots.txt\b", path) is not None:  # match whole word
-        logger.info("Serving robots.txt")
-        if request.method != "GET":
-            abort(405)
-        return app.send_static_file("robots.txt")
-
-    else:
-        filename = re.search(r"[^/?]*\.(?:gif|png|jpeg|jpg|ico|js|css)$", path)
-        if app.static_folder is not None and filename is not None:
-            if request.method != "GET":
-                abort(405)
-            logger.debug(f"Serving some image/js/css at /{path}")
-            return send_from_directory(app.static_folder, filename.group())
-
-        else:
-            logger.error(f"Bad route: route=/{path}")
-            return bad_route(path)
+    match = router.resolve(path)
+    if match is None:
+        logger.error(f"Bad route: route=/{path}")
+        return bad_route(path)
+    logger.debug(f"{request.method} /{path} -> {match.name}")
+    if request.method not in match.methods:
+        abort(405)
+    return match.handler(**match.params)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,195 @@
+"""
+extraction.py
+
+Extraction helpers for the spectroscopy routes: the UVMOS extraction box and SNR
+wavelengths, and single-pass extraction kernels (no castor_etc dependency).
+
+---
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import astropy.units as u
+import numpy as np
+
+
+def parse_extraction_box(extraction_box, pixel_scale):
+    """
+    Convert the extraction box of the request to the (integer pixel) extraction
+    parameters of `UVMOS_Spectroscopy.calc_source_CASTORSpectrum()` and
+    `calc_background_CASTORSpectrum()`.
+
+    Parameters
+    ----------
+      extraction_box :: dict
+        The "width", "heightLowerLim", "heightUpperLim" (may be empty), and "units"
+        ("pixel" or "arcsec") of the extraction box.
+
+      pixel_scale :: float
+        The telescope pixel scale in arcsec per pixel.
+
+    Returns
+    -------
+      extraction_params :: dict
+        The "extraction_width", "extraction_lowerlim", and (if given)
+        "extraction_upperlim" in pixels.
+    """
+    extraction_width = float(extraction_box['width']) #converting from string to a float
+    extraction_height_lowerlim = float(extraction_box['heightLowerLim']) #converting from a string to a float
+    extraction_height_upperlim = extraction_box['heightUpperLim']
+    if extraction_height_upperlim != '':
+        extraction_height_upperlim = float(extraction_height_upperlim)
+
+    # If units are pixels, then we need to convert the floating point digit into an
+    # integer. When units are arcsec, first we need to divide by the pixel scale to
+    # convert units to pixel, then round them to the nearest 1 digit, i.e., 0.6/0.1 =
+    # 0.5999999999999 and int(0.6/0.1) = 5, which is not correct, so after rounding, we
+    # convert the result into an int() type.
+    if extraction_box['units'] == 'pixel':
+        to_pixels = int
+    else:
+        def to_pixels(value):
+            return int(np.round(value / pixel_scale, 0))
+
+    extraction_params = dict(
+        extraction_width=to_pixels(extraction_width),
+        extraction_lowerlim=to_pixels(extraction_height_lowerlim),
+    )
+    if extraction_height_upperlim != '':
+        extraction_params["extraction_upperlim"] = to_pixels(extraction_height_upperlim)
+    return extraction_params
+
+
+def parse_snr_wavelengths(wavelength):
+    """
+    Parse the wavelength(s) at which to calculate the SNR (or the exposure time).
+
+    Parameters
+    ----------
+      wavelength :: float, str, or list of floats
+        A wavelength in nm, a list of wavelengths in nm, or "all" for all the
+        wavelengths of the extracted spectra.
+
+    Returns
+    -------
+      wave :: `astropy.Quantity` or None
+        The wavelength(s) in nm (0-dimensional for a single wavelength), or None for
+        "all". Raises a `ValueError` if the wavelengths are not positive numbers.
+    """
+    if isinstance(wavelength, str) and wavelength.lower() == "all":
+        return None
+    wave = np.asarray(wavelength, dtype=float)
+    if wave.ndim > 1 or wave.size == 0 or not np.all(np.isfinite(wave) & (wave > 0)):
+        raise ValueError("The SNR wavelengths must be positive numbers or 'all'.")
+    return wave * u.nm
+
+
+def grism_source_rows(GrismObj):
+    """
+    Return the slice of the rows of the grism box covered by the source, i.e., the
+    height of the source image centred on the box.
+    """
+    box_center = int((GrismObj.integrated_grism_box_count.shape[0] - 1) / 2)
+    half_source_size = int((GrismObj.source_image.shape[0] - 1) / 2)
+    return slice(box_center - half_source_size, box_center + half_source_size + 1)
+
+
+def extract_grism(signal, noise, rows, dtype=np.float64):
+    """
+    Extract the 1D spectrum of a grism exposure in a single pass without full-frame
+    temporaries: the signal summed over the source rows, the noise summed in quadrature
+    over the same rows, and the 1D and 2D SNR. Only the outputs are allocated (the
+    source rows are views and the quadrature sum is a single `np.einsum()`).
+
+    Parameters
+    ----------
+      signal, noise :: 2D arrays of floats
+        The signal (`integrated_grism_box_count`) and total noise (`grism_noise_total`)
+        of the grism box.
+
+      rows :: slice
+        The source rows (see `grism_source_rows()`).
+
+      dtype :: dtype
+        The dtype of the 2D SNR (e.g., float32 to halve its memory).
+
+    Returns
+    -------
+      signal_1d, noise_1d, snr_1d :: 1D arrays of floats
+        The signal, noise, and SNR of the 1D spectrum.
+
+      snr_2d :: 2D array of `dtype`
+        The SNR of each pixel of the grism box.
+    """
+    signal = np.asarray(signal)
+    noise = np.asarray(noise)
+    noise_rows = noise[rows]
+    signal_1d = np.sum(signal[rows], axis=0)
+    noise_1d = np.einsum("ij,ij->j", noise_rows, noise_rows)
+    np.sqrt(noise_1d, out=noise_1d)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snr_1d = signal_1d / noise_1d
+        snr_2d = np.divide(
+            signal, noise, out=np.empty(signal.shape, dtype=dtype), casting="same_kind"
+        )
+    return signal_1d, noise_1d, snr_1d, snr_2d
@@ -0,0 +1,472 @@
+"""
+gaia_index.py
+
+Local, tiled index of Gaia sources that answers cone searches from disk.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import contextlib
+import functools
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from cache import LRUCache
+from utils import log_traceback, logger
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover
+    cKDTree = None
+
+# Directory of the tiles. The index is disabled if this is not set.
+GAIA_INDEX_DIR = os.getenv("ETC_GAIA_INDEX_DIR")
+# Defaults for a new index (an existing index keeps the values it was created with)
+GAIA_TILE_SIZE = float(os.getenv("ETC_GAIA_TILE_SIZE", "0.5"))  # degrees
+# G magnitude (at least the default `srchGmax` of the frontend's source form)
+GAIA_TILE_GMAX = float(os.getenv("ETC_GAIA_TILE_GMAX", "21.0"))
+# Whether missing tiles are downloaded from the Gaia archive (in the background, while
+# the searches that need them go to the archive)
+GAIA_FETCH_TILES = os.getenv("ETC_GAIA_FETCH_TILES", "true").lower() == "true"
+GAIA_TILE_CACHE_SIZE = int(os.getenv("ETC_GAIA_TILE_CACHE_SIZE", "64"))
+GAIA_TABLE = "gaiadr3.gaia_source"
+
+_INDEX_FILENAME = "index.json"
+
+
+def _unit_vectors(ra, dec):
+    """
+    Convert right ascensions and declinations (degrees) to unit vectors.
+    """
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    cos_dec = np.cos(dec)
+    return np.column_stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)])
+
+
+class GaiaTileIndex:
+    """
+    Gaia sources brighter than `gmax`, partitioned into tiles on disk, with a k-d tree
+    per tile for cone searches. Recently used tiles are kept in memory.
+
+    The sky is divided into declination bands of height `tile_size`, and each band into
+    right ascension cells of (roughly) the same area. Unlike HEALPix, this tiling makes
+    it exact and cheap to list the tiles that overlap a cone, and it does not need
+    healpy.
+
+    Parameters
+    ----------
+      directory :: str
+        The directory of the tiles.
+
+      tile_size :: float
+        The height of the declination bands in degrees (only for a new index).
+
+      gmax :: float
+        The faintest G magnitude in the tiles (only for a new index).
+
+      fetch :: bool
+        If True, download missing tiles from the Gaia archive in a background thread.
+        Searches that need a missing tile are not answered from the index until the
+        tile is saved, so no request waits for a download.
+
+      cache_size :: int
+        The number of tiles kept in memory.
+    """
+
+    def __init__(
+        self,
+        directory,
+        tile_size=GAIA_TILE_SIZE,
+        gmax=GAIA_TILE_GMAX,
+        fetch=GAIA_FETCH_TILES,
+        cache_size=GAIA_TILE_CACHE_SIZE,
+    ):
+        self.directory = directory
+        self.fetch = fetch
+        index_path = os.path.join(directory, _INDEX_FILENAME)
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                params = json.load(f)
+            tile_size, gmax = params["tile_size"], params["gmax"]
+        else:
+            os.makedirs(directory, exist_ok=True)
+            with open(index_path, "w") as f:
+                json.dump({"tile_size": tile_size, "gmax": gmax}, f)
+        self.tile_size = tile_size
+        self.gmax = gmax
+        self.num_bands = int(math.ceil(180.0 / tile_size))
+        self._tiles = LRUCache(maxsize=cache_size)
+        self._fetch_lock = threading.Lock()
+        self._fetching = set()  # tiles being downloaded
+
+    #
+    # Tiling
+    #
+    def _band_limits(self, band):
+        dec_min = -90.0 + band * self.tile_size
+        return dec_min, min(dec_min + self.tile_size, 90.0)
+
+    def _num_cells(self, band):
+        dec_min, dec_max = self._band_limits(band)
+        # Width of the band at its widest declination
+        cos_dec = math.cos(math.radians(min(abs(dec_min), abs(dec_max))))
+        if dec_min < 0 < dec_max:
+            cos_dec = 1.0
+        return max(1, int(round(360.0 * cos_dec / self.tile_size)))
+
+    def tile_limits(self, tile):
+        """
+        Return the (ra_min, ra_max, dec_min, dec_max) of a tile in degrees.
+        """
+        band, cell = tile
+        dec_min, dec_max = self._band_limits(band)
+        cell_width = 360.0 / self._num_cells(band)
+        return cell * cell_width, (cell + 1) * cell_width, dec_min, dec_max
+
+    def tiles_for_cone(self, ra, dec, radius):
+        """
+        Return the tiles, as (band, cell) tuples, that overlap the cone of the given
+        radius around (ra, dec). All quantities are in degrees.
+        """
+        dec_lo = max(dec - radius, -90.0)
+        dec_hi = min(dec + radius, 90.0)
+        band_lo = min(int((dec_lo + 90.0) // self.tile_size), self.num_bands - 1)
+        band_hi = min(int((dec_hi + 90.0) // self.tile_size), self.num_bands - 1)
+        if abs(dec) + radius >= 90.0:
+            half_width = 180.0  # the cone contains a pole
+        else:
+            sin_half_width = math.sin(math.radians(radius)) / math.cos(
+                math.radians(dec)
+            )
+            half_width = math.degrees(math.asin(min(1.0, sin_half_width)))
+        tiles = []
+        for band in range(band_lo, band_hi + 1):
+            num_cells = self._num_cells(band)
+            if half_width >= 180.0:
+                tiles.extend((band, cell) for cell in range(num_cells))
+                continue
+            cell_width = 360.0 / num_cells
+            first = int(math.floor((ra - half_width) / cell_width))
+            last = int(math.floor((ra + half_width) / cell_width))
+            cells = {cell % num_cells for cell in range(first, last + 1)}
+            tiles.extend((band, cell) for cell in sorted(cells))
+        return tiles
+
+    #
+    # Tile storage
+    #
+    def _tile_path(self, tile):
+        return os.path.join(self.directory, f"{tile[0]}_{tile[1]}.npz")
+
+    def _fetch_tile_in_background(self, tile):
+        """
+        Start downloading a tile in a daemon thread, unless it is already being
+        downloaded.
+        """
+        with self._fetch_lock:
+            if tile in self._fetching:
+                return
+            self._fetching.add(tile)
+
+        def fetch():
+            try:
+                self._fetch_tile(tile)
+            except Exception as e:
+                log_traceback(e)
+                logger.error(f"Could not download Gaia tile {tile}")
+            finally:
+                with self._fetch_lock:
+                    self._fetching.discard(tile)
+
+        threading.Thread(target=fetch, name=f"gaia-tile-{tile}", daemon=True).start()
+
+    def _fetch_tile(self, tile):
+        """
+        Download the sources of a tile from the Gaia archive and save them.
+        """
+        from astroquery.gaia import Gaia
+
+        ra_min, ra_max, dec_min, dec_max = self.tile_limits(tile)
+        query = (
+            f"SELECT * FROM {GAIA_TABLE} "
+            + f"WHERE ra >= {ra_min} AND ra < {ra_max} "
+            + f"AND dec >= {dec_min} AND dec < {dec_max} "
+            + f"AND phot_g_mean_mag <= {self.gmax}"
+        )
+        logger.info(f"Downloading Gaia tile {tile}")
+        table = Gaia.launch_job_async(query).get_results()
+        self.save_tile(tile, table)
+
+    def save_tile(self, tile, table):
+        """
+        Save an astropy `Table` of Gaia sources as a tile (e.g., to build the index from
+        a Gaia archive export instead of downloading tiles on demand).
+        """
+        array = table.as_array()
+        mask = array.mask if np.ma.isMaskedArray(array) else np.zeros_like(array, bool)
+        units = {
+            name: None if table[name].unit is None else str(table[name].unit)
+            for name in table.colnames
+        }
+        path = self._tile_path(tile)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, data=np.ma.getdata(array), mask=mask, units=json.dumps(units))
+        os.replace(path + ".tmp", path)
+
+    def _load_tile(self, tile):
+        """
+        Return the (table, unit vectors, k-d tree) of a tile, or None if the tile is not
+        available (yet, if it is being downloaded, see `_fetch_tile_in_background()`).
+        """
+        cached = self._tiles.get(tile)
+        if cached is not None:
+            return cached
+        path = self._tile_path(tile)
+        if not os.path.exists(path):
+            if self.fetch:
+                self._fetch_tile_in_background(tile)
+            return None
+        from astropy.table import Table
+
+        with np.load(path, allow_pickle=False) as npz:
+            table = Table(np.ma.MaskedArray(npz["data"], mask=npz["mask"]))
+            units = json.loads(str(npz["units"]))
+        for name, unit in units.items():
+            table[name].unit = unit
+        vectors = _unit_vectors(np.asarray(table["ra"]), np.asarray(table["dec"]))
+        tree = cKDTree(vectors) if cKDTree is not None and len(table) > 0 else None
+        tile_data = (table, vectors, tree)
+        self._tiles.set(tile, tile_data)
+        return tile_data
+
+    #
+    # Queries
+    #
+    def cone_search(self, ra, dec, radius, gmax=None, row_limit=-1):
+        """
+        Find the Gaia sources within `radius` of (ra, dec), like the Gaia archive's cone
+        search. All quantities are in degrees.
+
+        Parameters
+        ----------
+          ra, dec, radius :: float
+            The centre and radius of the cone.
+
+          gmax :: float or None
+            Only return sources brighter than this G magnitude. Must not be fainter than
+            the `gmax` of the index.
+
+          row_limit :: int
+            The maximum number of sources (closest first), or -1 for no limit.
+
+        Returns
+        -------
+          sources :: astropy `Table` or None
+            The sources sorted by their distance ("dist" column, degrees) to the centre,
+            or None if some tiles are not available (or the index is not deep enough).
+        """
+        from astropy.table import vstack
+
+        if gmax is not None and gmax > self.gmax:
+            return None
+        center = _unit_vectors(ra, dec)[0]
+        chord = 2.0 * math.sin(math.radians(min(radius, 180.0)) / 2.0)
+        # (load every tile first, so that all missing tiles start downloading)
+        tiles = self.tiles_for_cone(ra, dec, radius)
+        tiles_data = [self._load_tile(tile) for tile in tiles]
+        if any(tile_data is None for tile_data in tiles_data):
+            return None
+        matches = []
+        for table, vectors, tree in tiles_data:
+            if tree is not None:
+                rows = np.asarray(tree.query_ball_point(center, chord), dtype=int)
+            else:
+                sq_chords = np.sum((vectors - center) ** 2, axis=1)
+                rows = np.flatnonzero(sq_chords <= chord**2)
+            rows_table = table[rows]
+            chords = np.linalg.norm(vectors[rows] - center, axis=1)
+            dists = 2.0 * np.arcsin(np.clip(chords / 2.0, 0.0, 1.0))
+            rows_table["dist"] = np.degrees(dists)
+            matches.append(rows_table)
+        sources = vstack(matches, metadata_conflicts="silent")
+        if gmax is not None:
+            g_mags = np.ma.filled(np.ma.asarray(sources["phot_g_mean_mag"]), np.inf)
+            sources = sources[g_mags < gmax]
+        sources.sort("dist")
+        if row_limit is not None and row_limit >= 0:
+            sources = sources[:row_limit]
+        return sources
+
+
+class _LocalJob:
+    """
+    Stand-in for the astroquery job returned by `Gaia.cone_search_async()`.
+    """
+
+    def __init__(self, results):
+        self._results = results
+
+    def get_results(self):
+        return self._results
+
+
+_original_functions = {}
+
+# The faintest G magnitude the caller of the current thread needs (see `search_depth()`)
+_search_depth = threading.local()
+
+
+@contextlib.contextmanager
+def search_depth(gmax):
+    """
+    Declare the faintest G magnitude needed by the Gaia cone searches made in this block,
+    e.g., the `srch_Gmax` of `Source.use_gaia_spectrum()`. castor_etc does not pass its
+    magnitude limit to the cone search, so without this the local index cannot know if it
+    is deep enough.
+    """
+    previous = getattr(_search_depth, "gmax", None)
+    _search_depth.gmax = gmax
+    try:
+        yield
+    finally:
+        _search_depth.gmax = previous
+
+
+def install(index):
+    """
+    Answer `astroquery.gaia.Gaia.cone_search(_async)` calls (which castor_etc uses to
+    find the Gaia sources of `use_gaia_spectrum()`) from the local index. Only searches
+    made in a `search_depth()` block that is not fainter than the index are answered.
+    Other queries (e.g., of unknown depth, other tables or columns, or cones with
+    missing tiles, which are downloaded in the background for later searches) go to the
+    Gaia archive as before.
+    """
+    from astroquery.gaia import Gaia
+
+    for name in ("cone_search", "cone_search_async"):
+        _original_functions.setdefault(name, getattr(Gaia, name))
+
+    def make_local(name):
+        original = _original_functions[name]
+
+        @functools.wraps(original)
+        def local(*args, **kwargs):
+            gmax = getattr(_search_depth, "gmax", None)
+            if gmax is None or gmax > index.gmax:
+                logger.debug(
+                    f"Gaia cone search to G={gmax} is deeper than the local index"
+                )
+                return original(*args, **kwargs)
+            coordinate = args[0] if args else kwargs.get("coordinate")
+            radius = args[1] if len(args) > 1 else kwargs.get("radius")
+            table_name = kwargs.get("table_name")
+            if (
+                coordinate is None
+                or radius is None
+                or len(args) > 2
+                or kwargs.get("columns")
+                or kwargs.get("width") is not None
+                or kwargs.get("height") is not None
+                or (table_name is not None and table_name != GAIA_TABLE)
+                or getattr(Gaia, "MAIN_GAIA_TABLE", GAIA_TABLE) != GAIA_TABLE
+            ):
+                return original(*args, **kwargs)
+            try:
+                import astropy.units as u
+
+                icrs = coordinate.icrs
+                results = index.cone_search(
+                    icrs.ra.deg,
+                    icrs.dec.deg,
+                    u.Quantity(radius, u.deg).value,
+                    row_limit=getattr(Gaia, "ROW_LIMIT", -1),
+                )
+            except Exception as e:
+                log_traceback(e)
+                results = None
+            if results is None:
+                logger.debug("Gaia cone search is not in the local index")
+                return original(*args, **kwargs)
+            logger.debug(f"Local Gaia index found {len(results)} sources")
+            return _LocalJob(results)
+
+        return local
+
+    Gaia.cone_search = make_local("cone_search")
+    Gaia.cone_search_async = make_local("cone_search_async")
+
+
+gaia_index = None
+if GAIA_INDEX_DIR:
+    try:
+        gaia_index = GaiaTileIndex(GAIA_INDEX_DIR)
+        install(gaia_index)
+    except Exception as e:
+        log_traceback(e)
+        logger.warning("Could not set up the local Gaia index.")
+        gaia_index = None
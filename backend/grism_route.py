@@ -66,16 +66,40 @@ ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
 
+import os
+
 import astropy.units as u
 from castor_etc.grism import Grism
 from flask import jsonify, request
 
-from utils import DataHolder, app, bad_request, server_error, logger, log_traceback
+from cache import LRUCache, make_key
+from extraction import extract_grism, grism_source_rows
+from jobs import submit_job, wants_async
+from sweeps import copy_grism, sweep_grism_snr
+from utils import (
+    bad_request,
+    server_error,
+    logger,
+    log_traceback,
+    get_data_holder,
+    encode_2d_array,
+    encode_binary_array,
+    wants_binary_arrays,
+)
 
-import pandas as pd
 import numpy as np
 
-@app.route("/grism", methods=["PUT"])
+# Dispersed `Grism` objects (see `disperse_grism()`). N.B. the job queue workers have
+# their own cache.
+_grism_cache = LRUCache(maxsize=int(os.getenv("ETC_GRISM_CACHE_SIZE", "8")))
+
+# The dtype of the 2D grism SNR. float32 halves its memory and is what the binary array
+# encoding sends anyway (see `encode_binary_array()`). Set to float64 to keep full
+# precision in the JSON encoding.
+GRISM_SNR_DTYPE = np.dtype(os.getenv("ETC_GRISM_SNR_DTYPE", "float32"))
+
+
+
 def put_grism_json():
     """
     Create a 'Grism' object from the JSON request
@@ -84,6 +108,7 @@ def put_grism_json():
 
     TODO: docstring
     """
+    data_holder = get_data_holder()
     try:
         #
         # Check inputs
@@ -94,6 +119,8 @@ def put_grism_json():
         logger.debug("grism_channel: " + str(grism_channel))
         exposure_time = request_data["exposureTime"]
         logger.debug("exposure_time " + str(exposure_time))
+        exposure_time = float(exposure_time)
+        nreads, nbin = parse_noise_params(request_data)
 
     except Exception as e:
         log_traceback(e)
@@ -106,10 +133,52 @@ def put_grism_json():
             "Inputs to initialize the `Grism` object "
             + "do not match required inputs."
         )
+
+    grism_key = make_grism_key(
+        data_holder.telescope_key,
+        data_holder.source_content_key,
+        data_holder.background_key,
+        grism_channel,
+    )
+
+    if wants_async():
+        # Run the simulation in the job queue and let the client poll for the result
+        if (
+            data_holder.TelescopeObj is None
+            or data_holder.SourceObj is None
+            or data_holder.BackgroundObj is None
+        ):
+            logger.error(
+                "Server could not initialize the `Grism` object from server-side "
+                + "stored data. Probably missing `Telescope`, `Source`, "
+                + "and/or `Background` object"
+            )
+            return server_error(
+                "Server could not initialize the `Grism` object from server-side "
+                + "stored data. Probably missing `Telescope`, `Source`, "
+                + "and/or `Background` object"
+            )
+        return submit_job(
+            "grism",
+            compute_grism,
+            data_holder.TelescopeObj,
+            data_holder.SourceObj,
+            data_holder.BackgroundObj,
+            grism_channel,
+            exposure_time,
+            wants_binary_arrays(),
+            grism_key,
+            nreads,
+            nbin,
+        )
     
     try:
-        GrismObj = Grism(
-            DataHolder.TelescopeObj, DataHolder.SourceObj,DataHolder.BackgroundObj
+        GrismObj = disperse_grism(
+            data_holder.TelescopeObj,
+            data_holder.SourceObj,
+            data_holder.BackgroundObj,
+            grism_channel,
+            grism_key=grism_key,
         )
     
     except Exception as e:
@@ -125,16 +194,211 @@ def put_grism_json():
             + "stored data. Probably missing `Telescope`, `Source`, "
             + "and/or `Background` object"
         )
-    
-    #
-    # Do Grism spectroscopy
-    #
+
+    results = simulate_grism(
+        GrismObj,
+        exposure_time,
+        binary_arrays=wants_binary_arrays(),
+        nreads=nreads,
+        nbin=nbin,
+    )
+
+    data_holder.GrismObj = GrismObj
+
+    return jsonify(**results)
+
+
+def put_grism_sweep_json():
+    """
+    Calculate the 1D grism SNR for many exposure times in one request. The source is
+    only dispersed once and the exposure time dependence is evaluated analytically (see
+    `sweep_grism_snr()`).
+
+    The JSON request has the same "grismChannel" as the `grism` request, plus:
+
+      exposureTimes :: list of floats
+        The exposure times in seconds.
+
+      nreads, nbin :: int (optional)
+        The number of detector reads and the pixel binning of the noise model (default:
+        1 and 1).
+
+    Returns
+    -------
+      sweep_json :: Flask JSON response
+        The "exposureTimes", the "snr1d" table with one row per exposure time (encoded
+        like the 2D arrays of the `grism` request, see `encode_2d_array()`), the
+        "grism1dx" pixels, and the noise components of the 1D spectrum (see
+        `sweep_grism_snr()`).
+    """
+    data_holder = get_data_holder()
+    try:
+        #
+        # Check inputs
+        #
+        try:
+            request_data = request.get_json()
+            logger.info("Grism sweep request_data: " + str(request_data))
+            grism_channel = request_data["grismChannel"]
+            exposure_times = np.asarray(
+                request_data["exposureTimes"], dtype=float
+            ).ravel()
+            nreads, nbin = parse_noise_params(request_data)
+        except Exception as e:
+            log_traceback(e)
+            logger.error("Inputs of the grism sweep do not match required inputs.")
+            return bad_request(
+                "Inputs of the grism sweep do not match required inputs."
+            )
+        if exposure_times.size == 0 or not np.all(
+            np.isfinite(exposure_times) & (exposure_times > 0)
+        ):
+            logger.error("The grism sweep exposure times must be positive numbers.")
+            return bad_request(
+                "The grism sweep exposure times must be positive numbers."
+            )
+        #
+        # Disperse the source (or use the cached dispersed `Grism` object)
+        #
+        shared = (
+            data_holder.TelescopeObj,
+            data_holder.SourceObj,
+            data_holder.BackgroundObj,
+        )
+        try:
+            GrismObj = disperse_grism(
+                *shared,
+                grism_channel,
+                grism_key=make_grism_key(
+                    data_holder.telescope_key,
+                    data_holder.source_content_key,
+                    data_holder.background_key,
+                    grism_channel,
+                ),
+            )
+        except Exception as e:
+            log_traceback(e)
+            logger.error(
+                "Server could not initialize the `Grism` object from server-side "
+                + "stored data. Probably missing `Telescope`, `Source`, "
+                + "and/or `Background` object"
+            )
+            return server_error(
+                "Server could not initialize the `Grism` object from server-side "
+                + "stored data. Probably missing `Telescope`, `Source`, "
+                + "and/or `Background` object"
+            )
+        sweep = sweep_grism_snr(
+            GrismObj, exposure_times, nreads=nreads, nbin=nbin, shared=shared
+        )
+        if wants_binary_arrays():
+            snr_1d = encode_binary_array(sweep.pop("snr1d"))
+        else:
+            snr_1d = sweep.pop("snr1d")  # NaNs/infs become null
+        return jsonify(
+            exposureTimes=exposure_times,
+            snr1d=snr_1d,
+            nreads=nreads,
+            nbin=nbin,
+            **sweep,
+        )
+    except Exception as e:
+        log_traceback(e)
+        logger.error("There was a problem calculating the grism sweep.")
+        return server_error("There was a problem calculating the grism sweep.")
+
+
+def parse_noise_params(request_data):
+    """
+    Return the optional number of detector reads ("nreads") and pixel binning ("nbin")
+    of a grism request. Raises a `ValueError` if they are not positive integers.
+    """
+    nreads = int(request_data.get("nreads", 1))
+    nbin = int(request_data.get("nbin", 1))
+    logger.debug(f"nreads: {nreads}, nbin: {nbin}")
+    if nreads < 1 or nbin < 1:
+        raise ValueError("nreads and nbin must be positive integers")
+    return nreads, nbin
+
+
+def make_grism_key(telescope_key, source_key, background_key, grism_channel):
+    """
+    Return the key of the dispersed `Grism` object in the grism cache, or None if any of
+    the inputs has no key (i.e., it cannot be cached).
+
+    Parameters
+    ----------
+      telescope_key, source_key, background_key :: str or None
+        The `DataHolder` keys of the telescope, source (`source_content_key`), and
+        background.
+
+      grism_channel :: str
+        The grism channel (e.g., "u" or "uv").
+    """
+    if telescope_key is None or source_key is None or background_key is None:
+        return None
+    return make_key("grism", telescope_key, source_key, background_key, grism_channel)
+
+
+def disperse_grism(
+    TelescopeObj, SourceObj, BackgroundObj, grism_channel, grism_key=None
+):
+    """
+    Create a `Grism` object and disperse the source through the given grism channel.
+    The dispersion only depends on the telescope, source, background, and channel (not on
+    the exposure time), so if `grism_key` (see `make_grism_key()`) is given, a copy of
+    the dispersed object is cached and later requests with the same key only need to
+    rerun the exposure and noise stages (see `simulate_grism()`).
+
+    Returns
+    -------
+      GrismObj :: `Grism` object
+        The dispersed grism observation (which may be modified by the caller).
+    """
+    shared = (TelescopeObj, SourceObj, BackgroundObj)
+    cached = None if grism_key is None else _grism_cache.get(grism_key)
+    if cached is not None:
+        logger.debug("Using cached dispersed `Grism` object " + grism_key)
+        return copy_grism(cached[0], cached[1])
 
     #
     # 1. Specify the grism channel
     # 
+    GrismObj = Grism(TelescopeObj, SourceObj, BackgroundObj)
     GrismObj.disperse(grism_channel=grism_channel,check=False) 
 
+    if grism_key is not None:
+        _grism_cache.set(grism_key, (copy_grism(GrismObj, shared), shared))
+    return GrismObj
+
+
+def simulate_grism(GrismObj, exposure_time, binary_arrays=False, nreads=1, nbin=1):
+    """
+    Compute the 1D and 2D SNR per resolution element of a dispersed grism observation.
+
+    Parameters
+    ----------
+      GrismObj :: `Grism` object
+        The dispersed grism observation (see `disperse_grism()`).
+
+      exposure_time :: float
+        The exposure time in seconds.
+
+      binary_arrays :: bool
+        If True, encode the 2D SNR with the binary encoding (see `encode_2d_array()`).
+
+      nreads, nbin :: int
+        The number of detector reads and the pixel binning of the noise model.
+
+    Returns
+    -------
+      results :: dict
+        The attributes to show on the frontend.
+    """
+    #
+    # Do Grism spectroscopy
+    #
+
     #
     # 2. Specify the exposure time
     #
@@ -143,38 +407,47 @@ def put_grism_json():
     #
     # 3. Specify the noise parameters
     #
-    Nread = 1
-    Nbin = 1
-    GrismObj.total_noise(Nreads=Nread, Nbin=Nbin)
+    GrismObj.total_noise(Nreads=nreads, Nbin=nbin)
 
     #
     # 4. 1D and 2D SNR per resolution
     #
 
-    box_center = int((GrismObj.integrated_grism_box_count.shape[0]-1) / 2)
-    half_source_size = int((GrismObj.source_image.shape[0]-1) / 2)
-
-    grism_1d = np.sum(GrismObj.integrated_grism_box_count[box_center-half_source_size:box_center+half_source_size+1,:],
-                  axis=0)
-    grism_1d_x = np.arange(0,len(grism_1d), 1)
-
-    sum_signal_1d = np.sum(GrismObj.integrated_grism_box_count[box_center-half_source_size:box_center+half_source_size+1,:], 
-                            axis=0)
-    quad_error_1d = np.sqrt(np.sum(GrismObj.grism_noise_total[box_center-half_source_size:box_center+half_source_size+1,:]**2, 
-                                    axis=0))
-    snr_1d = sum_signal_1d / quad_error_1d    
+    _, _, snr_1d, grism_2d = extract_grism(
+        GrismObj.integrated_grism_box_count,
+        GrismObj.grism_noise_total,
+        grism_source_rows(GrismObj),
+        dtype=GRISM_SNR_DTYPE,
+    )
+    grism_1d_x = np.arange(0,len(snr_1d), 1)
 
-    grism_2d = GrismObj.integrated_grism_box_count/GrismObj.grism_noise_total
+    grism_2d = encode_2d_array(grism_2d, binary=binary_arrays)
 
-    grism_2d = pd.DataFrame(grism_2d).to_json(
-        orient="values"
+    return dict(
+        grism2d = grism_2d,
+        snr1d = snr_1d,
+        grism1dx = grism_1d_x
     )
 
-    DataHolder.GrismObj = GrismObj
 
-    return ( jsonify(
-        grism2d = grism_2d,
-        snr1d = snr_1d.tolist(),
-        grism1dx = grism_1d_x.tolist()
-    ))
-    
+def compute_grism(
+    TelescopeObj,
+    SourceObj,
+    BackgroundObj,
+    grism_channel,
+    exposure_time,
+    binary_arrays,
+    grism_key=None,
+    nreads=1,
+    nbin=1,
+):
+    """
+    Job queue entry point (see `jobs.py`): disperse the `Grism` object and return the
+    results of `simulate_grism()`.
+    """
+    GrismObj = disperse_grism(
+        TelescopeObj, SourceObj, BackgroundObj, grism_channel, grism_key=grism_key
+    )
+    return simulate_grism(
+        GrismObj, exposure_time, binary_arrays, nreads=nreads, nbin=nbin
+    )
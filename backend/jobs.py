@@ -0,0 +1,275 @@
+"""
+jobs.py
+
+Asynchronous job queue for long-running computations (e.g., transit simulations).
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import CancelledError, ProcessPoolExecutor, as_completed
+
+from flask import jsonify, request
+
+from cache import LRUCache
+from utils import get_session_id, logger
+
+# Whether clients may run requests as asynchronous jobs. The job table is not shared
+# between gunicorn workers, so `docker/startup.sh` refuses more than 1 worker if enabled.
+ASYNC_JOBS = os.getenv("ETC_ASYNC_JOBS", "true").lower() == "true"
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class Job:
+    """
+    Book-keeping for one submitted computation.
+    """
+
+    def __init__(self, job_id, owner, kind, future):
+        self.job_id = job_id
+        self.owner = owner
+        self.kind = kind
+        self.future = future
+        self.submitted = time.time()
+        self.finished = None
+        self.is_cancelled = False
+
+    @property
+    def state(self):
+        if self.is_cancelled or self.future.cancelled():
+            return CANCELLED
+        if self.future.done():
+            return FAILED if self.future.exception() is not None else DONE
+        return RUNNING if self.future.running() else QUEUED
+
+    def to_dict(self):
+        state = self.state
+        status = {
+            "jobId": self.job_id,
+            "kind": self.kind,
+            "state": state,
+            "submitted": self.submitted,
+            "finished": self.finished,
+        }
+        if state == FAILED:
+            status["error"] = str(self.future.exception())
+        return status
+
+
+class JobManager:
+    """
+    Run computations in a pool of worker processes and keep their results for later
+    retrieval by job ID.
+
+    Jobs are owned by the session that submitted them and are forgotten `result_ttl`
+    seconds after they were last accessed. N.B. the job table lives in the memory of the
+    gunicorn worker that accepted the job, so clients must poll the same worker. This is
+    why `docker/startup.sh` runs 1 worker with several threads when asynchronous jobs are
+    enabled (see `ASYNC_JOBS`).
+
+    Parameters
+    ----------
+      max_workers :: int
+        The number of worker processes.
+
+      result_ttl :: float
+        The number of seconds a job (and its result) is kept after it was last accessed.
+
+      max_jobs :: int
+        The maximum number of jobs to keep track of.
+
+      start_method :: str
+        The `multiprocessing` start method for the worker processes. "forkserver" is
+        the default because forking a multi-threaded gunicorn worker is not safe.
+    """
+
+    def __init__(
+        self, max_workers=2, result_ttl=3600, max_jobs=256, start_method="forkserver"
+    ):
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self._jobs = LRUCache(maxsize=max_jobs, ttl=result_ttl)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Create the pool lazily so it is never inherited by forked gunicorn workers
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self._executor
+
+    def submit(self, owner, kind, func, *args, **kwargs):
+        """
+        Schedule `func(*args, **kwargs)` in the process pool. `func` and its arguments
+        must be picklable (i.e., `func` must be a module-level function).
+
+        Returns
+        -------
+          job_id :: str
+            The ID used to query the job.
+        """
+        job_id = secrets.token_urlsafe(12)
+        future = self._get_executor().submit(func, *args, **kwargs)
+        job = Job(job_id, owner, kind, future)
+        future.add_done_callback(lambda _: setattr(job, "finished", time.time()))
+        self._jobs.set(job_id, job)
+        return job_id
+
+    def map_unordered(self, func, args_list):
+        """
+        Run `func(*args)` in the process pool for each tuple of arguments in `args_list`
+        and yield the results in the order in which they complete. Calls that have not
+        started are cancelled if the generator is closed early (e.g., the client
+        disconnected). These calls are not tracked as jobs.
+        """
+        executor = self._get_executor()
+        futures = [executor.submit(func, *args) for args in args_list]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def get(self, job_id, owner):
+        """
+        Return the `Job` with the given ID if it belongs to `owner`, else None.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def result(self, job, timeout=0):
+        """
+        Return the result of a finished job. Raises the job's exception if it failed,
+        `concurrent.futures.CancelledError` if it was cancelled, or
+        `concurrent.futures.TimeoutError` if it is still queued or running.
+        """
+        if job.is_cancelled:
+            raise CancelledError()
+        return job.future.result(timeout=timeout)
+
+    def cancel(self, job):
+        """
+        Cancel a job. Queued jobs never start. Jobs that are already running cannot be
+        interrupted, but their results are discarded. Finished jobs are forgotten.
+        """
+        if job.future.done():
+            self._jobs.pop(job.job_id)
+            return
+        job.future.cancel()  # only succeeds if the job has not started yet
+        job.is_cancelled = True
+
+
+def wants_async():
+    """
+    Check whether the client asked for the request to run as an asynchronous job, via the
+    `async=true` query parameter or an `"async": true` item in the JSON body. Always False
+    if asynchronous jobs are disabled (`ETC_ASYNC_JOBS=false`), in which case the request
+    runs synchronously.
+    """
+    if not ASYNC_JOBS:
+        return False
+    if request.args.get("async", "").lower() == "true":
+        return True
+    request_data = request.get_json(silent=True)
+    return isinstance(request_data, dict) and request_data.get("async") is True
+
+
+job_manager = JobManager(
+    max_workers=int(os.getenv("ETC_JOB_WORKERS", str(min(4, os.cpu_count() or 1)))),
+    result_ttl=float(os.getenv("ETC_JOB_RESULT_TTL", "3600")),
+    start_method=os.getenv("ETC_JOB_START_METHOD", "forkserver"),
+)
+
+
+def submit_job(kind, func, *args, **kwargs):
+    """
+    Submit `func(*args, **kwargs)` to the job queue on behalf of the current session.
+
+    Returns
+    -------
+      response :: Flask JSON response
+        The job status (incl. the "jobId" to poll via `jobs/<jobId>` and
+        `jobs/<jobId>/result`) with status code 202.
+    """
+    job_id = job_manager.submit(get_session_id(), kind, func, *args, **kwargs)
+    logger.info(f"Submitted {kind} job {job_id}")
+    response = jsonify(**job_manager.get(job_id, get_session_id()).to_dict())
+    response.status_code = 202
+    return response
@@ -0,0 +1,140 @@
+"""
+jobs_route.py
+
+Flask API for querying, fetching, and cancelling asynchronous jobs (see `jobs.py`).
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+from concurrent.futures import CancelledError
+
+from flask import jsonify, request
+
+from jobs import CANCELLED, DONE, FAILED, job_manager
+from utils import get_session_id, log_traceback, logger, not_found, server_error
+
+
+def get_job_json(job_id):
+    """
+    Return the status of a job as a JSON response (GET), or cancel the job (DELETE).
+
+    N.B. DELETE cannot stop a job that is already running: the worker process finishes
+    the computation and only its result is discarded (the job reports "cancelled").
+    DELETE on a queued job prevents it from starting, and DELETE on a finished job
+    forgets the job and its result.
+
+    Parameters
+    ----------
+      job_id :: str
+        The ID returned when the job was submitted.
+
+    Returns
+    -------
+      job_json :: Flask JSON response
+        The job status, i.e., "jobId", "kind", "state" (one of "queued", "running",
+        "done", "failed", or "cancelled"), "submitted", "finished" (UNIX timestamps), and
+        "error" (if the job failed).
+    """
+    job = job_manager.get(job_id, get_session_id())
+    if job is None:
+        logger.error(f"Job {job_id} does not exist (or belongs to another session)")
+        return not_found(f"Job {job_id} does not exist.")
+    if request.method == "DELETE":
+        logger.info(f"Cancelling job {job_id}")
+        job_manager.cancel(job)
+    return jsonify(**job.to_dict())
+
+
+def get_job_result_json(job_id):
+    """
+    Return the result of a finished job as a JSON response. If the job is still queued or
+    running, return its status (see `get_job_json()`) with status code 202 instead.
+
+    Parameters
+    ----------
+      job_id :: str
+        The ID returned when the job was submitted.
+
+    Returns
+    -------
+      result_json :: Flask JSON response
+        The same JSON response as the synchronous version of the request.
+    """
+    job = job_manager.get(job_id, get_session_id())
+    if job is None:
+        logger.error(f"Job {job_id} does not exist (or belongs to another session)")
+        return not_found(f"Job {job_id} does not exist.")
+    state = job.state
+    if state == CANCELLED:
+        return not_found(f"Job {job_id} was cancelled.")
+    if state == FAILED:
+        log_traceback(job.future.exception())
+        return server_error(f"Job {job_id} failed: {job.future.exception()}")
+    if state != DONE:
+        response = jsonify(**job.to_dict())
+        response.status_code = 202
+        return response
+    try:
+        return jsonify(**job_manager.result(job))
+    except CancelledError:
+        return not_found(f"Job {job_id} was cancelled.")
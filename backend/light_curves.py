@@ -0,0 +1,255 @@
+"""
+light_curves.py
+
+On-disk store and binning of simulated transit light curves, streamed by
+`transit_route.py`.
+
+---
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utils import logger
+
+# Light curves are written to disk so that every gunicorn worker can stream a light
+# curve simulated by another process (e.g., the job queue's worker processes)
+LIGHT_CURVE_DIR = os.getenv(
+    "ETC_LIGHT_CURVE_DIR", os.path.join(os.getcwd(), "flask_light_curves")
+)
+LIGHT_CURVE_TTL = float(os.getenv("ETC_LIGHT_CURVE_TTL", "14400"))  # seconds
+
+_META_FILENAME = "meta.json"
+_POINTS_FILENAME = "points.npy"
+_MODEL_FILENAME = "model.npy"
+_LIGHT_CURVE_ID_RE = re.compile(r"^[0-9a-f]{24}$")
+
+
+def bin_light_curve(t, fl, err, nbin):
+    """
+    Average every `nbin` consecutive light curve points (the last bin may have fewer
+    points). The uncertainties are propagated as the error of the mean.
+
+    Parameters
+    ----------
+      t, fl, err :: 1D arrays of floats
+        The times, fluxes, and flux uncertainties.
+
+      nbin :: int
+        The number of points per bin.
+
+    Returns
+    -------
+      t_binned, fl_binned, err_binned :: 1D arrays of floats
+        The binned light curve.
+    """
+    if nbin <= 1 or t.size == 0:
+        return t, fl, err
+    starts = np.arange(0, t.size, nbin)
+    counts = np.diff(np.append(starts, t.size))
+    t_binned = np.add.reduceat(t, starts) / counts
+    fl_binned = np.add.reduceat(fl, starts) / counts
+    err_binned = np.sqrt(np.add.reduceat(err**2, starts)) / counts
+    return t_binned, fl_binned, err_binned
+
+
+def bin_light_curve_arrays(light_curve, nbin):
+    """
+    Return a copy of the output of `transit_route.light_curve_arrays()` with the
+    simulated points binned by `nbin` (see `bin_light_curve()`).
+    """
+    light_curve = dict(light_curve)
+    (
+        light_curve["x_sim_castor"],
+        light_curve["y_sim_castor"],
+        light_curve["y_error"],
+    ) = bin_light_curve(
+        light_curve["x_sim_castor"],
+        light_curve["y_sim_castor"],
+        light_curve["y_error"],
+        nbin,
+    )
+    return light_curve
+
+
+def save_light_curve(light_curve, directory=LIGHT_CURVE_DIR):
+    """
+    Save an (unbinned) light curve from `transit_route.light_curve_arrays()`.
+
+    The simulated points are saved as a (number of points, 3) array of the
+    "x_sim_castor", "y_sim_castor", and "y_error" columns, so that they can be read in
+    chunks with a memory map.
+
+    Returns
+    -------
+      meta :: dict
+        The "id" of the light curve, its number of points ("numPoints"), and the "xlim"
+        of the plot.
+    """
+    points = np.column_stack(
+        [
+            np.asarray(light_curve["x_sim_castor"], dtype=float),
+            np.asarray(light_curve["y_sim_castor"], dtype=float),
+            np.asarray(light_curve["y_error"], dtype=float),
+        ]
+    )
+    model = np.vstack(
+        [
+            np.asarray(light_curve["x_transit_model"], dtype=float),
+            np.asarray(light_curve["y_transit_model"], dtype=float),
+        ]
+    )
+    digest = hashlib.sha256(points.tobytes())
+    digest.update(model.tobytes())
+    light_curve_id = digest.hexdigest()[:24]
+    light_curve_dir = os.path.join(directory, light_curve_id)
+    meta_path = os.path.join(light_curve_dir, _META_FILENAME)
+    if os.path.exists(meta_path):
+        os.utime(meta_path)  # keep the light curve while it is in use
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    purge_expired(directory)
+    #
+    # Save the arrays (metadata last, since it marks the light curve as complete)
+    #
+    # (a unique directory per save, since threads of one process may save concurrently)
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix=light_curve_id + ".tmp")
+    np.save(os.path.join(tmp_dir, _POINTS_FILENAME), points)
+    np.save(os.path.join(tmp_dir, _MODEL_FILENAME), model)
+    meta = {
+        "id": light_curve_id,
+        "numPoints": len(points),
+        "xlim": [float(x) for x in light_curve["xlim"]],
+    }
+    with open(os.path.join(tmp_dir, _META_FILENAME), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp_dir, light_curve_dir)
+    except OSError:
+        # Another process saved the same light curve in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.debug(f"Saved light curve {light_curve_id} with {len(points)} points")
+    return meta
+
+
+def load_light_curve(light_curve_id, directory=LIGHT_CURVE_DIR):
+    """
+    Open a saved light curve (see `save_light_curve()`).
+
+    Returns
+    -------
+      meta :: dict or None
+        The metadata of the light curve, or None if it does not exist (in which case
+        the other outputs are None too).
+
+      points :: 2D array of floats
+        Memory map of the (number of points, 3) simulated points.
+
+      model :: 2D array of floats
+        The (2, number of model points) "x_transit_model" and "y_transit_model".
+    """
+    if not _LIGHT_CURVE_ID_RE.match(light_curve_id):
+        return None, None, None
+    light_curve_dir = os.path.join(directory, light_curve_id)
+    meta_path = os.path.join(light_curve_dir, _META_FILENAME)
+    try:
+        os.utime(meta_path)  # keep the light curve while it is being streamed
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        points = np.load(os.path.join(light_curve_dir, _POINTS_FILENAME), mmap_mode="r")
+        model = np.load(os.path.join(light_curve_dir, _MODEL_FILENAME))
+    except (OSError, ValueError):
+        return None, None, None
+    return meta, points, model
+
+
+def purge_expired(directory=LIGHT_CURVE_DIR):
+    """
+    Delete the light curves that have not been saved or loaded within `LIGHT_CURVE_TTL`
+    seconds.
+    """
+    if not os.path.isdir(directory):
+        return
+    now = time.time()
+    for name in os.listdir(directory):
+        light_curve_dir = os.path.join(directory, name)
+        meta_path = os.path.join(light_curve_dir, _META_FILENAME)
+        try:
+            # (incomplete light curves have no metadata file)
+            mtime = os.path.getmtime(
+                meta_path if os.path.exists(meta_path) else light_curve_dir
+            )
+            if now - mtime > LIGHT_CURVE_TTL:
+                shutil.rmtree(light_curve_dir, ignore_errors=True)
+        except OSError:
+            pass
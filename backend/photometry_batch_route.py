@@ -0,0 +1,314 @@
+"""
+photometry_batch_route.py
+
+Batch photometry: many sources/apertures/exposure targets in one request.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import os
+
+from castor_etc.photometry import Photometry
+from flask import Response, request
+
+from jobs import job_manager
+from photometry_route import calc_phot_results, parse_aper_params, use_aperture
+from source_route import (
+    build_source,
+    parse_source_params,
+    source_content_key,
+    source_geometry_key,
+)
+from utils import (
+    bad_request,
+    dumps_bytes,
+    get_data_holder,
+    log_traceback,
+    logger,
+    server_error,
+)
+
+# The maximum number of records in one request
+BATCH_MAX_RECORDS = int(os.getenv("ETC_BATCH_MAX_RECORDS", "10000"))
+# The number of records computed by one task of the process pool. Every task receives
+# its own copy of the `Telescope` and `Background` objects, so larger chunks mean less
+# pickling but coarser load balancing and streaming.
+BATCH_CHUNK_SIZE = int(os.getenv("ETC_BATCH_CHUNK_SIZE", "16"))
+
+
+def put_photometry_batch_json():
+    """
+    Do photometry for many sources, apertures, and exposure targets with the stored
+    `Telescope` and `Background` objects.
+
+    The JSON request has a list of "records" and optional "defaults" that are merged
+    into each record (the record's items take precedence). Each record has:
+
+      source :: dict
+        The source, with the same items as the `source` request, parsed the same way
+        (see `source_route.parse_source_params()`): sourceType, physicalParameters and
+        normParams (dicts of dicts keyed by source type and normalization method),
+        redshift, predefinedSpectrum, predefinedSpectrumParameters, spectralLines,
+        normMethod, and isNormAfterSpectralLines. The items may also be given as JSON
+        strings. Custom spectra are not supported.
+
+      aperShape :: str
+        The aperture shape ("optimal", "elliptical", or "rectangular").
+
+      aperParams :: dict
+        The aperture parameters of the shape (or a dict of dicts keyed by shape, as in
+        the `photometry` request).
+
+      photInput :: dict
+        The "val_type" ("snr" or "t") and "val" of the exposure target.
+
+      reddening :: float
+        The E(B-V) reddening.
+
+    The records are computed in the process pool of `jobs.py`.
+
+    Returns
+    -------
+      response :: Flask streamed response
+        Newline-delimited JSON (application/x-ndjson) with one line per record, in the
+        order in which they complete. Each line has the record's "index" and either its
+        "photResults", "effNpix", and "redleakFracs", or an "error" message.
+    """
+    data_holder = get_data_holder()
+    try:
+        #
+        # Check inputs
+        #
+        try:
+            request_data = request.get_json()
+            records = request_data["records"]
+            defaults = request_data.get("defaults", {})
+            if not isinstance(records, list) or not isinstance(defaults, dict):
+                raise TypeError("records must be a list and defaults must be a dict")
+            logger.info(f"Photometry batch request with {len(records)} records")
+        except Exception as e:
+            log_traceback(e)
+            logger.error(
+                "Inputs of the batch photometry request do not match required inputs."
+            )
+            return bad_request(
+                "Inputs of the batch photometry request do not match required inputs."
+            )
+        if len(records) > BATCH_MAX_RECORDS:
+            logger.error(
+                f"Batch photometry request has {len(records)} records "
+                + f"(maximum is {BATCH_MAX_RECORDS})."
+            )
+            return bad_request(
+                f"Batch photometry request has {len(records)} records "
+                + f"(maximum is {BATCH_MAX_RECORDS})."
+            )
+        if data_holder.TelescopeObj is None or data_holder.BackgroundObj is None:
+            logger.error(
+                "Server could not do batch photometry from server-side stored data. "
+                + "Probably missing `Telescope` and/or `Background` object"
+            )
+            return server_error(
+                "Server could not do batch photometry from server-side stored data. "
+                + "Probably missing `Telescope` and/or `Background` object"
+            )
+        #
+        # Split the records into chunks for the process pool
+        #
+        indexed_records = [
+            (index, {**defaults, **record}) for index, record in enumerate(records)
+        ]
+        chunks = [
+            (
+                data_holder.TelescopeObj,
+                data_holder.BackgroundObj,
+                indexed_records[i : i + BATCH_CHUNK_SIZE],
+                data_holder.telescope_key,
+            )
+            for i in range(0, len(indexed_records), BATCH_CHUNK_SIZE)
+        ]
+
+        def generate():
+            try:
+                for chunk_results in job_manager.map_unordered(
+                    compute_photometry_records, chunks
+                ):
+                    for result in chunk_results:
+                        yield dumps_bytes(result) + b"\n"
+            except Exception as e:
+                # Headers were already sent, so report the error in the stream
+                log_traceback(e)
+                logger.error("There was a problem computing the batch photometry.")
+                yield dumps_bytes(
+                    {"error": "There was a problem computing the batch photometry."}
+                ) + b"\n"
+
+        response = Response(generate(), mimetype="application/x-ndjson")
+        response.headers["X-Accel-Buffering"] = "no"  # do not buffer in nginx
+        return response
+    except Exception as e:
+        log_traceback(e)
+        logger.error("There was a problem starting the batch photometry.")
+        return server_error("There was a problem starting the batch photometry.")
+
+
+def compute_photometry_record(
+    TelescopeObj, BackgroundObj, record, telescope_key=None
+):
+    """
+    Do photometry for one record of the batch request (see
+    `put_photometry_batch_json()`).
+
+    Returns
+    -------
+      result :: dict
+        The "photResults", "effNpix", and "redleakFracs" of the record.
+    """
+    source = record["source"]
+    (
+        source_type,
+        redshift,
+        predefined_spectrum,
+        predefined_spectrum_parameters,
+        physical_parameters,
+        spectral_lines,
+        norm_method,
+        norm_params,
+        is_norm_after_spectral_lines,
+    ) = parse_source_params(
+        {
+            "redshift": 0.0,
+            "predefinedSpectrumParameters": {},
+            "physicalParameters": {source["sourceType"]: {}},
+            "spectralLines": [],
+            "normMethod": "",
+            "isNormAfterSpectralLines": False,
+            **source,
+        }
+    )
+    SourceObj, _ = build_source(
+        source_type,
+        physical_parameters,
+        redshift,
+        predefined_spectrum,
+        predefined_spectrum_parameters,
+        spectral_lines,
+        norm_method,
+        norm_params,
+        is_norm_after_spectral_lines,
+        TelescopeObj,
+        telescope_key=telescope_key,
+    )
+    aper_shape = record["aperShape"].lower()
+    aper_params_input = record["aperParams"]
+    if not isinstance(aper_params_input.get(aper_shape), dict):
+        aper_params_input = {aper_shape: aper_params_input}
+    aper_params = parse_aper_params(aper_shape, aper_params_input)
+    PhotometryObj = Photometry(TelescopeObj, SourceObj, BackgroundObj)
+    use_aperture(
+        PhotometryObj,
+        SourceObj,
+        aper_shape,
+        aper_params,
+        source_key=source_content_key(
+            SourceObj, source_geometry_key(source_type, physical_parameters)
+        ),
+    )
+    phot_results = calc_phot_results(
+        PhotometryObj, record["photInput"], float(record.get("reddening", 0.0))
+    )
+    return dict(
+        photResults=phot_results,
+        effNpix=PhotometryObj._eff_npix,
+        redleakFracs=SourceObj.calc_redleak_frac(TelescopeObj),
+    )
+
+
+def compute_photometry_records(
+    TelescopeObj, BackgroundObj, indexed_records, telescope_key=None
+):
+    """
+    Process pool entry point: do photometry for a chunk of (index, record) tuples. A
+    record that fails does not stop the others; its result has an "error" message
+    instead. Each worker process caches the sources it builds (see
+    `source_route.build_source()`), which `telescope_key` makes possible for sources that
+    depend on the telescope.
+
+    Returns
+    -------
+      results :: list of dicts
+        The result of each record (see `compute_photometry_record()`) with its "index".
+    """
+    results = []
+    for index, record in indexed_records:
+        try:
+            result = compute_photometry_record(
+                TelescopeObj, BackgroundObj, record, telescope_key
+            )
+        except ValueError as e:
+            result = {"error": str(e)}
+        except Exception as e:
+            log_traceback(e)
+            result = {"error": f"Record does not match required inputs ({e!r})."}
+        results.append({"index": index, **result})
+    return results
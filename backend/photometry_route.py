@@ -66,18 +66,30 @@ ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
 
+import copy
+import os
 import re
 
 import astropy.units as u
 import numpy as np
-import pandas as pd
 from castor_etc.photometry import Photometry
 from castor_etc.sources import PointSource
 from flask import jsonify, request
-from utils import DataHolder, app, bad_request, log_traceback, logger, server_error
+
+from cache import LRUCache, make_key
+from sweeps import sweep_snr_or_t
+from utils import (
+    bad_request,
+    encode_2d_array,
+    encode_binary_array,
+    get_data_holder,
+    log_traceback,
+    logger,
+    server_error,
+    wants_binary_arrays,
+)
 
 
-@app.route("/photometry", methods=["PUT"])
 def put_photometry_json():
     """
     Create a `Photometry` object from the JSON request
@@ -108,6 +120,7 @@ def put_photometry_json():
         passband_pivots, fwhm, px_scale, dark_current, read_noise, redleak_thresholds) of
         the `Photometry` object as a JSON response.
     """
+    data_holder = get_data_holder()
     try:
         #
         # Check inputs
@@ -127,19 +140,7 @@ def put_photometry_json():
             phot_input = request_data["photInput"]  # dict
             logger.debug("phot_input: " + str(phot_input))
             #
-            aper_params = dict.fromkeys(aper_params_input[aper_shape])
-            for key, val in aper_params_input[aper_shape].items():
-                try:
-                    print("key", key, "val", val)
-                    parsed_val = float(val)
-                    if key != "rotation" and key != "factor":
-                        parsed_val *= u.arcsec
-                except Exception:
-                    # Extract numbers from string (for center)
-                    parsed_val = [
-                        float(num) for num in re.findall(r"-?\d+\.?\d*", val)
-                    ] * u.arcsec
-                aper_params[key] = parsed_val
+            aper_params = parse_aper_params(aper_shape, aper_params_input)
             logger.debug("aper_params: " + str(aper_params))
 
         except Exception as e:
@@ -157,7 +158,7 @@ def put_photometry_json():
         #
         try:
             PhotometryObj = Photometry(
-                DataHolder.TelescopeObj, DataHolder.SourceObj, DataHolder.BackgroundObj
+                data_holder.TelescopeObj, data_holder.SourceObj, data_holder.BackgroundObj
             )
         except Exception as e:
             log_traceback(e)
@@ -172,81 +173,46 @@ def put_photometry_json():
                 + "and/or `Background` object"
             )
         #
-        # Specify aperture
+        # Specify aperture and do photometry
         #
-        if aper_shape == "optimal":
-            if not isinstance(DataHolder.SourceObj, PointSource):
-                logger.error(
-                    "`Source` object is not a `PointSource` object and "
-                    + "cannot use an optimal aperture."
-                )
-                return bad_request(
-                    "`Source` object is not a `PointSource` object and "
-                    + "cannot use an optimal aperture."
-                )
-            PhotometryObj.use_optimal_aperture(**aper_params)
-        elif aper_shape == "elliptical":
-            PhotometryObj.use_elliptical_aperture(**aper_params)
-        elif aper_shape == "rectangular":
-            PhotometryObj.use_rectangular_aperture(**aper_params)
-        else:
-            logger.error(f"{aper_shape} is not a valid aperture shape.")
-            return bad_request(f"{aper_shape} is not a valid aperture shape.")
-        #
-        # Do photometry
-        #
-        if phot_input["val_type"] == "snr":
-            phot_results = PhotometryObj.calc_snr_or_t(
-                snr=float(phot_input["val"]), reddening=reddening
-            )
-        elif phot_input["val_type"] == "t":
-            phot_results = PhotometryObj.calc_snr_or_t(
-                t=float(phot_input["val"]), reddening=reddening
-            )
-        else:
-            logger.error(
-                f"The given photometry target value type, {phot_input['val_type']}, "
-                + "is not valid and must be either 'snr' or 't'."
-            )
-            return bad_request(
-                f"The given photometry target value type, {phot_input['val_type']}, "
-                + "is not valid and must be either 'snr' or 't'."
+        try:
+            use_aperture(
+                PhotometryObj,
+                data_holder.SourceObj,
+                aper_shape,
+                aper_params,
+                source_key=data_holder.source_content_key,
             )
+            phot_results = calc_phot_results(PhotometryObj, phot_input, reddening)
+        except ValueError as e:
+            logger.error(str(e))
+            return bad_request(str(e))
         # (some passband results may be NaN/inf because, e.g., user chose a single
-        # emission line spectrum)
-        for band in phot_results:
-            if ~np.isfinite(phot_results[band]):
-                phot_results[band] = None
-            else:
-                phot_results[band] = float(phot_results[band])
+        # emission line spectrum. These are serialized as null by the JSON provider.)
         logger.debug("phot_results: " + str(phot_results))
         #
         # Calculate redleak fractions
         #
-        # (in case any redleak fractions are NaNs/infs)
-        redleak_fracs = DataHolder.SourceObj.calc_redleak_frac(DataHolder.TelescopeObj)
-        for band in redleak_fracs:
-            if ~np.isfinite(redleak_fracs[band]):
-                redleak_fracs[band] = None
-            else:
-                redleak_fracs[band] = float(redleak_fracs[band])
+        # (in case any redleak fractions are NaNs/infs, see above)
+        redleak_fracs = data_holder.SourceObj.calc_redleak_frac(data_holder.TelescopeObj)
         logger.debug("redleak_fracs: " + str(redleak_fracs))
         #
         # Store Photometry object
         #
-        DataHolder.PhotometryObj = PhotometryObj
+        data_holder.PhotometryObj = PhotometryObj
         #
         # Get aperture's encircled energy in each passband
         # Note that `None` will be set to `null` in the JSON response.
         #
         encircled_energies = PhotometryObj._encircled_energies
         #
-        # Convert 2D arrays to JSON, replace NaN with null, and only want the data array
+        # Convert 2D arrays to JSON (replace NaN with null, and only want the data array)
+        # or to binary buffers if the client asked for them
         #
-        aper_mask = pd.DataFrame(PhotometryObj._aper_mask).to_json(orient="values")
-        source_weights = pd.DataFrame(
+        aper_mask = encode_2d_array(PhotometryObj._aper_mask)
+        source_weights = encode_2d_array(
             PhotometryObj.source_weights[source_weights_passband]
-        ).to_json(orient="values")
+        )
         # Only return the attributes that we want to show on the frontend
         return jsonify(
             photResults=phot_results,
@@ -256,7 +222,7 @@ def put_photometry_json():
             aperMask=aper_mask,
             sourceWeights=source_weights,
             aperExtent=PhotometryObj._aper_extent,  # already a list
-            useLogSourceWeights=DataHolder.use_log_source_weights,
+            useLogSourceWeights=data_holder.use_log_source_weights,
         )
     except Exception as e:
         log_traceback(e)
@@ -268,3 +234,292 @@ def put_photometry_json():
             "There was a problem initializing the `Photometry` object and "
             + "returning some of its attributes in a JSON format."
         )
+
+
+def put_photometry_sweep_json():
+    """
+    Calculate the SNR (or exposure time) in each passband for many exposure times (or
+    SNRs), and optionally many source AB magnitudes, in one request. The `Photometry`
+    object and its aperture are only built once.
+
+    The JSON request has the same "reddening", "aperShape", and "aperParams" items as
+    the `photometry` request, plus:
+
+      photInput :: dict
+        The "val_type" ("snr" or "t") and the list of target "vals".
+
+      abMags :: list of floats (optional)
+        The AB magnitudes to renormalize the stored source to. If not given, the stored
+        source is used as is.
+
+      magPassband :: str or None (optional)
+        The passband of `abMags` (e.g., "g"). If None, `abMags` are total magnitudes.
+
+    Returns
+    -------
+      sweep_json :: Flask JSON response
+        The "passbands", the "vals" and "abMags" of the sweep, the "results" table with
+        one row per (AB magnitude, val) pair (magnitude-major order) and one column per
+        passband, the "shape" of the table as [num_mags, num_vals, num_passbands], and
+        the "effNpix" and "encircledEnergies" of the aperture. The table is encoded like
+        the 2D arrays of the `photometry` request (see `encode_2d_array()`).
+    """
+    data_holder = get_data_holder()
+    try:
+        #
+        # Check inputs
+        #
+        try:
+            request_data = request.get_json()
+            logger.info("Photometry sweep request_data: " + str(request_data))
+            reddening = float(request_data["reddening"])
+            aper_shape = request_data["aperShape"].lower()
+            aper_params = parse_aper_params(aper_shape, request_data["aperParams"])
+            val_type = request_data["photInput"]["val_type"]
+            vals = np.asarray(request_data["photInput"]["vals"], dtype=float).ravel()
+            ab_mags = request_data.get("abMags")
+            if ab_mags is not None:
+                ab_mags = np.asarray(ab_mags, dtype=float).ravel()
+            mag_passband = request_data.get("magPassband")
+        except Exception as e:
+            log_traceback(e)
+            logger.error(
+                "Inputs of the photometry sweep do not match required inputs."
+            )
+            return bad_request(
+                "Inputs of the photometry sweep do not match required inputs."
+            )
+        if val_type not in ("snr", "t"):
+            logger.error(
+                f"The given photometry target value type, {val_type}, "
+                + "is not valid and must be either 'snr' or 't'."
+            )
+            return bad_request(
+                f"The given photometry target value type, {val_type}, "
+                + "is not valid and must be either 'snr' or 't'."
+            )
+        if vals.size == 0 or not np.all(np.isfinite(vals) & (vals > 0)):
+            logger.error("The photometry sweep values must be positive numbers.")
+            return bad_request("The photometry sweep values must be positive numbers.")
+        if ab_mags is not None and (
+            ab_mags.size == 0 or not np.all(np.isfinite(ab_mags))
+        ):
+            logger.error(
+                "The photometry sweep abMags must be a non-empty list of numbers."
+            )
+            return bad_request(
+                "The photometry sweep abMags must be a non-empty list of numbers."
+            )
+        #
+        # Create the `Photometry` object (with a copy of the source if it will be
+        # renormalized) and its aperture
+        #
+        try:
+            SourceObj = data_holder.SourceObj
+            if ab_mags is not None:
+                SourceObj = copy.deepcopy(SourceObj)
+            PhotometryObj = Photometry(
+                data_holder.TelescopeObj, SourceObj, data_holder.BackgroundObj
+            )
+        except Exception as e:
+            log_traceback(e)
+            logger.error(
+                "Server could not initialize the `Photometry` object from server-side "
+                + "stored data. Probably missing `Telescope`, `Source`, "
+                + "and/or `Background` object"
+            )
+            return server_error(
+                "Server could not initialize the `Photometry` object from server-side "
+                + "stored data. Probably missing `Telescope`, `Source`, "
+                + "and/or `Background` object"
+            )
+        try:
+            use_aperture(
+                PhotometryObj,
+                SourceObj,
+                aper_shape,
+                aper_params,
+                source_key=data_holder.source_content_key,
+            )
+        except ValueError as e:
+            logger.error(str(e))
+            return bad_request(str(e))
+        #
+        # Do photometry for every magnitude
+        #
+        tables = []
+        for ab_mag in [None] if ab_mags is None else ab_mags:
+            if ab_mag is not None:
+                PhotometryObj.SourceObj.norm_to_AB_mag(
+                    ab_mag=float(ab_mag),
+                    passband=mag_passband,
+                    TelescopeObj=(
+                        None if mag_passband is None else data_holder.TelescopeObj
+                    ),
+                )
+            passbands, table = sweep_snr_or_t(PhotometryObj, val_type, vals, reddening)
+            tables.append(table)
+        results = np.concatenate(tables, axis=0)
+        if wants_binary_arrays():
+            results_json = encode_binary_array(results)
+        else:
+            results_json = results  # NaNs/infs become null
+        return jsonify(
+            passbands=passbands,
+            valType=val_type,
+            vals=vals,
+            abMags=ab_mags,
+            magPassband=mag_passband,
+            results=results_json,
+            shape=[len(tables), vals.size, len(passbands)],
+            effNpix=PhotometryObj._eff_npix,
+            encircledEnergies=PhotometryObj._encircled_energies,
+        )
+    except Exception as e:
+        log_traceback(e)
+        logger.error("There was a problem computing the photometry sweep.")
+        return server_error("There was a problem computing the photometry sweep.")
+
+
+def parse_aper_params(aper_shape, aper_params_input):
+    """
+    Convert the aperture parameters of the given shape from the frontend (strings) to
+    the keyword arguments of the `Photometry.use_*_aperture()` methods.
+
+    Parameters
+    ----------
+      aper_shape :: "optimal", "elliptical", or "rectangular"
+        The aperture shape.
+
+      aper_params_input :: dict of dicts
+        The aperture parameters of each shape.
+
+    Returns
+    -------
+      aper_params :: dict
+        The parsed aperture parameters (with astropy units where needed).
+    """
+    aper_params = dict.fromkeys(aper_params_input[aper_shape])
+    for key, val in aper_params_input[aper_shape].items():
+        try:
+            parsed_val = float(val)
+            if key != "rotation" and key != "factor":
+                parsed_val *= u.arcsec
+        except Exception:
+            # Extract numbers from string (for center)
+            parsed_val = [
+                float(num) for num in re.findall(r"-?\d+\.?\d*", val)
+            ] * u.arcsec
+        aper_params[key] = parsed_val
+    return aper_params
+
+
+# Aperture state of `Photometry` objects (mask, source weights, encircled energies,
+# effective number of pixels, etc.) keyed by telescope, source geometry, and aperture
+_aperture_cache = LRUCache(maxsize=int(os.getenv("ETC_APERTURE_CACHE_SIZE", "32")))
+
+
+def _frozen_copy(value):
+    """
+    Copy the arrays (incl. those in dicts and lists) of an aperture state into read-only
+    arrays for the cache, so that neither the `Photometry` object that computed them nor
+    any later user of the cache can change the cached values.
+    """
+    if isinstance(value, np.ndarray):
+        value = value.copy()
+        value.setflags(write=False)
+        return value
+    if isinstance(value, dict):
+        return {key: _frozen_copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_frozen_copy(item) for item in value]
+    return value
+
+
+def _writable_copy(value):
+    """
+    Copy a cached aperture state (see `_frozen_copy()`) for a `Photometry` object, which
+    may then change the arrays in place or rebind their items.
+    """
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, dict):
+        return {key: _writable_copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_writable_copy(item) for item in value]
+    return value
+
+
+def use_aperture(PhotometryObj, SourceObj, aper_shape, aper_params, source_key=None):
+    """
+    Set the aperture of the `Photometry` object. Raises a `ValueError` if the aperture
+    shape is not valid or if an optimal aperture is requested for a source that is not a
+    `PointSource`.
+
+    If `source_key` (see `source_route.source_content_key()`) is given, the attributes
+    that the aperture methods set on `PhotometryObj` are cached under the telescope
+    geometry, the source geometry and spectrum, and the aperture. Requests that only
+    change the exposure target or reddening then skip all image-plane work. The spectrum
+    (incl. its redshift) is part of the key since the aperture state (e.g., the source
+    weights) is not guaranteed to be independent of it. The cache keeps read-only copies
+    of the arrays and `PhotometryObj` always gets its own writable copies.
+    """
+    if aper_shape == "optimal":
+        if not isinstance(SourceObj, PointSource):
+            raise ValueError(
+                "`Source` object is not a `PointSource` object and "
+                + "cannot use an optimal aperture."
+            )
+        use_method = PhotometryObj.use_optimal_aperture
+    elif aper_shape == "elliptical":
+        use_method = PhotometryObj.use_elliptical_aperture
+    elif aper_shape == "rectangular":
+        use_method = PhotometryObj.use_rectangular_aperture
+    else:
+        raise ValueError(f"{aper_shape} is not a valid aperture shape.")
+    if source_key is None:
+        use_method(**aper_params)
+        return
+    TelescopeObj = PhotometryObj.TelescopeObj
+    key = make_key(
+        TelescopeObj.px_scale,
+        TelescopeObj.fwhm,
+        list(TelescopeObj.passbands),
+        source_key,
+        aper_shape,
+        aper_params,
+    )
+    aperture_state = _aperture_cache.get(key)
+    if aperture_state is not None:
+        logger.debug("Using cached aperture")
+        PhotometryObj.__dict__.update(_writable_copy(aperture_state))
+        return
+    state_before = dict(vars(PhotometryObj))
+    use_method(**aper_params)
+    # Only cache what the aperture method (re)bound, not the state from `__init__()`
+    aperture_state = {
+        name: _frozen_copy(value)
+        for name, value in vars(PhotometryObj).items()
+        if name not in state_before or state_before[name] is not value
+    }
+    _aperture_cache.set(key, aperture_state)
+
+
+def calc_phot_results(PhotometryObj, phot_input, reddening):
+    """
+    Calculate the SNR given the exposure time, or the exposure time given the SNR, in
+    each passband. `phot_input` is a dict with the "val_type" ("snr" or "t") and the
+    "val". Raises a `ValueError` if the value type is not valid.
+    """
+    if phot_input["val_type"] == "snr":
+        return PhotometryObj.calc_snr_or_t(
+            snr=float(phot_input["val"]), reddening=reddening
+        )
+    elif phot_input["val_type"] == "t":
+        return PhotometryObj.calc_snr_or_t(
+            t=float(phot_input["val"]), reddening=reddening
+        )
+    raise ValueError(
+        f"The given photometry target value type, {phot_input['val_type']}, "
+        + "is not valid and must be either 'snr' or 't'."
+    )
@@ -0,0 +1,184 @@
+"""
+routing.py
+
+Precompiled request router used by `connector.redirect()`.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import re
+from collections import namedtuple
+
+# The result of `Router.resolve()`. `params` holds the values captured by the route's
+# pattern (empty for plain routes).
+RouteMatch = namedtuple("RouteMatch", ["name", "handler", "methods", "params"])
+
+
+class Router:
+    """
+    Map request paths to handlers. This is required because CANFAR URLs change with each
+    session, so routes are matched on the end of the path: `castor/<sessionID>/telescope`
+    and `telescope` both resolve to the "telescope" route.
+
+    Plain routes are resolved with a single dictionary lookup on the last path segment.
+    Routes with parameters (e.g., `jobs/<job_id>`) and file routes (matched by extension)
+    are combined into one precompiled regular expression each. Build the router once at
+    import time and call `resolve()` for every request.
+    """
+
+    def __init__(self):
+        self._exact = {}  # last path segment -> (name, handler, methods)
+        self._patterns = []  # (name, pattern, handler, methods)
+        self._patterns_re = None
+        self._group_names = []
+        self._files = None  # (compiled regex, handler, methods)
+
+    def add(self, name, handler, methods, pattern=None):
+        """
+        Register a route.
+
+        Parameters
+        ----------
+          name :: str
+            The route name. Without a `pattern`, this is also the last path segment that
+            selects the route.
+
+          handler :: callable
+            The function called with the captured parameters as keyword arguments.
+
+          methods :: iterable of str
+            The allowed HTTP methods.
+
+          pattern :: str or None
+            Optional regular expression matched against the end of the path (after a "/"
+            or the start of the path). Named groups are passed to the handler.
+        """
+        methods = frozenset(methods)
+        if pattern is None:
+            self._exact[name] = (name, handler, methods)
+        else:
+            self._patterns.append((name, pattern, handler, methods))
+            self._patterns_re = None
+
+    def add_files(self, extensions, handler, methods=("GET",)):
+        """
+        Route any path whose last segment ends in one of the given file `extensions` to
+        `handler`, which is called with the keyword arguments `path` (the full path) and
+        `filename` (the last path segment).
+        """
+        extensions = "|".join(re.escape(ext) for ext in extensions)
+        self._files = (
+            re.compile(rf"[^/?]*\.(?:{extensions})$", re.IGNORECASE),
+            handler,
+            frozenset(methods),
+        )
+
+    def _compile(self):
+        # One alternation with a named group per route, anchored at the end of the path.
+        # The routes' own named groups are prefixed with the route group so that two
+        # routes may use the same parameter name (e.g., `job_id`).
+        alternatives = []
+        self._group_names = []
+        for i, (name, pattern, _, _) in enumerate(self._patterns):
+            group = f"_route{i}"
+            self._group_names.append(group)
+            pattern = re.sub(r"\(\?P<(\w+)>", rf"(?P<{group}__\1>", pattern)
+            alternatives.append(f"(?P<{group}>{pattern})")
+        self._patterns_re = re.compile(
+            r"(?:^|/)(?:" + "|".join(alternatives) + r")/?$"
+        )
+
+    def resolve(self, path):
+        """
+        Return the `RouteMatch` for the given request path, or None if no route matches.
+        """
+        stripped = path.rstrip("/")
+        segment = stripped.rpartition("/")[2]
+        exact = self._exact.get(segment)
+        if exact is not None:
+            return RouteMatch(*exact, {})
+        if self._patterns:
+            if self._patterns_re is None:
+                self._compile()
+            match = self._patterns_re.search(stripped)
+            if match is not None:
+                groups = match.groupdict()
+                for group, (name, _, handler, methods) in zip(
+                    self._group_names, self._patterns
+                ):
+                    if groups[group] is not None:
+                        prefix = group + "__"
+                        params = {
+                            key[len(prefix) :]: val
+                            for key, val in groups.items()
+                            if key.startswith(prefix) and val is not None
+                        }
+                        return RouteMatch(name, handler, methods, params)
+        if self._files is not None:
+            files_re, handler, methods = self._files
+            match = files_re.search(path)
+            if match is not None:
+                return RouteMatch(
+                    "file", handler, methods, {"path": path, "filename": match.group()}
+                )
+        return None
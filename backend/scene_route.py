@@ -0,0 +1,107 @@
+"""
+scene_route.py
+
+Serve the tiles of the simulated transit field of view.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+from flask import jsonify, request
+
+from scene_tiles import load_meta, load_tile
+from utils import app, logger, not_found
+
+# Scenes are content-addressed, so their tiles never change
+TILE_MAX_AGE = 31536000  # seconds
+
+
+def get_scene_json(scene_id):
+    """
+    Return the metadata of a transit scene (see `scene_tiles.save_scene()`).
+    """
+    meta = load_meta(scene_id)
+    if meta is None:
+        logger.error(f"Scene {scene_id} does not exist (or has expired)")
+        return not_found(f"Scene {scene_id} does not exist (or has expired)")
+    return jsonify(**meta)
+
+
+def get_scene_tile(scene_id, level, tile_x, tile_y):
+    """
+    Return one tile of a transit scene as raw little-endian uint16 values (row-major).
+    The "X-Tile-Shape" header gives the (rows, columns) of the tile. The log10 value of
+    a pixel is `vmin + value / 65535 * (vmax - vmin)` (see `get_scene_json()`).
+    """
+    tile = load_tile(scene_id, int(level), int(tile_x), int(tile_y))
+    if tile is None:
+        message = f"Tile {level}/{tile_x}/{tile_y} of scene {scene_id} does not exist"
+        logger.error(message)
+        return not_found(message)
+    response = app.response_class(tile.tobytes(), mimetype="application/octet-stream")
+    response.headers["X-Tile-Shape"] = f"{tile.shape[0]},{tile.shape[1]}"
+    response.headers["Access-Control-Expose-Headers"] = "X-Tile-Shape"
+    response.set_etag(f"{scene_id}-{level}-{tile_x}-{tile_y}")
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_MAX_AGE
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
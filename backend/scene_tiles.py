@@ -0,0 +1,231 @@
+"""
+scene_tiles.py
+
+Multi-resolution, tiled storage of the simulated transit field of view.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utils import logger
+
+# Scenes are written to disk so that every gunicorn worker (and the job queue's worker
+# processes) can serve the tiles of a scene simulated by another process
+SCENE_DIR = os.getenv("ETC_SCENE_DIR", os.path.join(os.getcwd(), "flask_scenes"))
+SCENE_TTL = float(os.getenv("ETC_SCENE_TTL", "14400"))  # seconds
+TILE_SIZE = int(os.getenv("ETC_SCENE_TILE_SIZE", "256"))  # pixels
+
+_META_FILENAME = "meta.json"
+_SCENE_ID_RE = re.compile(r"^[0-9a-f]{24}$")
+_QUANTIZATION_LEVELS = np.iinfo(np.uint16).max
+
+
+def _downsample(image):
+    """
+    Halve the resolution of an image by averaging 2x2 blocks (the last row/column is
+    averaged on its own if the size is odd).
+    """
+    rows, cols = image.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), np.nan)
+    padded[:rows, :cols] = image
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2)
+    return np.nanmean(blocks, axis=(1, 3))
+
+
+def save_scene(scene, tile_size=TILE_SIZE, directory=SCENE_DIR):
+    """
+    Build the image pyramid of a scene and save it. Level 0 is the full resolution and
+    every following level halves the resolution, down to a single tile. The pixels are
+    log10-scaled and quantized to uint16 with the same limits on every level.
+
+    Parameters
+    ----------
+      scene :: 2D array of floats
+        The scene, with values >= 1 (i.e., offset so that its log is defined).
+
+      tile_size :: int
+        The width and height of the tiles, in pixels.
+
+    Returns
+    -------
+      meta :: dict
+        The "id" of the scene, the "tileSize", the ("rows", "cols") shape of each of the
+        "levels", the "dtype" of the tiles, and the "vmin" and "vmax" (log10 values)
+        that the quantized values 0 and 65535 correspond to.
+    """
+    scene = np.ascontiguousarray(scene, dtype=float)
+    scene_id = hashlib.sha256(scene.tobytes()).hexdigest()[:24]
+    scene_dir = os.path.join(directory, scene_id)
+    meta_path = os.path.join(scene_dir, _META_FILENAME)
+    if os.path.exists(meta_path):
+        os.utime(meta_path)  # keep the scene while it is in use
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    purge_expired(directory)
+    #
+    # Build the pyramid
+    #
+    levels = [scene]
+    while max(levels[-1].shape) > tile_size:
+        levels.append(_downsample(levels[-1]))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_levels = [np.log10(level) for level in levels]
+    finite = np.isfinite(log_levels[0])
+    vmin = float(log_levels[0][finite].min()) if finite.any() else 0.0
+    vmax = float(log_levels[0][finite].max()) if finite.any() else 0.0
+    scale = _QUANTIZATION_LEVELS / (vmax - vmin) if vmax > vmin else 0.0
+    #
+    # Save the levels (metadata last, since it marks the scene as complete)
+    #
+    # (a unique directory per save, since threads of one process may save concurrently)
+    os.makedirs(directory, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=directory, prefix=scene_id + ".tmp")
+    for i, log_level in enumerate(log_levels):
+        quantized = np.nan_to_num((log_level - vmin) * scale, nan=0.0)
+        quantized = np.clip(np.rint(quantized), 0, _QUANTIZATION_LEVELS)
+        np.save(os.path.join(tmp_dir, f"level{i}.npy"), quantized.astype("<u2"))
+    meta = {
+        "id": scene_id,
+        "tileSize": tile_size,
+        "levels": [list(level.shape) for level in levels],
+        "dtype": "<u2",
+        "vmin": vmin,
+        "vmax": vmax,
+    }
+    with open(os.path.join(tmp_dir, _META_FILENAME), "w") as f:
+        json.dump(meta, f)
+    try:
+        os.replace(tmp_dir, scene_dir)
+    except OSError:
+        # Another process saved the same scene in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    logger.debug(f"Saved scene {scene_id} with {len(levels)} levels")
+    return meta
+
+
+def load_meta(scene_id, directory=SCENE_DIR):
+    """
+    Return the metadata of a saved scene (see `save_scene()`), or None if it does not
+    exist.
+    """
+    if not _SCENE_ID_RE.match(scene_id):
+        return None
+    try:
+        with open(os.path.join(directory, scene_id, _META_FILENAME), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_tile(scene_id, level, tile_x, tile_y, directory=SCENE_DIR):
+    """
+    Return a tile of a saved scene as a (C-contiguous) 2D uint16 array, or None if the
+    scene or tile does not exist. `tile_x` and `tile_y` count tiles along the columns
+    and rows of the level. Tiles on the right/top edges may be smaller than the tile size.
+    """
+    meta = load_meta(scene_id, directory)
+    if meta is None or not 0 <= level < len(meta["levels"]):
+        return None
+    rows, cols = meta["levels"][level]
+    tile_size = meta["tileSize"]
+    if not (0 <= tile_x * tile_size < cols and 0 <= tile_y * tile_size < rows):
+        return None
+    image = np.load(
+        os.path.join(directory, scene_id, f"level{level}.npy"), mmap_mode="r"
+    )
+    return np.ascontiguousarray(
+        image[
+            tile_y * tile_size : (tile_y + 1) * tile_size,
+            tile_x * tile_size : (tile_x + 1) * tile_size,
+        ]
+    )
+
+
+def purge_expired(directory=SCENE_DIR):
+    """
+    Delete the scenes that have not been saved or requested within `SCENE_TTL` seconds.
+    """
+    if not os.path.isdir(directory):
+        return
+    now = time.time()
+    for name in os.listdir(directory):
+        scene_dir = os.path.join(directory, name)
+        meta_path = os.path.join(scene_dir, _META_FILENAME)
+        try:
+            # (incomplete scenes have no metadata file)
+            mtime = os.path.getmtime(
+                meta_path if os.path.exists(meta_path) else scene_dir
+            )
+            if now - mtime > SCENE_TTL:
+                shutil.rmtree(scene_dir, ignore_errors=True)
+        except OSError:
+            pass
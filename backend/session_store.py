@@ -0,0 +1,303 @@
+"""
+session_store.py
+
+Session-keyed storage for the objects created between Flask requests.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import pickle
+import re
+import secrets
+import tempfile
+import time
+
+from cache import LRUCache
+
+# Session IDs are generated by `new_session_id()`. Anything else sent by a client is
+# rejected so that an ID can safely be used as a file name or redis key.
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def new_session_id():
+    """
+    Return a new random, URL-safe session ID.
+    """
+    return secrets.token_urlsafe(24)
+
+
+def is_valid_session_id(session_id):
+    """
+    Check that the given session ID has the same format as one from `new_session_id()`.
+    """
+    return isinstance(session_id, str) and _SESSION_ID_RE.match(session_id) is not None
+
+
+class MemoryBackend:
+    """
+    Keep session data in the memory of the current process.
+
+    This is the fastest backend but the data are only visible to the worker that created
+    them, so it is only suitable for a single gunicorn worker (optionally with threads).
+
+    Parameters
+    ----------
+      maxsize :: int
+        The maximum number of sessions to keep. The least-recently-used session is
+        evicted first.
+
+      ttl :: float or None
+        The number of seconds of inactivity after which a session is discarded.
+    """
+
+    def __init__(self, maxsize=256, ttl=3600):
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def load(self, session_id):
+        return self._cache.get(session_id)
+
+    def save(self, session_id, data):
+        # Objects are stored by reference so there is nothing to serialize
+        self._cache.set(session_id, data)
+
+    def delete(self, session_id):
+        self._cache.pop(session_id)
+
+
+class DiskBackend:
+    """
+    Pickle session data to a local directory, so that all workers on the same machine
+    share them. Recently used sessions are also kept in an in-memory LRU cache so that
+    only modified sessions are written back to disk.
+
+    Parameters
+    ----------
+      directory :: str
+        The directory in which to store the pickled sessions. Created if necessary.
+
+      maxsize :: int
+        The maximum number of sessions to keep in the in-memory cache of this worker.
+
+      ttl :: float or None
+        The number of seconds of inactivity after which a session is discarded.
+    """
+
+    def __init__(self, directory, maxsize=32, ttl=3600):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        # Map session ID -> (file modification time, data)
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def _path(self, session_id):
+        return os.path.join(self.directory, session_id + ".pkl")
+
+    def load(self, session_id):
+        path = self._path(session_id)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            self._cache.pop(session_id)
+            return None
+        if self.ttl is not None and time.time() - mtime > self.ttl:
+            self.delete(session_id)
+            return None
+        cached = self._cache.get(session_id)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self._cache.set(session_id, (mtime, data))
+        return data
+
+    def save(self, session_id, data):
+        path = self._path(session_id)
+        # A unique temporary file per save, since several threads of a worker may save
+        # the same session at the same time
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.directory, prefix=os.path.basename(path) + ".", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)  # atomic, so readers never see a partial file
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._cache.set(session_id, (os.path.getmtime(path), data))
+
+    def delete(self, session_id):
+        self._cache.pop(session_id)
+        try:
+            os.remove(self._path(session_id))
+        except OSError:
+            pass
+
+    def purge_expired(self):
+        """
+        Delete the pickled sessions that have not been modified within the TTL.
+        """
+        if self.ttl is None:
+            return
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                if now - os.path.getmtime(path) > self.ttl:
+                    os.remove(path)
+            except OSError:
+                pass
+
+
+class RedisBackend:
+    """
+    Store pickled session data in redis (or any server speaking the redis protocol), so
+    that all workers on all machines share them. Requires the `redis` package.
+
+    Parameters
+    ----------
+      url :: str
+        The redis URL, e.g., "redis://localhost:6379/0".
+
+      ttl :: float or None
+        The number of seconds of inactivity after which a session is discarded.
+
+      prefix :: str
+        The prefix for the redis keys.
+    """
+
+    def __init__(self, url, ttl=3600, prefix="castor_etc:session:"):
+        import redis  # optional dependency
+
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def load(self, session_id):
+        key = self.prefix + session_id
+        payload = self._client.get(key)
+        if payload is None:
+            return None
+        if self.ttl is not None:
+            self._client.expire(key, int(self.ttl))
+        return pickle.loads(payload)
+
+    def save(self, session_id, data):
+        payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        if self.ttl is None:
+            self._client.set(self.prefix + session_id, payload)
+        else:
+            self._client.set(self.prefix + session_id, payload, ex=int(self.ttl))
+
+    def delete(self, session_id):
+        self._client.delete(self.prefix + session_id)
+
+
+def make_backend(kind="memory", maxsize=256, ttl=3600, directory=None, url=None):
+    """
+    Create a session backend.
+
+    Parameters
+    ----------
+      kind :: "memory", "disk", or "redis"
+        The type of backend.
+
+      maxsize :: int
+        The maximum number of sessions kept in memory by each worker.
+
+      ttl :: float or None
+        The number of seconds of inactivity after which a session is discarded.
+
+      directory :: str
+        The directory used by the "disk" backend.
+
+      url :: str
+        The redis URL used by the "redis" backend.
+
+    Returns
+    -------
+      backend :: `MemoryBackend`, `DiskBackend`, or `RedisBackend` object
+    """
+    kind = kind.lower()
+    if kind == "memory":
+        return MemoryBackend(maxsize=maxsize, ttl=ttl)
+    elif kind == "disk":
+        if directory is None:
+            raise ValueError("The disk session backend requires a directory")
+        return DiskBackend(directory, maxsize=maxsize, ttl=ttl)
+    elif kind == "redis":
+        if url is None:
+            raise ValueError("The redis session backend requires a URL")
+        return RedisBackend(url, ttl=ttl)
+    else:
+        raise ValueError(f"{kind} is not a valid session backend")
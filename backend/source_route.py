@@ -66,18 +66,23 @@ ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
 
+import copy
+import hashlib
 import json
+import os
 
 import astropy.units as u
 import numpy as np
-import pandas as pd
 from castor_etc.sources import ExtendedSource, GalaxySource, PointSource
 from flask import jsonify, request
 
+import gaia_index  # answers Gaia cone searches from the local index
+from cache import LRUCache, make_key
+from template_library import GALAXY, PICKLES, template_library
 from utils import (
-    DataHolder,
-    app,
     bad_request,
+    dumps,
+    get_data_holder,
     log_traceback,
     logger,
     save_file,
@@ -85,7 +90,6 @@ from utils import (
 )
 
 
-@app.route("/source", methods=["PUT"])
 def put_source_json():
     """
     TODO: docstring
@@ -105,6 +109,7 @@ def put_source_json():
         Some attributes (i.e., wavelengths, spectrum, source_mags) of the `Source` object
         as a JSON response.
     """
+    data_holder = get_data_holder()
     # Flask will raise exception 500 if any code raises an error
     try:
         #
@@ -117,25 +122,17 @@ def put_source_json():
             request_data = request_form.to_dict()
             # logger.debug("\nSource request.form.to_dict() " + str(request_data) + "\n")
 
-            source_type = request_data["sourceType"].strip("\"'").strip("'\"")
-            logger.debug("source_type: " + str(source_type))
-
-            redshift = float(
-                request_data["redshift"].strip("\"'").strip("'\"")
-            )  # remove excess quotes
-            logger.debug("redshift: " + str(redshift))
-
-            predefined_spectrum = (
-                request_data["predefinedSpectrum"].strip("\"'").strip("'\"")
-            )
-            logger.debug("predefined_spectrum: " + str(predefined_spectrum))
-
-            predefined_spectrum_parameters = json.loads(
-                request_data["predefinedSpectrumParameters"]
-            )  # dict of dicts
-            logger.debug(
-                "predefined_spectrum_parameters " + str(predefined_spectrum_parameters)
-            )
+            (
+                source_type,
+                redshift,
+                predefined_spectrum,
+                predefined_spectrum_parameters,
+                physical_parameters,
+                spectral_lines,
+                norm_method,
+                norm_params,
+                is_norm_after_spectral_lines,
+            ) = parse_source_params(request_data)
 
             try:
                 custom_spectrum = request_data["customSpectrum"]  # will be ""
@@ -145,31 +142,6 @@ def put_source_json():
             except KeyError:
                 custom_spectrum = request.files["customSpectrum"]
                 logger.debug("custom_spectrum file" + str(custom_spectrum))
-
-            physical_parameters = json.loads(request_data["physicalParameters"])[
-                source_type
-            ]  # dict (originally dict of dicts)
-            logger.debug("physical_parameters " + str(physical_parameters))
-
-            spectral_lines = json.loads(request_data["spectralLines"])  # list of dicts
-            logger.debug("spectral_lines " + str(spectral_lines))
-
-            norm_method = request_data["normMethod"].strip("\"'").strip("'\"")  # string
-            logger.debug("norm_method " + str(norm_method))
-
-            norm_params = None
-            if norm_method != "":
-                norm_params = json.loads(request_data["normParams"])[
-                    norm_method
-                ]  # dict (originally dict of dicts)
-            logger.debug("norm_params " + str(norm_params))
-
-            is_norm_after_spectral_lines = json.loads(
-                request_data["isNormAfterSpectralLines"]
-            )  # bool
-            logger.debug(
-                "is_norm_after_spectral_lines " + str(is_norm_after_spectral_lines)
-            )
         except Exception as e:
             log_traceback(e)
             logger.error(
@@ -180,253 +152,61 @@ def put_source_json():
                 "Inputs to initialize the `Source` object do not match required inputs."
             )
         #
-        # Create the `Source` object
-        #
-        source_type = source_type.lower()
+        # Create the `Source` object and its spectrum
         #
-        # Tells frontend to use log source weights (after submitting Photometry request)
-        use_log_source_weights = False  # use linear color scale by default
-        #
-        if source_type == "point":
-            SourceObj = PointSource()
-        elif source_type == "extended":
-            if physical_parameters["profile"] == "uniform":
-                SourceObj = ExtendedSource(
-                    angle_a=float(physical_parameters["angleA"]) * u.arcsec,
-                    angle_b=float(physical_parameters["angleB"]) * u.arcsec,
-                    rotation=float(physical_parameters["rotation"]),
-                    profile=physical_parameters["profile"],
-                    exponential_scale_lengths=None,
-                )
-            elif physical_parameters["profile"] == "exponential":
-                SourceObj = ExtendedSource(
-                    angle_a=float(physical_parameters["angleA"]) * u.arcsec,
-                    angle_b=float(physical_parameters["angleB"]) * u.arcsec,
-                    rotation=float(physical_parameters["rotation"]),
-                    profile=physical_parameters["profile"],
-                    exponential_scale_lengths=[
-                        float(physical_parameters["exponentialScaleLengthA"]),
-                        float(physical_parameters["exponentialScaleLengthB"]),
-                    ]
-                    * u.arcsec,
-                )
-            else:
-                logger.error(
-                    f"{physical_parameters['profile']} is not a valid ExtendedSource profile"
-                )
-                return bad_request(
-                    f"{physical_parameters['profile']} is not a valid ExtendedSource profile"
-                )
-        elif source_type == "galaxy":
-            n = float(physical_parameters["sersic"])
-            SourceObj = GalaxySource(
-                r_eff=float(physical_parameters["rEff"]) * u.arcsec,
-                n=n,
-                axial_ratio=float(physical_parameters["axialRatio"]),
-                rotation=float(physical_parameters["rotation"]),
-            )
-            if n > 1.5:  # threshold is kind of arbitrary
-                use_log_source_weights = True
-        else:
-            logger.error(f"{source_type} is not a valid Source class")
-            return bad_request(f"{source_type} is not a valid Source class")
-        DataHolder.use_log_source_weights = use_log_source_weights
-        #
-        # Make spectrum
-        #
-        # Ensure wavelengths array is larger than passband response curve extent and is
-        # high-resolution (for interpolation). Divide by redshift to ensure final
-        # spectrum, if generating one, spans the full passband range.
-        wavelengths = (np.arange(900.0, 12005.0, 10.0) / (1 + redshift)) * u.AA
+        custom_spectrum_path = ""
         if custom_spectrum != "":
             # Save file here
-            secure_filepath = save_file(custom_spectrum)
-            if secure_filepath is None:
+            custom_spectrum_path = save_file(custom_spectrum)
+            if custom_spectrum_path is None:
                 logger.error("Could not save file!")
                 return bad_request("Could not save file!")
-            SourceObj.use_custom_spectrum(secure_filepath, wavelength_unit=u.AA)
-        elif predefined_spectrum == "gaia":
-            SourceObj.use_gaia_spectrum(
-                stellar_model_dir = "/arc/projects/CASTOR/stellar_models",
-                ra = float(predefined_spectrum_parameters[predefined_spectrum]["ra"]) * u.deg,
-                dec = float(predefined_spectrum_parameters[predefined_spectrum]["dec"]) * u.deg,
-                srch_Gmax = float(predefined_spectrum_parameters[predefined_spectrum]["srchGmax"]),
-                TelescopeObj = DataHolder.TelescopeObj
-            )
-        elif predefined_spectrum == "blackbody":
-            SourceObj.generate_bb(
-                T=float(predefined_spectrum_parameters[predefined_spectrum]["temp"])
-                * u.K,
-                wavelengths=wavelengths,
-                radius=float(
-                    predefined_spectrum_parameters[predefined_spectrum]["radius"]
-                ),
-                dist=float(predefined_spectrum_parameters[predefined_spectrum]["dist"])
-                * u.kpc,
-            )
-        elif predefined_spectrum == "powerLaw":
-            SourceObj.generate_power_law(
-                ref_wavelength=float(
-                    predefined_spectrum_parameters[predefined_spectrum]["refWavelength"]
-                )
-                * u.AA,
-                wavelengths=wavelengths,
-                exponent=float(
-                    predefined_spectrum_parameters[predefined_spectrum]["exponent"]
-                ),
-            )
-        elif predefined_spectrum == "uniform":
-            SourceObj.generate_uniform(
-                wavelengths=wavelengths,
-                value=float(
-                    predefined_spectrum_parameters[predefined_spectrum]["spectrumValue"]
-                ),
-                unit=predefined_spectrum_parameters[predefined_spectrum]["unit"],
-            )
-        elif predefined_spectrum == "emissionLine":
-            center = float(predefined_spectrum_parameters[predefined_spectrum]["center"])
-            fwhm = float(predefined_spectrum_parameters[predefined_spectrum]["fwhm"])
-            shape = predefined_spectrum_parameters[predefined_spectrum]["shape"]
-            # Ensure wavelengths array encclose the emission line
-            if shape == "gaussian":
-                min_buffer = 3 * fwhm
-            elif shape == "lorentzian":
-                min_buffer = 10 * fwhm
-            else:
-                logger.error(
-                    f"{shape} is not a valid emission line shape for spectrum generation"
-                )
-            min_wavelength = center - min_buffer
-            max_wavelength = center + min_buffer
-            if min_wavelength >= wavelengths[0].value:
-                min_wavelength = wavelengths[0].value
-            elif min_wavelength <= 0:
-                min_wavelength = 1 if center > 2 else 0.5 * center
-            if max_wavelength <= wavelengths[-1].value:
-                max_wavelength = wavelengths[-1].value
-            logger.debug(
-                "Generating single emission line spectrum with limits (A): "
-                + f" {min_wavelength}, {max_wavelength}"
-            )
-            SourceObj.generate_emission_line(
-                center=center * u.AA,
-                fwhm=fwhm * u.AA,
-                peak=float(predefined_spectrum_parameters[predefined_spectrum]["peak"]),
-                shape=shape,
-                limits=[min_wavelength, max_wavelength] * u.AA,
-            )
-        elif predefined_spectrum == "elliptical" or predefined_spectrum == "spiral":
-            SourceObj.use_galaxy_spectrum(gal_type=predefined_spectrum)
-        else:
-            try:
-                # Assume it is a pickles spectrum
-                SourceObj.use_pickles_spectrum(spectral_class=predefined_spectrum)
-            except Exception as e:
-                log_traceback(e)
-                logger.error(f"{predefined_spectrum} is not a valid spectrum")
-                return bad_request(f"{predefined_spectrum} is not a valid spectrum")
-        SourceObj.redshift_wavelengths(redshift)
-        #
-        # Potentially renormalize the spectrum before adding spectral lines
-        #
-        norm_method = norm_method.lower()
-        if norm_method != "" and not is_norm_after_spectral_lines:
-            logger.debug(
-                f"Renormalizing spectrum before (possibly) adding spectral lines"
+        try:
+            SourceObj, use_log_source_weights = build_source(
+                source_type,
+                physical_parameters,
+                redshift,
+                predefined_spectrum,
+                predefined_spectrum_parameters,
+                spectral_lines,
+                norm_method,
+                norm_params,
+                is_norm_after_spectral_lines,
+                data_holder.TelescopeObj,
+                custom_spectrum_path=custom_spectrum_path,
+                telescope_key=data_holder.telescope_key,
             )
-            if norm_method == "passbandmag":
-                SourceObj.norm_to_AB_mag(
-                    ab_mag=float(norm_params["abMag"]),
-                    passband=norm_params["passband"],
-                    TelescopeObj=DataHolder.TelescopeObj,
-                )
-            elif norm_method == "totalmag":
-                SourceObj.norm_to_AB_mag(
-                    ab_mag=float(norm_params), passband=None, TelescopeObj=None
-                )
-            elif norm_method == "luminositydist":
-                SourceObj.norm_luminosity_dist(
-                    luminosity=float(norm_params["luminosity"]),  # solar luminosities
-                    dist=float(norm_params["dist"]) * u.kpc,
-                )
-            else:
-                logger.error(f"{norm_method} is not a valid renormalization")
-                return bad_request(f"{norm_method} is not a valid renormalization")
-        #
-        # Add spectral lines
-        #
-        if spectral_lines:  # non-empty list of dicts
-            logger.debug("Adding spectral lines")
-            for line in spectral_lines:
-                if line["type"] == "emission":
-                    SourceObj.add_emission_line(
-                        center=float(line["center"]) * u.AA,
-                        fwhm=float(line["fwhm"]) * u.AA,
-                        peak=float(line["peak"]),
-                        shape=line["shape"],
-                        abs_peak=False,
-                    )
-                elif line["type"] == "absorption":
-                    SourceObj.add_absorption_line(
-                        center=float(line["center"]) * u.AA,
-                        fwhm=float(line["fwhm"]) * u.AA,
-                        dip=float(line["peak"]),
-                        shape=line["shape"],
-                        abs_dip=False,
-                    )
-                else:
-                    logger.error(f"{line['type']} is not a valid spectral line type")
-                    return bad_request(
-                        f"{line['type']} is not a valid spectral line type"
-                    )
-        #
-        # Potentially renormalize the spectrum after adding spectral lines
-        #
-        if norm_method != "" and is_norm_after_spectral_lines:
-            logger.debug(f"Renormalizing spectrum after (possibly) adding spectral lines")
-            if norm_method == "passbandmag":
-                SourceObj.norm_to_AB_mag(
-                    ab_mag=float(norm_params["abMag"]),
-                    passband=norm_params["passband"],
-                    TelescopeObj=DataHolder.TelescopeObj,
-                )
-            elif norm_method == "totalmag":
-                SourceObj.norm_to_AB_mag(
-                    ab_mag=float(norm_params), passband=None, TelescopeObj=None
-                )
-            elif norm_method == "luminositydist":
-                SourceObj.norm_luminosity_dist(
-                    luminosity=float(norm_params["luminosity"]),  # solar luminosities
-                    dist=float(norm_params["dist"]) * u.kpc,
-                )
-            else:
-                logger.error(f"{norm_method} is not a valid renormalization")
-                return bad_request(f"{norm_method} is not a valid renormalization")
+        except ValueError as e:
+            logger.error(str(e))
+            return bad_request(str(e))
+        # Tells frontend to use log source weights (after submitting Photometry request)
+        data_holder.use_log_source_weights = use_log_source_weights
+        data_holder.source_key = source_geometry_key(source_type, physical_parameters)
+        data_holder.source_content_key = source_content_key(
+            SourceObj, data_holder.source_key
+        )
         #
         # Get source magnitude in each passband
         # (may have NaNs/infs, e.g., user chose a single emission line spectrum)
         #
-        source_mags = SourceObj.get_AB_mag(TelescopeObj=DataHolder.TelescopeObj)
-        source_mags = (
-            pd.DataFrame(source_mags, index=[0]).iloc[0].to_json(orient="values")
-        )
+        source_mags = SourceObj.get_AB_mag(TelescopeObj=data_holder.TelescopeObj)
+        source_mags = dumps(list(source_mags.values()))  # NaNs/infs become null
         logger.debug("Source AB magnitudes in telescope passbands: " + str(source_mags))
         total_mag = SourceObj.get_AB_mag()
-        total_mag = total_mag if np.isfinite(total_mag) else None
         logger.debug("Source total AB magnitude: " + str(total_mag))
         #
         # Store `Source` object
         #
-        DataHolder.SourceObj = SourceObj
+        data_holder.SourceObj = SourceObj
         #
         #
 
         # Only return the attributes that we want to show on the frontend
         return jsonify(
-            wavelengths=SourceObj.wavelengths.to(u.AA).value.tolist(),  # x-values
-            spectrum=list((np.float64(SourceObj.spectrum))),  # y-values, spectrum has to have dtype=float64 to be serializable, float32 is not json serianizable.
-            sourceMags=source_mags,  # dict of floats
-            totalMag=total_mag,  # float
+            wavelengths=SourceObj.wavelengths.to(u.AA).value,  # x-values
+            spectrum=SourceObj.spectrum,  # y-values
+            sourceMags=source_mags,  # JSON string of floats
+            totalMag=total_mag,  # float (null if NaN/inf)
         )
     except Exception as e:
         log_traceback(e)
@@ -438,3 +218,502 @@ def put_source_json():
             "There was a problem initializing the `Source` object and "
             + "returning some of its attributes in a JSON format."
         )
+
+
+def parse_source_params(source_data):
+    """
+    Parse the items of a `source` request that describe the source (i.e., everything
+    but the custom spectrum). This is used by both the `source` and the batch photometry
+    routes. The items may be JSON strings (as in the form data of the `source` request)
+    or already decoded (as in the JSON records of the batch photometry request).
+
+    Parameters
+    ----------
+      source_data :: dict
+        The "sourceType", "redshift", "predefinedSpectrum",
+        "predefinedSpectrumParameters", "physicalParameters" (dict of dicts keyed by
+        source type), "spectralLines", "normMethod", "normParams" (dict of dicts keyed by
+        normalization method), and "isNormAfterSpectralLines".
+
+    Returns
+    -------
+      source_params :: tuple
+        The source type, redshift, predefined spectrum, predefined spectrum parameters,
+        physical parameters of the source type, spectral lines, normalization method,
+        normalization parameters of the method (None if there is no normalization), and
+        whether to normalize after adding the spectral lines.
+    """
+
+    def as_string(value):
+        return str(value).strip("\"'").strip("'\"")  # remove excess quotes
+
+    def as_json(value):
+        return json.loads(value) if isinstance(value, str) else value
+
+    source_type = as_string(source_data["sourceType"])
+    logger.debug("source_type: " + str(source_type))
+
+    redshift = float(as_string(source_data["redshift"]))
+    logger.debug("redshift: " + str(redshift))
+
+    predefined_spectrum = as_string(source_data["predefinedSpectrum"])
+    logger.debug("predefined_spectrum: " + str(predefined_spectrum))
+
+    predefined_spectrum_parameters = as_json(
+        source_data["predefinedSpectrumParameters"]
+    )  # dict of dicts
+    logger.debug(
+        "predefined_spectrum_parameters " + str(predefined_spectrum_parameters)
+    )
+
+    physical_parameters = as_json(source_data["physicalParameters"])[
+        source_type
+    ]  # dict (originally dict of dicts)
+    logger.debug("physical_parameters " + str(physical_parameters))
+
+    spectral_lines = as_json(source_data["spectralLines"])  # list of dicts
+    logger.debug("spectral_lines " + str(spectral_lines))
+
+    norm_method = as_string(source_data["normMethod"])  # string
+    logger.debug("norm_method " + str(norm_method))
+
+    norm_params = None
+    if norm_method != "":
+        norm_params = as_json(source_data["normParams"])[
+            norm_method
+        ]  # dict (originally dict of dicts)
+    logger.debug("norm_params " + str(norm_params))
+
+    is_norm_after_spectral_lines = bool(
+        as_json(source_data["isNormAfterSpectralLines"])
+    )  # bool
+    logger.debug("is_norm_after_spectral_lines " + str(is_norm_after_spectral_lines))
+
+    return (
+        source_type,
+        redshift,
+        predefined_spectrum,
+        predefined_spectrum_parameters,
+        physical_parameters,
+        spectral_lines,
+        norm_method,
+        norm_params,
+        is_norm_after_spectral_lines,
+    )
+
+
+def create_source(source_type, physical_parameters):
+    """
+    Create a `Source` object (without a spectrum) of the given type.
+
+    Parameters
+    ----------
+      source_type :: "point", "extended", or "galaxy"
+        The `Source` class.
+
+      physical_parameters :: dict
+        The physical parameters of the source type (e.g., "angleA", "rEff").
+
+    Returns
+    -------
+      SourceObj :: `Source` object
+        The new source.
+
+      use_log_source_weights :: bool
+        If True, the frontend should use a log colour scale for the source weights.
+    """
+    source_type = source_type.lower()
+    use_log_source_weights = False  # use linear color scale by default
+    if source_type == "point":
+        SourceObj = PointSource()
+    elif source_type == "extended":
+        if physical_parameters["profile"] == "uniform":
+            SourceObj = ExtendedSource(
+                angle_a=float(physical_parameters["angleA"]) * u.arcsec,
+                angle_b=float(physical_parameters["angleB"]) * u.arcsec,
+                rotation=float(physical_parameters["rotation"]),
+                profile=physical_parameters["profile"],
+                exponential_scale_lengths=None,
+            )
+        elif physical_parameters["profile"] == "exponential":
+            SourceObj = ExtendedSource(
+                angle_a=float(physical_parameters["angleA"]) * u.arcsec,
+                angle_b=float(physical_parameters["angleB"]) * u.arcsec,
+                rotation=float(physical_parameters["rotation"]),
+                profile=physical_parameters["profile"],
+                exponential_scale_lengths=[
+                    float(physical_parameters["exponentialScaleLengthA"]),
+                    float(physical_parameters["exponentialScaleLengthB"]),
+                ]
+                * u.arcsec,
+            )
+        else:
+            raise ValueError(
+                f"{physical_parameters['profile']} is not a valid ExtendedSource profile"
+            )
+    elif source_type == "galaxy":
+        n = float(physical_parameters["sersic"])
+        SourceObj = GalaxySource(
+            r_eff=float(physical_parameters["rEff"]) * u.arcsec,
+            n=n,
+            axial_ratio=float(physical_parameters["axialRatio"]),
+            rotation=float(physical_parameters["rotation"]),
+        )
+        if n > 1.5:  # threshold is kind of arbitrary
+            use_log_source_weights = True
+    else:
+        raise ValueError(f"{source_type} is not a valid Source class")
+    return SourceObj, use_log_source_weights
+
+
+def add_spectrum(
+    SourceObj,
+    redshift,
+    predefined_spectrum,
+    predefined_spectrum_parameters,
+    TelescopeObj,
+    custom_spectrum_path="",
+):
+    """
+    Give the source a custom or predefined spectrum and redshift it. Raises a
+    `ValueError` if the spectrum is not valid.
+
+    Parameters
+    ----------
+      SourceObj :: `Source` object
+        The source, modified in place.
+
+      redshift :: float
+        The redshift of the source.
+
+      predefined_spectrum :: str
+        The name of the predefined spectrum (e.g., "blackbody", "gaia", or a Pickles
+        spectral class). Ignored if `custom_spectrum_path` is given.
+
+      predefined_spectrum_parameters :: dict of dicts
+        The parameters of each predefined spectrum.
+
+      TelescopeObj :: `Telescope` object
+        The telescope (only used for Gaia spectra).
+
+      custom_spectrum_path :: str
+        The path to a user-uploaded spectrum file, or "" to use the predefined spectrum.
+    """
+    # Ensure wavelengths array is larger than passband response curve extent and is
+    # high-resolution (for interpolation). Divide by redshift to ensure final
+    # spectrum, if generating one, spans the full passband range.
+    wavelengths = (np.arange(900.0, 12005.0, 10.0) / (1 + redshift)) * u.AA
+    if custom_spectrum_path != "":
+        SourceObj.use_custom_spectrum(custom_spectrum_path, wavelength_unit=u.AA)
+    elif predefined_spectrum == "gaia":
+        srch_Gmax = float(predefined_spectrum_parameters[predefined_spectrum]["srchGmax"])
+        # The local Gaia index only answers the cone search if it is deep enough
+        with gaia_index.search_depth(srch_Gmax):
+            SourceObj.use_gaia_spectrum(
+                stellar_model_dir = "/arc/projects/CASTOR/stellar_models",
+                ra = float(predefined_spectrum_parameters[predefined_spectrum]["ra"]) * u.deg,
+                dec = float(predefined_spectrum_parameters[predefined_spectrum]["dec"]) * u.deg,
+                srch_Gmax = srch_Gmax,
+                TelescopeObj = TelescopeObj
+            )
+    elif predefined_spectrum == "blackbody":
+        SourceObj.generate_bb(
+            T=float(predefined_spectrum_parameters[predefined_spectrum]["temp"])
+            * u.K,
+            wavelengths=wavelengths,
+            radius=float(
+                predefined_spectrum_parameters[predefined_spectrum]["radius"]
+            ),
+            dist=float(predefined_spectrum_parameters[predefined_spectrum]["dist"])
+            * u.kpc,
+        )
+    elif predefined_spectrum == "powerLaw":
+        SourceObj.generate_power_law(
+            ref_wavelength=float(
+                predefined_spectrum_parameters[predefined_spectrum]["refWavelength"]
+            )
+            * u.AA,
+            wavelengths=wavelengths,
+            exponent=float(
+                predefined_spectrum_parameters[predefined_spectrum]["exponent"]
+            ),
+        )
+    elif predefined_spectrum == "uniform":
+        SourceObj.generate_uniform(
+            wavelengths=wavelengths,
+            value=float(
+                predefined_spectrum_parameters[predefined_spectrum]["spectrumValue"]
+            ),
+            unit=predefined_spectrum_parameters[predefined_spectrum]["unit"],
+        )
+    elif predefined_spectrum == "emissionLine":
+        center = float(predefined_spectrum_parameters[predefined_spectrum]["center"])
+        fwhm = float(predefined_spectrum_parameters[predefined_spectrum]["fwhm"])
+        shape = predefined_spectrum_parameters[predefined_spectrum]["shape"]
+        # Ensure wavelengths array encclose the emission line
+        if shape == "gaussian":
+            min_buffer = 3 * fwhm
+        elif shape == "lorentzian":
+            min_buffer = 10 * fwhm
+        else:
+            raise ValueError(
+                f"{shape} is not a valid emission line shape for spectrum generation"
+            )
+        min_wavelength = center - min_buffer
+        max_wavelength = center + min_buffer
+        if min_wavelength >= wavelengths[0].value:
+            min_wavelength = wavelengths[0].value
+        elif min_wavelength <= 0:
+            min_wavelength = 1 if center > 2 else 0.5 * center
+        if max_wavelength <= wavelengths[-1].value:
+            max_wavelength = wavelengths[-1].value
+        logger.debug(
+            "Generating single emission line spectrum with limits (A): "
+            + f" {min_wavelength}, {max_wavelength}"
+        )
+        SourceObj.generate_emission_line(
+            center=center * u.AA,
+            fwhm=fwhm * u.AA,
+            peak=float(predefined_spectrum_parameters[predefined_spectrum]["peak"]),
+            shape=shape,
+            limits=[min_wavelength, max_wavelength] * u.AA,
+        )
+    elif predefined_spectrum == "elliptical" or predefined_spectrum == "spiral":
+        if not use_template(SourceObj, GALAXY, predefined_spectrum):
+            SourceObj.use_galaxy_spectrum(gal_type=predefined_spectrum)
+    elif use_template(SourceObj, PICKLES, predefined_spectrum):
+        pass
+    else:
+        try:
+            # Assume it is a pickles spectrum
+            SourceObj.use_pickles_spectrum(spectral_class=predefined_spectrum)
+        except Exception as e:
+            log_traceback(e)
+            raise ValueError(f"{predefined_spectrum} is not a valid spectrum") from e
+    SourceObj.redshift_wavelengths(redshift)
+
+
+def use_template(SourceObj, kind, name):
+    """
+    Give the source a spectrum from the preloaded template library (see
+    `template_library.py`) instead of reading the template file with castor_etc.
+
+    The template is copied out of the memory-mapped library because the `Source` methods
+    (e.g., redshifting, normalization) may modify the spectrum in place.
+
+    Returns
+    -------
+      found :: bool
+        False if the library is not available or does not have the template.
+    """
+    if template_library is None:
+        return False
+    template = template_library.get(kind, name)
+    if template is None:
+        return False
+    wavelengths, spectrum = template
+    SourceObj.wavelengths = np.array(wavelengths) * u.AA
+    SourceObj.spectrum = np.array(spectrum)
+    if template_library.spectrum_unit != "":
+        SourceObj.spectrum = SourceObj.spectrum * u.Unit(template_library.spectrum_unit)
+    return True
+
+
+def normalize_source(SourceObj, norm_method, norm_params, TelescopeObj):
+    """
+    Renormalize the spectrum of the source in place. `norm_method` is one of
+    "passbandmag", "totalmag", or "luminositydist" (case-insensitive) and `norm_params`
+    holds its parameters. Raises a `ValueError` if `norm_method` is not valid.
+    """
+    norm_method = norm_method.lower()
+    if norm_method == "passbandmag":
+        SourceObj.norm_to_AB_mag(
+            ab_mag=float(norm_params["abMag"]),
+            passband=norm_params["passband"],
+            TelescopeObj=TelescopeObj,
+        )
+    elif norm_method == "totalmag":
+        SourceObj.norm_to_AB_mag(
+            ab_mag=float(norm_params), passband=None, TelescopeObj=None
+        )
+    elif norm_method == "luminositydist":
+        SourceObj.norm_luminosity_dist(
+            luminosity=float(norm_params["luminosity"]),  # solar luminosities
+            dist=float(norm_params["dist"]) * u.kpc,
+        )
+    else:
+        raise ValueError(f"{norm_method} is not a valid renormalization")
+
+
+def add_spectral_lines(SourceObj, spectral_lines):
+    """
+    Add the given emission/absorption lines (list of dicts from the frontend) to the
+    spectrum of the source in place. Raises a `ValueError` if a line type is not valid.
+    """
+    for line in spectral_lines:
+        if line["type"] == "emission":
+            SourceObj.add_emission_line(
+                center=float(line["center"]) * u.AA,
+                fwhm=float(line["fwhm"]) * u.AA,
+                peak=float(line["peak"]),
+                shape=line["shape"],
+                abs_peak=False,
+            )
+        elif line["type"] == "absorption":
+            SourceObj.add_absorption_line(
+                center=float(line["center"]) * u.AA,
+                fwhm=float(line["fwhm"]) * u.AA,
+                dip=float(line["peak"]),
+                shape=line["shape"],
+                abs_dip=False,
+            )
+        else:
+            raise ValueError(f"{line['type']} is not a valid spectral line type")
+
+
+# Intermediate `Source` objects of `build_source()`, keyed by the chained parameters of
+# all the pipeline stages that produced them
+_source_cache = LRUCache(maxsize=int(os.getenv("ETC_SOURCE_CACHE_SIZE", "256")))
+
+
+def build_source(
+    source_type,
+    physical_parameters,
+    redshift,
+    predefined_spectrum,
+    predefined_spectrum_parameters,
+    spectral_lines,
+    norm_method,
+    norm_params,
+    is_norm_after_spectral_lines,
+    TelescopeObj,
+    custom_spectrum_path="",
+    telescope_key=None,
+):
+    """
+    Create a `Source` object with its spectrum, spectral lines, and normalization. This
+    is used by both the `source` and the batch photometry routes. Raises a `ValueError`
+    if any of the inputs is not valid.
+
+    The source is built in stages: the base (redshifted) spectrum, the normalization
+    before the spectral lines, one stage per spectral line, and the normalization after
+    the spectral lines. The result of each stage is cached under the parameters of that
+    stage and of all previous ones, and the pipeline resumes from the last cached stage.
+    E.g., changing the normalization after the spectral lines only reruns that stage,
+    and editing a spectral line only reruns the stages from that line on. Custom spectra
+    are not cached, nor are the stages that depend on the telescope (Gaia spectra,
+    passband magnitudes) if `telescope_key` is not given.
+
+    Returns
+    -------
+      SourceObj :: `Source` object
+        The new source.
+
+      use_log_source_weights :: bool
+        If True, the frontend should use a log colour scale for the source weights.
+    """
+    norm_method = norm_method.lower()
+
+    def base_stage(_):
+        SourceObj, use_log_source_weights = create_source(
+            source_type, physical_parameters
+        )
+        add_spectrum(
+            SourceObj,
+            redshift,
+            predefined_spectrum,
+            predefined_spectrum_parameters,
+            TelescopeObj,
+            custom_spectrum_path=custom_spectrum_path,
+        )
+        return SourceObj, use_log_source_weights
+
+    def norm_stage(state):
+        normalize_source(state[0], norm_method, norm_params, TelescopeObj)
+        return state
+
+    def line_stage(line):
+        def stage(state):
+            add_spectral_lines(state[0], [line])
+            return state
+
+        return stage
+
+    #
+    # List the stages as (parameters or None if not cacheable, function)
+    #
+    if custom_spectrum_path != "" or (
+        predefined_spectrum == "gaia" and telescope_key is None
+    ):
+        base_params = None
+    else:
+        base_params = (
+            "base",
+            source_type.lower(),
+            physical_parameters,
+            redshift,
+            predefined_spectrum,
+            predefined_spectrum_parameters.get(predefined_spectrum),
+            telescope_key if predefined_spectrum == "gaia" else None,
+        )
+    if norm_method == "passbandmag" and telescope_key is None:
+        norm_stage_params = None
+    else:
+        norm_stage_params = (
+            "norm",
+            norm_method,
+            norm_params,
+            telescope_key if norm_method == "passbandmag" else None,
+        )
+    stages = [(base_params, base_stage)]
+    if norm_method != "" and not is_norm_after_spectral_lines:
+        stages.append((norm_stage_params, norm_stage))
+    for line in spectral_lines or []:
+        stages.append((("line", line), line_stage(line)))
+    if norm_method != "" and is_norm_after_spectral_lines:
+        stages.append((norm_stage_params, norm_stage))
+    #
+    # Chain the keys (a stage can only be cached if all previous stages can be too) and
+    # resume after the last cached stage
+    #
+    keys = []
+    key = ""
+    for params, _ in stages:
+        key = None if key is None or params is None else make_key(key, params)
+        keys.append(key)
+    state = None
+    start = 0
+    for i in range(len(stages) - 1, -1, -1):
+        cached = None if keys[i] is None else _source_cache.get(keys[i])
+        if cached is not None:
+            state = copy.deepcopy(cached)  # cached sources must not be modified
+            start = i + 1
+            break
+    logger.debug(f"Building source from stage {start} of {len(stages)}")
+    for i in range(start, len(stages)):
+        state = stages[i][1](state)
+        if keys[i] is not None:
+            _source_cache.set(keys[i], copy.deepcopy(state))
+    return state
+
+
+def source_geometry_key(source_type, physical_parameters):
+    """
+    Return a key of the source's geometry (i.e., everything that affects the source on
+    the image plane but not its spectrum).
+    """
+    source_type = source_type.lower()
+    if source_type == "point":
+        physical_parameters = None
+    return make_key(source_type, physical_parameters)
+
+
+def source_content_key(SourceObj, geometry_key):
+    """
+    Return a key of the source's geometry (see `source_geometry_key()`) and spectrum. The
+    spectrum is hashed by value, so custom spectra get a key too.
+    """
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(SourceObj.wavelengths.to(u.AA).value).tobytes())
+    digest.update(np.ascontiguousarray(SourceObj.spectrum).tobytes())
+    return make_key(geometry_key, digest.hexdigest())
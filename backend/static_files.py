@@ -0,0 +1,180 @@
+"""
+static_files.py
+
+Serving of the static files from the React build (JavaScript, CSS, images, etc.).
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import mimetypes
+import os
+import re
+
+from flask import Response, request, send_file
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+
+from utils import app, logger
+
+# Files with a content hash in their name (e.g., `main.1a2b3c4d.js` or
+# `787.9f8e7d6c.chunk.css` from create-react-app) never change, so browsers can cache them
+# forever. Everything else (e.g., index.html) must be revalidated.
+HASHED_FILENAME_RE = re.compile(r"\.[0-9a-f]{8,}(?:\.chunk)?\.[A-Za-z0-9]+$")
+IMMUTABLE_MAX_AGE = 31536000  # 1 year, in seconds
+
+# Precompressed variants (see `docker/precompress.py`), in order of preference
+PRECOMPRESSED_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+# Optional hand-off of the file transfer to the web server in front of gunicorn. Set
+# ETC_USE_X_SENDFILE=true for servers supporting `X-Sendfile` (e.g., Apache) or set
+# ETC_X_ACCEL_PREFIX to the internal location aliased to the static folder for nginx
+# (e.g., "/protected-static/").
+app.config["USE_X_SENDFILE"] = os.getenv("ETC_USE_X_SENDFILE", "false").lower() == "true"
+X_ACCEL_PREFIX = os.getenv("ETC_X_ACCEL_PREFIX")
+
+
+def _find_static_file(path):
+    """
+    Return the path (relative to the static folder) of the file requested at `path`, or
+    None if it does not exist. Leading path segments are dropped until a file is found,
+    so CANFAR session-prefixed paths (e.g., `session/contrib/<id>/static/js/main.js`)
+    resolve to `static/js/main.js`.
+    """
+    if app.static_folder is None:
+        return None
+    segments = path.strip("/").split("/")
+    for i in range(len(segments)):
+        relative_path = "/".join(segments[i:])
+        full_path = safe_join(app.static_folder, relative_path)
+        if full_path is not None and os.path.isfile(full_path):
+            return relative_path
+    return None
+
+
+def _pick_encoding(full_path):
+    """
+    Return the (content encoding, path) of the best precompressed variant of `full_path`
+    accepted by the client, or (None, `full_path`) if there is none.
+    """
+    for encoding, extension in PRECOMPRESSED_ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(full_path + extension):
+            return encoding, full_path + extension
+    return None, full_path
+
+
+def send_static(path):
+    """
+    Serve a file from the static folder with long-lived caching for content-hashed files,
+    precompressed `.br`/`.gz` variants, and conditional request (ETag/Last-Modified)
+    support.
+
+    Parameters
+    ----------
+      path :: str
+        The requested path. May include a CANFAR session prefix.
+
+    Returns
+    -------
+      response :: Flask response
+    """
+    relative_path = _find_static_file(path)
+    if relative_path is None:
+        logger.error(f"Static file not found: /{path}")
+        raise NotFound()
+    full_path = safe_join(app.static_folder, relative_path)
+    # The type and name of the original file, also for the precompressed variants
+    mimetype = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+    download_name = os.path.basename(relative_path)
+    encoding, file_path = _pick_encoding(full_path)
+    is_immutable = HASHED_FILENAME_RE.search(relative_path) is not None
+
+    if X_ACCEL_PREFIX is not None:
+        # Let nginx send the file (and handle conditional requests)
+        response = Response(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = X_ACCEL_PREFIX.rstrip("/") + "/" + (
+            os.path.relpath(file_path, app.static_folder).replace(os.sep, "/")
+        )
+    else:
+        response = send_file(
+            file_path,
+            mimetype=mimetype,
+            download_name=download_name,
+            conditional=True,
+            etag=True,
+            max_age=IMMUTABLE_MAX_AGE if is_immutable else None,
+        )
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    if is_immutable:
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+# Also use this for Flask's own static route (used when the static URL path is "/")
+if "static" in app.view_functions:
+    app.view_functions["static"] = lambda filename: send_static(filename)
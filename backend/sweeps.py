@@ -0,0 +1,264 @@
+"""
+sweeps.py
+
+Vectorized sweeps of the photometry and grism simulations over many exposure times,
+fitted from a few simulations (no castor_etc dependency).
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import copy
+
+import numpy as np
+
+from extraction import grism_source_rows
+from utils import logger
+
+# Exposure times (s) used to fit the noise model of the sweeps, and to check it
+_SWEEP_FIT_TIMES = (1.0, 1000.0)
+_SWEEP_CHECK_TIME = 30.0
+
+
+def sweep_snr_or_t(PhotometryObj, val_type, vals, reddening):
+    """
+    Vectorized `Photometry.calc_snr_or_t()` over many exposure times or SNRs.
+
+    For a fixed aperture, the SNR in each passband follows the CCD equation
+        1 / SNR^2 = a / t + c / t^2
+    with a = (S + B) / S^2 and c = C / S^2, where S and B are the source and the
+    background/dark electron rates and C is the read noise term. The coefficients are
+    fitted from two calls to `calc_snr_or_t()` and checked with a third one. The SNR (or
+    exposure time) for all `vals` is then evaluated at once. Passbands where the check
+    fails (or that have no signal) are computed by calling `calc_snr_or_t()` for each
+    value.
+
+    Parameters
+    ----------
+      PhotometryObj :: `Photometry` object
+        The photometry object, with its aperture already set.
+
+      val_type :: "snr" or "t"
+        Whether `vals` are SNRs or exposure times (s).
+
+      vals :: 1D array of floats
+        The target SNRs or exposure times.
+
+      reddening :: float
+        The E(B-V) reddening.
+
+    Returns
+    -------
+      passbands :: list of str
+        The passbands (i.e., the columns of `table`).
+
+      table :: 2D array of floats
+        The exposure time (if `val_type` is "snr") or SNR (if `val_type` is "t") for each
+        value (rows) and passband (columns).
+    """
+    fit_results = [
+        PhotometryObj.calc_snr_or_t(t=t, reddening=reddening) for t in _SWEEP_FIT_TIMES
+    ]
+    check_result = PhotometryObj.calc_snr_or_t(t=_SWEEP_CHECK_TIME, reddening=reddening)
+    passbands = list(fit_results[0])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_snr_sq = 1.0 / np.array(
+            [[res[band] for band in passbands] for res in fit_results], dtype=float
+        ) ** 2
+        fit_times = np.array(_SWEEP_FIT_TIMES)
+        design = np.column_stack([1.0 / fit_times, 1.0 / fit_times**2])
+        a, c = np.linalg.solve(design, inv_snr_sq)
+        check = np.array([check_result[band] for band in passbands], dtype=float)
+        predicted = 1.0 / np.sqrt(a / _SWEEP_CHECK_TIME + c / _SWEEP_CHECK_TIME**2)
+        is_fit = (
+            np.isfinite(a)
+            & np.isfinite(c)
+            & (a > 0)
+            & (c >= 0)
+            & np.isclose(predicted, check, rtol=1e-6, atol=0.0)
+        )
+        col = vals[:, np.newaxis]
+        if val_type == "t":
+            table = 1.0 / np.sqrt(a / col + c / col**2)
+        else:
+            # Positive root of c/t^2 + a/t - 1/SNR^2 = 0
+            table = 0.5 * col**2 * (a + np.sqrt(a**2 + 4.0 * c / col**2))
+    if not np.all(is_fit):
+        logger.debug(
+            "Photometry sweep falls back to calc_snr_or_t() for passbands "
+            + str([band for band, ok in zip(passbands, is_fit) if not ok])
+        )
+        for i, val in enumerate(vals):
+            res = PhotometryObj.calc_snr_or_t(
+                **{val_type: float(val)}, reddening=reddening
+            )
+            for j, band in enumerate(passbands):
+                if not is_fit[j]:
+                    table[i, j] = res[band]
+    return passbands, table
+
+
+def copy_grism(GrismObj, shared):
+    """
+    Deep copy a `Grism` object, sharing (not copying) the `Telescope`, `Source`, and
+    `Background` objects in `shared`, which the grism simulation does not modify.
+    """
+    return copy.deepcopy(GrismObj, memo={id(obj): obj for obj in shared})
+
+
+def sweep_grism_snr(GrismObj, exposure_times, nreads=1, nbin=1, shared=()):
+    """
+    Vectorized 1D SNR of `grism_route.simulate_grism()` over many exposure times.
+
+    In each pixel, the signal is R * t and the noise variance is A * t + C, where R is
+    the source electron rate, A = R + the background and dark current electron rates,
+    and C is the read noise term. R, A, and C are fitted from two exposures of copies of the
+    dispersed object and checked with a third one. The 1D SNR (i.e., the signal and
+    variance summed over the source rows) is then evaluated for all exposure times at
+    once. If the check fails, every exposure time is simulated instead.
+
+    The dark current and background rates cannot be told apart from the outputs of one
+    exposure, so the dark current rate is the variance removed by one more exposure with
+    the telescope's `dark_current` set to zero, and the background rate is what remains
+    of A - R.
+
+    Parameters
+    ----------
+      GrismObj :: `Grism` object
+        The dispersed grism observation (see `grism_route.disperse_grism()`). It is not
+        modified.
+
+      exposure_times :: 1D array of floats
+        The exposure times in seconds.
+
+      nreads, nbin :: int
+        The number of detector reads and the pixel binning of the noise model.
+
+      shared :: tuple of objects
+        The `Telescope`, `Source`, and `Background` objects of `GrismObj`, which are not
+        copied (see `copy_grism()`).
+
+    Returns
+    -------
+      sweep :: dict
+        The "snr1d" (2D array with one row per exposure time), the "grism1dx" pixels,
+        and the components of the 1D spectrum: the "sourceRate", "backgroundRate", and
+        "darkRate" (e-/s, i.e., the shot noise variance per second) and the "readVariance"
+        (e-^2).
+    """
+
+    def expose(exposure_time, dark=True):
+        _GrismObj = copy_grism(GrismObj, shared)
+        if not dark:
+            # (a shallow copy, since the shared `Telescope` object must not change)
+            _GrismObj.TelescopeObj = copy.copy(_GrismObj.TelescopeObj)
+            _GrismObj.TelescopeObj.dark_current = 0 * _GrismObj.TelescopeObj.dark_current
+        _GrismObj.expose(exposure_time=float(exposure_time))
+        _GrismObj.total_noise(Nreads=nreads, Nbin=nbin)
+        rows = grism_source_rows(_GrismObj)
+        return (
+            np.asarray(_GrismObj.integrated_grism_box_count[rows], dtype=float),
+            np.asarray(_GrismObj.grism_noise_total[rows], dtype=float) ** 2,
+        )
+
+    (signal_1, var_1), (signal_2, var_2) = [expose(t) for t in _SWEEP_FIT_TIMES]
+    signal_check, var_check = expose(_SWEEP_CHECK_TIME)
+    _, var_no_dark = expose(_SWEEP_FIT_TIMES[1], dark=False)
+    t_1, t_2 = _SWEEP_FIT_TIMES
+    source_rate = signal_1 / t_1
+    var_rate = (var_2 - var_1) / (t_2 - t_1)
+    dark_rate = (var_2 - var_no_dark) / t_2
+    read_var = var_1 - var_rate * t_1
+    is_fit = np.allclose(
+        source_rate * _SWEEP_CHECK_TIME, signal_check, rtol=1e-6, atol=0.0
+    ) and np.allclose(
+        var_rate * _SWEEP_CHECK_TIME + read_var,
+        var_check,
+        rtol=1e-6,
+        atol=1e-9 * np.max(np.abs(var_check), initial=0.0),
+    )
+    #
+    # Collapse the source rows (the 1D SNR only depends on the sums)
+    #
+    source_rate_1d = np.sum(source_rate, axis=0)
+    var_rate_1d = np.sum(var_rate, axis=0)
+    read_var_1d = np.sum(read_var, axis=0)
+    dark_rate_1d = np.sum(dark_rate, axis=0)
+    if is_fit:
+        t = exposure_times[:, np.newaxis]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            snr_1d = source_rate_1d * t / np.sqrt(var_rate_1d * t + read_var_1d)
+    else:
+        logger.debug("Grism sweep falls back to simulating every exposure time")
+        snr_1d = np.empty((exposure_times.size, source_rate_1d.size))
+        for i, exposure_time in enumerate(exposure_times):
+            signal, var = expose(exposure_time)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                snr_1d[i] = np.sum(signal, axis=0) / np.sqrt(np.sum(var, axis=0))
+    return {
+        "snr1d": snr_1d,
+        "grism1dx": np.arange(source_rate_1d.size),
+        "sourceRate": source_rate_1d,
+        "backgroundRate": var_rate_1d - source_rate_1d - dark_rate_1d,
+        "darkRate": dark_rate_1d,
+        "readVariance": read_var_1d,
+    }
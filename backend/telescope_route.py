@@ -66,14 +66,57 @@ ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
 
+import hashlib
+import os
+
 import astropy.units as u
 from castor_etc.telescope import Telescope
 from flask import jsonify, request
 
-from utils import DataHolder, app, logger, log_traceback, bad_request, server_error
+from cache import LRUCache, make_key
+from utils import (
+    app,
+    logger,
+    log_traceback,
+    bad_request,
+    server_error,
+    dumps_bytes,
+    get_data_holder,
+)
+
+# `Telescope` objects and their serialized JSON responses, keyed by request parameters
+_telescope_cache = LRUCache(maxsize=int(os.getenv("ETC_TELESCOPE_CACHE_SIZE", "32")))
+
+
+def _build_passband_curves():
+    """
+    Serialize the full passband response curves of the default `Telescope` object.
+
+    Returns
+    -------
+      body :: bytes
+        The passband curves as a JSON document.
+
+      etag :: str
+        A strong ETag (SHA-256 digest) of `body`.
+    """
+    TelescopeObj = Telescope()
+    # Full passband curves is around 123 kB (estimated using `sys.getsizeof()`)
+    full_passband_curves = {
+        band: {
+            "wavelength": curve["wavelength"].to(u.AA).value,
+            "response": curve["response"],
+        }
+        for band, curve in TelescopeObj.full_passband_curves.items()
+    }
+    body = dumps_bytes(full_passband_curves)
+    return body, hashlib.sha256(body).hexdigest()
+
+
+# The passband curves do not depend on any user input, so only serialize them once
+_passband_curves_body, _passband_curves_etag = _build_passband_curves()
 
 
-@app.route("/telescope", methods=["PUT"])
 def put_telescope_json():
     """
     Create a `Telescope` object from the JSON request and return some attributes of the
@@ -98,6 +141,7 @@ def put_telescope_json():
         passband_pivots, fwhm, px_scale, dark_current, read_noise, redleak_thresholds) of
         the `Telescope` object as a JSON response.
     """
+    data_holder = get_data_holder()
     # Flask will raise exception 500 if any code raises an error
     #
     # Convert all inputs to floats
@@ -135,63 +179,48 @@ def put_telescope_json():
                 + "do not match required inputs."
             )
         #
-        # Create and store `Telescope` object
+        # Reuse the `Telescope` object (and its JSON response) if an identical one was
+        # created before. The frontend re-submits the telescope form on every tab switch.
         #
-        TelescopeObj = Telescope(
-            fwhm=fwhm * u.arcsec,
-            px_scale=px_scale * u.arcsec,
-            mirror_diameter=mirror_diameter * u.cm,
-            dark_current=dark_current,
-            read_noise=read_noise,
-            redleak_thresholds={
-                # Convert float to `astropy.Quantity`
-                key: val * u.AA
-                for key, val in redleak_thresholds.items()
-            },
-            extinction_coeffs=extinction_coeffs,
-        )
-        DataHolder.TelescopeObj = TelescopeObj
-        # Only return the attributes that we want to show on the frontend
-        return jsonify(
-            passbandLimits={
-                # Convert numpy arrays to list of floats
-                key: val.to(u.AA).value.tolist()
-                for key, val in TelescopeObj.passband_limits.items()
-            },
-            # Full passband curves is around 123 kB (estimated using `sys.getsizeof()`)
-            fullPassbandCurves={
-                band: {
-                    "wavelength": curve["wavelength"].to(u.AA).value.tolist(),
-                    "response": curve["response"].tolist(),
-                }
-                for band, curve in TelescopeObj.full_passband_curves.items()
-            },
-            mirrorDiameter=float(TelescopeObj.mirror_diameter.to(u.cm).value),
-            photZpts={
-                # Convert numpy float to Python float
-                key: float(val)
-                for key, val in TelescopeObj.phot_zpts.items()
-            },
-            passbandPivots={
-                # Convert `astropy.Quantity` to float
-                key: float(val.to(u.AA).value)
-                for key, val in TelescopeObj.passband_pivots.items()
-            },
-            fwhm=float(TelescopeObj.fwhm.to(u.arcsec).value),
-            pxScale=float(TelescopeObj.px_scale.to(u.arcsec).value),
-            darkCurrent=float(TelescopeObj.dark_current),
-            readNoise=float(TelescopeObj.read_noise),
-            redleakThresholds={
-                # Convert `astropy.Quantity` to float
-                key: float(val.to(u.AA).value)
-                for key, val in TelescopeObj.redleak_thresholds.items()
-            },
-            extinctionCoeffs={
-                # Should already be a Python int/float
-                key: val
-                for key, val in TelescopeObj.extinction_coeffs.items()
-            },
+        telescope_key = make_key(
+            fwhm,
+            px_scale,
+            mirror_diameter,
+            dark_current,
+            read_noise,
+            redleak_thresholds,
+            extinction_coeffs,
         )
+        cached = _telescope_cache.get(telescope_key)
+        if cached is None:
+            #
+            # Create `Telescope` object
+            #
+            TelescopeObj = Telescope(
+                fwhm=fwhm * u.arcsec,
+                px_scale=px_scale * u.arcsec,
+                mirror_diameter=mirror_diameter * u.cm,
+                dark_current=dark_current,
+                read_noise=read_noise,
+                redleak_thresholds={
+                    # Convert float to `astropy.Quantity`
+                    key: val * u.AA
+                    for key, val in redleak_thresholds.items()
+                },
+                extinction_coeffs=extinction_coeffs,
+            )
+            cached = (TelescopeObj, _telescope_response(TelescopeObj).get_data())
+            _telescope_cache.set(telescope_key, cached)
+        else:
+            logger.debug("Using cached `Telescope` object " + telescope_key)
+        TelescopeObj, response_body = cached
+        #
+        # Store `Telescope` object. N.B. cached `Telescope` objects are shared between
+        # sessions, so they must never be modified in place!
+        #
+        data_holder.TelescopeObj = TelescopeObj
+        data_holder.telescope_key = telescope_key
+        return app.response_class(response_body, mimetype="application/json")
     except Exception as e:
         log_traceback(e)
         logger.error(
@@ -202,3 +231,65 @@ def put_telescope_json():
             "There was a problem initializing the `Telescope` object and "
             + "returning some of its attributes in a JSON format."
         )
+
+
+def get_passband_curves_json():
+    """
+    Return the full passband response curves (wavelengths in angstrom) as a JSON response
+    with a strong ETag. Clients sending a matching `If-None-Match` header get an empty 304
+    response instead.
+
+    Returns
+    -------
+      passband_curves_json :: Flask JSON response
+        A dictionary mapping each passband name to a dictionary with the keys "wavelength"
+        and "response".
+    """
+    response = app.response_class(_passband_curves_body, mimetype="application/json")
+    response.set_etag(_passband_curves_etag)
+    # Allow caching but revalidate every time, which is cheap thanks to the ETag
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+def _telescope_response(TelescopeObj):
+    """
+    Return some attributes (i.e., passband_limits, mirror_diameter, phot_zpts,
+    passband_pivots, fwhm, px_scale, dark_current, read_noise, redleak_thresholds) of the
+    given `Telescope` object as a Flask JSON response.
+    """
+    # Only return the attributes that we want to show on the frontend
+    return jsonify(
+        passbandLimits={
+            key: val.to(u.AA).value
+            for key, val in TelescopeObj.passband_limits.items()
+        },
+        # N.B. the full passband curves are served separately by
+        # `get_passband_curves_json()`
+        mirrorDiameter=float(TelescopeObj.mirror_diameter.to(u.cm).value),
+        photZpts={
+            # Convert numpy float to Python float
+            key: float(val)
+            for key, val in TelescopeObj.phot_zpts.items()
+        },
+        passbandPivots={
+            # Convert `astropy.Quantity` to float
+            key: float(val.to(u.AA).value)
+            for key, val in TelescopeObj.passband_pivots.items()
+        },
+        fwhm=float(TelescopeObj.fwhm.to(u.arcsec).value),
+        pxScale=float(TelescopeObj.px_scale.to(u.arcsec).value),
+        darkCurrent=float(TelescopeObj.dark_current),
+        readNoise=float(TelescopeObj.read_noise),
+        redleakThresholds={
+            # Convert `astropy.Quantity` to float
+            key: float(val.to(u.AA).value)
+            for key, val in TelescopeObj.redleak_thresholds.items()
+        },
+        extinctionCoeffs={
+            # Should already be a Python int/float
+            key: val
+            for key, val in TelescopeObj.extinction_coeffs.items()
+        },
+    )
@@ -0,0 +1,233 @@
+"""
+template_library.py
+
+Memory-mapped library of the Pickles stellar and galaxy spectral templates.
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+from utils import logger
+
+# Kinds of templates in the library and the `Source` method that loads them
+PICKLES = "pickles"
+GALAXY = "galaxy"
+GALAXY_TYPES = ("elliptical", "spiral")
+
+# Directory of the template library (see `build_library()`)
+TEMPLATE_LIBRARY_DIR = os.getenv(
+    "ETC_TEMPLATE_LIBRARY",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"),
+)
+_DATA_FILENAME = "templates.npy"
+_INDEX_FILENAME = "templates.json"
+
+
+class TemplateLibrary:
+    """
+    Read-only store of spectral templates. All templates are packed in one 2D array
+    (wavelengths in angstroms in the first row, spectra in the second row) that is
+    memory-mapped, so all the processes that open the library share its pages, and a
+    template is a slice of the array.
+
+    Parameters
+    ----------
+      directory :: str
+        The directory written by `build_library()`.
+    """
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, _INDEX_FILENAME), "r") as f:
+            index = json.load(f)
+        self.spectrum_unit = index["spectrum_unit"]
+        # (kind, name) -> (start, stop) of the template in the data array
+        self._index = {
+            (kind, name): tuple(span)
+            for kind, templates in index["templates"].items()
+            for name, span in templates.items()
+        }
+        self._data = np.load(os.path.join(directory, _DATA_FILENAME), mmap_mode="r")
+
+    def __contains__(self, kind_name):
+        return kind_name in self._index
+
+    def names(self, kind):
+        """
+        Return the names (e.g., spectral classes) of the templates of the given kind.
+        """
+        return sorted(name for (k, name) in self._index if k == kind)
+
+    def get(self, kind, name):
+        """
+        Return the (wavelengths, spectrum) of a template as read-only views of the
+        memory-mapped array, or None if the library does not have this template. The
+        wavelengths are in angstroms.
+        """
+        span = self._index.get((kind, name))
+        if span is None:
+            return None
+        start, stop = span
+        return self._data[0, start:stop], self._data[1, start:stop]
+
+
+def load_library(directory=TEMPLATE_LIBRARY_DIR):
+    """
+    Open the template library in `directory`. Returns None (i.e., templates are read by
+    castor_etc) if the library has not been built.
+    """
+    if not os.path.exists(os.path.join(directory, _INDEX_FILENAME)):
+        logger.debug(f"No spectral template library in {directory}")
+        return None
+    try:
+        library = TemplateLibrary(directory)
+    except Exception as e:
+        logger.warning(f"Could not open the spectral template library in {directory}")
+        logger.warning(str(e))
+        return None
+    logger.debug(f"Opened the spectral template library in {directory}")
+    return library
+
+
+def read_spectral_classes(pickles_map_path):
+    """
+    Read the Pickles spectral classes offered by the frontend (i.e., the `spectralValue`
+    items of `frontend/src/components/forms/pickles_spectra_map.txt`).
+    """
+    with open(pickles_map_path, "r") as f:
+        return re.findall(r'spectralValue:\s*"(\w+)"', f.read())
+
+
+def build_library(directory, spectral_classes, galaxy_types=GALAXY_TYPES):
+    """
+    Load every template with castor_etc and pack them into the library files in
+    `directory` (see `TemplateLibrary`). Run this when building the Docker image.
+
+    Parameters
+    ----------
+      directory :: str
+        The output directory.
+
+      spectral_classes :: list of str
+        The Pickles spectral classes to include.
+
+      galaxy_types :: list of str
+        The galaxy template types to include.
+    """
+    import astropy.units as u
+    from castor_etc.sources import GalaxySource, PointSource
+
+    templates = []  # (kind, name, wavelengths, spectrum)
+    for spectral_class in spectral_classes:
+        SourceObj = PointSource()
+        SourceObj.use_pickles_spectrum(spectral_class=spectral_class)
+        templates.append((PICKLES, spectral_class, SourceObj))
+    for gal_type in galaxy_types:
+        SourceObj = GalaxySource(r_eff=1 * u.arcsec, n=1, axial_ratio=1, rotation=0)
+        SourceObj.use_galaxy_spectrum(gal_type=gal_type)
+        templates.append((GALAXY, gal_type, SourceObj))
+    #
+    # Pack all templates in one array
+    #
+    spectrum_unit = None
+    index = {PICKLES: {}, GALAXY: {}}
+    wavelengths = []
+    spectra = []
+    start = 0
+    for kind, name, SourceObj in templates:
+        spectrum = SourceObj.spectrum
+        unit = str(spectrum.unit) if isinstance(spectrum, u.Quantity) else ""
+        if spectrum_unit is None:
+            spectrum_unit = unit
+        elif unit != spectrum_unit:
+            raise ValueError(f"Template {kind}/{name} has a different spectrum unit")
+        wavelengths.append(SourceObj.wavelengths.to(u.AA).value)
+        spectra.append(np.asarray(spectrum, dtype=float))
+        index[kind][name] = [start, start + len(spectra[-1])]
+        start += len(spectra[-1])
+    data = np.vstack([np.concatenate(wavelengths), np.concatenate(spectra)])
+    #
+    # Write the files (index last, since it marks the library as complete)
+    #
+    os.makedirs(directory, exist_ok=True)
+    data_path = os.path.join(directory, _DATA_FILENAME)
+    np.save(data_path + ".tmp.npy", data)
+    os.replace(data_path + ".tmp.npy", data_path)
+    index_path = os.path.join(directory, _INDEX_FILENAME)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"spectrum_unit": spectrum_unit, "templates": index}, f)
+    os.replace(index_path + ".tmp", index_path)
+    logger.info(f"Wrote {len(templates)} spectral templates to {directory}")
+
+
+template_library = load_library()
+
+
+if __name__ == "__main__":
+    # Usage: python template_library.py <output directory> <pickles_spectra_map.txt>
+    build_library(sys.argv[1], read_spectral_classes(sys.argv[2]))
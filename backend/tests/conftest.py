@@ -0,0 +1,10 @@
+"""
+Shared pytest configuration. The backend modules import each other by their flat names
+(as when gunicorn runs from the `backend` directory), so that directory is put on the
+import path. Run from the `backend` directory with `python -m pytest tests`.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,83 @@
+"""
+Tests of the single-pass grism extraction (see `extraction.py`) against the extraction
+it replaced in `grism_route.simulate_grism()`.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from extraction import extract_grism, grism_source_rows
+
+
+def previous_extraction(GrismObj):
+    """
+    The extraction of `simulate_grism()` before `extract_grism()`.
+    """
+    box_center = int((GrismObj.integrated_grism_box_count.shape[0] - 1) / 2)
+    half_source_size = int((GrismObj.source_image.shape[0] - 1) / 2)
+    rows = slice(box_center - half_source_size, box_center + half_source_size + 1)
+    sum_signal_1d = np.sum(GrismObj.integrated_grism_box_count[rows, :], axis=0)
+    quad_error_1d = np.sqrt(np.sum(GrismObj.grism_noise_total[rows, :] ** 2, axis=0))
+    snr_1d = sum_signal_1d / quad_error_1d
+    grism_2d = GrismObj.integrated_grism_box_count / GrismObj.grism_noise_total
+    return sum_signal_1d, quad_error_1d, snr_1d, grism_2d
+
+
+def make_grism(box_rows=41, columns=300, source_rows=7, seed=0):
+    rng = np.random.default_rng(seed)
+    signal = rng.gamma(2.0, 50.0, size=(box_rows, columns))
+    noise = np.sqrt(signal + 100.0)
+    # Columns without signal or noise give NaN SNRs in both extractions
+    signal[:, :3] = 0.0
+    noise[:, :3] = 0.0
+    return SimpleNamespace(
+        integrated_grism_box_count=signal,
+        grism_noise_total=noise,
+        source_image=np.ones((source_rows, source_rows)),
+    )
+
+
+@pytest.mark.parametrize("box_rows, source_rows", [(41, 7), (40, 8), (21, 21), (9, 1)])
+def test_source_rows(box_rows, source_rows):
+    GrismObj = make_grism(box_rows=box_rows, source_rows=source_rows)
+    rows = grism_source_rows(GrismObj)
+    box_center = int((box_rows - 1) / 2)
+    half_source_size = int((source_rows - 1) / 2)
+    assert rows.start == box_center - half_source_size
+    assert rows.stop == box_center + half_source_size + 1
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_extract_grism_matches_previous_extraction(dtype):
+    GrismObj = make_grism()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected = previous_extraction(GrismObj)
+        results = extract_grism(
+            GrismObj.integrated_grism_box_count,
+            GrismObj.grism_noise_total,
+            grism_source_rows(GrismObj),
+            dtype=dtype,
+        )
+    for result, previous in zip(results[:3], expected[:3]):
+        assert result.dtype == np.float64
+        np.testing.assert_allclose(result, previous, rtol=1e-12, equal_nan=True)
+    snr_2d = results[3]
+    assert snr_2d.dtype == dtype
+    rtol = 1e-12 if dtype == np.float64 else 1e-6
+    np.testing.assert_allclose(snr_2d, expected[3], rtol=rtol, equal_nan=True)
+    assert np.isnan(snr_2d[:, :3]).all()
+
+
+def test_extract_grism_does_not_modify_inputs():
+    GrismObj = make_grism()
+    signal = GrismObj.integrated_grism_box_count.copy()
+    noise = GrismObj.grism_noise_total.copy()
+    extract_grism(
+        GrismObj.integrated_grism_box_count,
+        GrismObj.grism_noise_total,
+        grism_source_rows(GrismObj),
+    )
+    np.testing.assert_array_equal(GrismObj.integrated_grism_box_count, signal)
+    np.testing.assert_array_equal(GrismObj.grism_noise_total, noise)
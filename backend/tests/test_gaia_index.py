@@ -0,0 +1,74 @@
+"""
+Tests of the local Gaia tile index (see `gaia_index.py`). Tiles are built from small
+tables instead of the Gaia archive.
+"""
+
+import threading
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from gaia_index import GaiaTileIndex
+
+
+def make_sources(ra, dec, g_mag):
+    return Table(
+        {
+            "source_id": np.arange(len(ra)),
+            "ra": np.asarray(ra, dtype=float),
+            "dec": np.asarray(dec, dtype=float),
+            "phot_g_mean_mag": np.asarray(g_mag, dtype=float),
+        }
+    )
+
+
+def test_tiles_cover_the_sky(tmp_path):
+    index = GaiaTileIndex(str(tmp_path), tile_size=1.0, fetch=False)
+    # A cone containing a pole overlaps a whole declination band
+    pole_tiles = index.tiles_for_cone(0.0, 89.9, 0.5)
+    assert {tile[0] for tile in pole_tiles} == {index.num_bands - 1}
+    assert len(pole_tiles) == index._num_cells(index.num_bands - 1)
+    # A cone across ra = 0 wraps around
+    cells = {cell for band, cell in index.tiles_for_cone(0.0, 0.0, 0.2)}
+    assert cells == {0, index._num_cells(90) - 1}
+
+
+def test_cone_search(tmp_path):
+    index = GaiaTileIndex(str(tmp_path), tile_size=1.0, gmax=21.0, fetch=False)
+    sources = make_sources(
+        [10.2, 10.25, 10.9, 10.21], [5.5, 5.5, 5.5, 5.51], [12, 22, 15, 20]
+    )
+    for tile in index.tiles_for_cone(10.2, 5.5, 0.1):
+        index.save_tile(tile, sources)
+    results = index.cone_search(10.2, 5.5, 0.1, gmax=21.0)
+    # Closest first, without the faint source or the one outside of the cone
+    assert list(results["source_id"]) == [0, 3]
+    assert results["dist"][0] == pytest.approx(0.0, abs=1e-9)
+    nearest = index.cone_search(10.2, 5.5, 0.1, gmax=21.0, row_limit=1)
+    assert list(nearest["source_id"]) == [0]
+    # The index cannot answer searches deeper than its own magnitude limit
+    assert index.cone_search(10.2, 5.5, 0.1, gmax=22.0) is None
+
+
+def test_missing_tiles_are_fetched_in_the_background(tmp_path):
+    index = GaiaTileIndex(str(tmp_path), tile_size=1.0, fetch=True)
+    release = threading.Event()
+    fetched = []
+
+    def fetch_tile(tile):
+        release.wait(5.0)
+        fetched.append(tile)
+        index.save_tile(tile, make_sources([10.2], [5.5], [12.0]))
+
+    index._fetch_tile = fetch_tile
+    # The search does not wait for the download (it goes to the Gaia archive instead)
+    assert index.cone_search(10.2, 5.5, 0.1) is None
+    assert index.cone_search(10.2, 5.5, 0.1) is None
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name.startswith("gaia-tile-"):
+            thread.join(5.0)
+    # Each missing tile is downloaded once
+    assert sorted(fetched) == sorted(index.tiles_for_cone(10.2, 5.5, 0.1))
+    assert list(index.cone_search(10.2, 5.5, 0.1)["source_id"]) == [0]
@@ -0,0 +1,123 @@
+"""
+Tests of the light curve binning and on-disk store (see `light_curves.py`).
+"""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import light_curves
+from light_curves import (
+    bin_light_curve,
+    bin_light_curve_arrays,
+    load_light_curve,
+    purge_expired,
+    save_light_curve,
+)
+
+
+def make_light_curve(num_points=10):
+    t = np.linspace(0.0, 1.0, num_points)
+    return {
+        "x_sim_castor": t,
+        "y_sim_castor": np.sin(t),
+        "y_error": np.full(num_points, 0.1),
+        "x_transit_model": np.linspace(0.0, 1.0, 5),
+        "y_transit_model": np.zeros(5),
+        "xlim": [0.0, 1.0],
+    }
+
+
+def test_bin_light_curve():
+    t = np.arange(7.0)
+    fl = np.arange(7.0) * 2
+    err = np.full(7, 2.0)
+    t_binned, fl_binned, err_binned = bin_light_curve(t, fl, err, 3)
+    # The last bin has a single point
+    np.testing.assert_allclose(t_binned, [1.0, 4.0, 6.0])
+    np.testing.assert_allclose(fl_binned, [2.0, 8.0, 12.0])
+    np.testing.assert_allclose(err_binned, [2.0 / np.sqrt(3), 2.0 / np.sqrt(3), 2.0])
+
+
+@pytest.mark.parametrize("nbin", [0, 1])
+def test_bin_light_curve_without_binning(nbin):
+    t = np.arange(4.0)
+    binned = bin_light_curve(t, t, t, nbin)
+    for arr in binned:
+        assert arr is t
+
+
+def test_bin_light_curve_in_chunks():
+    # Binning chunks of a multiple of nbin points (as the light curve stream does) gives
+    # the same result as binning the whole light curve
+    rng = np.random.default_rng(0)
+    t, fl, err = np.sort(rng.random(101)), rng.random(101), rng.random(101)
+    whole = bin_light_curve(t, fl, err, 4)
+    chunks = [
+        bin_light_curve(t[chunk], fl[chunk], err[chunk], 4)
+        for chunk in (slice(start, start + 20) for start in range(0, 101, 20))
+    ]
+    for i in range(3):
+        chunked = np.concatenate([binned[i] for binned in chunks])
+        np.testing.assert_allclose(chunked, whole[i])
+
+
+def test_bin_light_curve_arrays():
+    light_curve = make_light_curve(10)
+    binned = bin_light_curve_arrays(light_curve, 5)
+    assert len(binned["x_sim_castor"]) == 2
+    assert len(light_curve["x_sim_castor"]) == 10
+    assert binned["y_transit_model"] is light_curve["y_transit_model"]
+
+
+def test_save_load_round_trip(tmp_path):
+    light_curve = make_light_curve()
+    meta = save_light_curve(light_curve, str(tmp_path))
+    assert meta["numPoints"] == 10
+    assert meta["xlim"] == [0.0, 1.0]
+    loaded_meta, points, model = load_light_curve(meta["id"], str(tmp_path))
+    assert loaded_meta == meta
+    assert isinstance(points, np.memmap)
+    np.testing.assert_array_equal(points[:, 0], light_curve["x_sim_castor"])
+    np.testing.assert_array_equal(points[:, 1], light_curve["y_sim_castor"])
+    np.testing.assert_array_equal(points[:, 2], light_curve["y_error"])
+    np.testing.assert_array_equal(model[0], light_curve["x_transit_model"])
+    np.testing.assert_array_equal(model[1], light_curve["y_transit_model"])
+    # Saving the same light curve again returns the same ID
+    assert save_light_curve(light_curve, str(tmp_path)) == meta
+
+
+@pytest.mark.parametrize("light_curve_id", ["0" * 24, "../" + "0" * 21, "abc"])
+def test_load_missing_or_invalid(tmp_path, light_curve_id):
+    assert load_light_curve(light_curve_id, str(tmp_path)) == (None, None, None)
+
+
+def test_concurrent_saves(tmp_path):
+    light_curve = make_light_curve()
+    threads = [
+        threading.Thread(target=save_light_curve, args=(light_curve, str(tmp_path)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # No leftover temporary directories
+    (light_curve_id,) = os.listdir(tmp_path)
+    assert load_light_curve(light_curve_id, str(tmp_path))[0]["numPoints"] == 10
+
+
+def test_load_keeps_light_curve_from_expiring(tmp_path, monkeypatch):
+    monkeypatch.setattr(light_curves, "LIGHT_CURVE_TTL", 60.0)
+    meta = save_light_curve(make_light_curve(), str(tmp_path))
+    meta_path = os.path.join(str(tmp_path), meta["id"], "meta.json")
+    old = os.path.getmtime(meta_path) - 120
+    os.utime(meta_path, (old, old))
+    load_light_curve(meta["id"], str(tmp_path))
+    purge_expired(str(tmp_path))
+    assert os.listdir(tmp_path) == [meta["id"]]
+    os.utime(meta_path, (old, old))
+    purge_expired(str(tmp_path))
+    assert os.listdir(tmp_path) == []
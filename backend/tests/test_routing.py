@@ -0,0 +1,103 @@
+"""
+Tests of the request router (see `routing.Router`) and of the route table of
+`connector.py`.
+"""
+
+import pytest
+
+from routing import Router
+
+
+def make_router():
+    router = Router()
+    router.add("telescope", "telescope_handler", ["PUT"])
+    router.add("job", "job_handler", ["GET", "DELETE"], pattern=r"jobs/(?P<job_id>\w+)")
+    router.add(
+        "jobResult", "result_handler", ["GET"], pattern=r"jobs/(?P<job_id>\w+)/result"
+    )
+    router.add_files(("js", "png"), "file_handler")
+    return router
+
+
+@pytest.mark.parametrize(
+    "path", ["telescope", "/telescope", "castor/abc123/telescope", "telescope/"]
+)
+def test_plain_route_matches_last_segment(path):
+    match = make_router().resolve(path)
+    assert match.name == "telescope"
+    assert match.handler == "telescope_handler"
+    assert match.methods == frozenset(["PUT"])
+    assert match.params == {}
+
+
+def test_pattern_route_captures_parameters():
+    router = make_router()
+    match = router.resolve("castor/abc123/jobs/job42")
+    assert (match.name, match.params) == ("job", {"job_id": "job42"})
+    # Both routes use the same parameter name
+    match = router.resolve("castor/abc123/jobs/job42/result/")
+    assert (match.name, match.params) == ("jobResult", {"job_id": "job42"})
+
+
+def test_pattern_is_anchored_at_a_path_segment():
+    router = make_router()
+    assert router.resolve("castor/myjobs/job42") is None
+    assert router.resolve("jobs/job42/other") is None
+
+
+def test_plain_routes_take_precedence_over_patterns_and_files():
+    router = make_router()
+    assert router.resolve("jobs/telescope").name == "telescope"
+    router.add("main.js", "static_handler", ["GET"])
+    assert router.resolve("static/main.js").handler == "static_handler"
+
+
+def test_file_route():
+    match = make_router().resolve("static/js/main.1a2b3c.JS")
+    assert match.name == "file"
+    assert match.handler == "file_handler"
+    assert match.params == {
+        "path": "static/js/main.1a2b3c.JS",
+        "filename": "main.1a2b3c.JS",
+    }
+
+
+def test_no_match():
+    router = make_router()
+    assert router.resolve("unknown") is None
+    assert router.resolve("") is None
+
+
+def test_routes_added_after_resolve():
+    router = make_router()
+    assert router.resolve("scene/abc") is None
+    router.add("scene", "scene_handler", ["GET"], pattern=r"scene/(?P<scene_id>\w+)")
+    assert router.resolve("scene/abc").params == {"scene_id": "abc"}
+
+
+@pytest.mark.parametrize(
+    "path, name, params",
+    [
+        ("castor/s/photometrySweep", "photometrySweep", {}),
+        ("castor/s/transit", "transit", {}),
+        (
+            "castor/s/transit/lightcurve/0123abcd",
+            "transitLightCurve",
+            {"light_curve_id": "0123abcd"},
+        ),
+        ("castor/s/transit/scene/0123abcd", "transitScene", {"scene_id": "0123abcd"}),
+        (
+            "castor/s/transit/scene/0123abcd/2/3/4",
+            "transitSceneTile",
+            {"scene_id": "0123abcd", "level": "2", "tile_x": "3", "tile_y": "4"},
+        ),
+        ("castor/s/jobs/a-b_c", "job", {"job_id": "a-b_c"}),
+        ("castor/s/jobs/a-b_c/result", "jobResult", {"job_id": "a-b_c"}),
+    ],
+)
+def test_connector_routes(path, name, params):
+    from connector import router
+
+    match = router.resolve(path)
+    assert match.name == name
+    assert match.params == params
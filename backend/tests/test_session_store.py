@@ -0,0 +1,76 @@
+"""
+Tests of the disk session backend (see `session_store.DiskBackend`).
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from session_store import DiskBackend, is_valid_session_id, new_session_id
+
+
+def test_round_trip(tmp_path):
+    backend = DiskBackend(str(tmp_path))
+    session_id = new_session_id()
+    data = {"source_key": "abc", "array": np.arange(5.0)}
+    backend.save(session_id, data)
+    # A second backend (i.e., another worker) reads the pickled session from disk
+    loaded = DiskBackend(str(tmp_path)).load(session_id)
+    assert loaded["source_key"] == "abc"
+    np.testing.assert_array_equal(loaded["array"], data["array"])
+
+
+def test_load_missing_and_deleted(tmp_path):
+    backend = DiskBackend(str(tmp_path))
+    session_id = new_session_id()
+    assert backend.load(session_id) is None
+    backend.save(session_id, {"a": 1})
+    backend.delete(session_id)
+    assert backend.load(session_id) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_expired_session_is_discarded(tmp_path):
+    backend = DiskBackend(str(tmp_path), ttl=60)
+    session_id = new_session_id()
+    backend.save(session_id, {"a": 1})
+    path = os.path.join(str(tmp_path), session_id + ".pkl")
+    old = os.path.getmtime(path) - 120
+    os.utime(path, (old, old))
+    assert backend.load(session_id) is None
+    assert not os.path.exists(path)
+
+
+def test_purge_expired(tmp_path):
+    backend = DiskBackend(str(tmp_path), ttl=60)
+    fresh, stale = new_session_id(), new_session_id()
+    backend.save(fresh, {"a": 1})
+    backend.save(stale, {"a": 2})
+    path = os.path.join(str(tmp_path), stale + ".pkl")
+    old = os.path.getmtime(path) - 120
+    os.utime(path, (old, old))
+    backend.purge_expired()
+    assert sorted(os.listdir(tmp_path)) == [fresh + ".pkl"]
+
+
+def test_concurrent_saves_leave_no_temporary_files(tmp_path):
+    backend = DiskBackend(str(tmp_path))
+    session_id = new_session_id()
+    threads = [
+        threading.Thread(target=backend.save, args=(session_id, {"i": i}))
+        for i in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert os.listdir(tmp_path) == [session_id + ".pkl"]
+    assert backend.load(session_id)["i"] in range(16)
+
+
+def test_session_id_format():
+    assert is_valid_session_id(new_session_id())
+    assert not is_valid_session_id("../../etc/passwd")
+    assert not is_valid_session_id("short")
+    assert not is_valid_session_id(None)
@@ -0,0 +1,167 @@
+"""
+Tests of the fitted exposure time sweeps and their fallbacks (see `sweeps.py`).
+"""
+
+import numpy as np
+import pytest
+
+from sweeps import copy_grism, sweep_grism_snr, sweep_snr_or_t
+
+
+class FakePhotometry:
+    """
+    Stand-in for a `Photometry` object with an aperture, following the CCD equation in
+    the "uv" and "u" passbands. The "g" passband has an extra term (so the fit fails)
+    and the "z" passband has no signal.
+    """
+
+    rates = {"uv": (5.0, 20.0, 30.0), "u": (50.0, 10.0, 12.0), "g": (8.0, 3.0, 4.0)}
+
+    def __init__(self, passbands=("uv", "u", "g", "z")):
+        self.passbands = passbands
+        self.num_calls = 0
+
+    def _snr(self, band, t):
+        if band == "z":
+            return np.nan
+        source, background, read = self.rates[band]
+        variance = (source + background) * t + read
+        if band == "g":
+            variance += 1e-3 * t**2
+        return source * t / np.sqrt(variance)
+
+    def _t(self, band, snr):
+        if band == "z":
+            return np.nan
+        # (the SNR increases with t, so bisect in log t)
+        lo, hi = -6.0, 12.0
+        for _ in range(200):
+            mid = 0.5 * (lo + hi)
+            lo, hi = (mid, hi) if self._snr(band, 10**mid) < snr else (lo, mid)
+        return 10 ** (0.5 * (lo + hi))
+
+    def calc_snr_or_t(self, t=None, snr=None, reddening=0.0):
+        self.num_calls += 1
+        if t is not None:
+            return {band: self._snr(band, t) for band in self.passbands}
+        return {band: self._t(band, snr) for band in self.passbands}
+
+
+@pytest.mark.parametrize("val_type", ["t", "snr"])
+def test_sweep_snr_or_t_matches_calc_snr_or_t(val_type):
+    PhotometryObj = FakePhotometry()
+    vals = np.array([5.0, 10.0, 50.0]) if val_type == "snr" else np.logspace(0, 4, 6)
+    passbands, table = sweep_snr_or_t(PhotometryObj, val_type, vals, 0.0)
+    assert passbands == ["uv", "u", "g", "z"]
+    assert table.shape == (vals.size, 4)
+    expected = np.array(
+        [
+            [PhotometryObj.calc_snr_or_t(**{val_type: val})[band] for band in passbands]
+            for val in vals
+        ]
+    )
+    np.testing.assert_allclose(table, expected, rtol=1e-6, equal_nan=True)
+    assert np.isnan(table[:, 3]).all()
+
+
+def test_sweep_snr_or_t_only_falls_back_when_the_fit_fails():
+    vals = np.logspace(0, 4, 50)
+    PhotometryObj = FakePhotometry()
+    sweep_snr_or_t(PhotometryObj, "t", vals, 0.0)
+    # Two fit calls, one check call, and one call per value for the "g" and "z" bands
+    assert PhotometryObj.num_calls == 3 + vals.size
+
+
+def test_sweep_snr_or_t_without_fallback():
+    PhotometryObj = FakePhotometry(passbands=("uv", "u"))
+    vals = np.logspace(0, 4, 50)
+    passbands, table = sweep_snr_or_t(PhotometryObj, "t", vals, 0.0)
+    assert passbands == ["uv", "u"]
+    assert PhotometryObj.num_calls == 3
+    expected = [[PhotometryObj._snr(band, t) for band in passbands] for t in vals]
+    np.testing.assert_allclose(table, expected, rtol=1e-9)
+
+
+class FakeTelescope:
+    dark_current = 0.01  # e-/s/pixel
+
+
+class FakeGrism:
+    """
+    Stand-in for a dispersed `Grism` object: per-pixel source and background rates, dark
+    current, and read noise, optionally with a noise term that is not linear in the
+    exposure time (so the fit fails).
+    """
+
+    def __init__(self, TelescopeObj, nonlinear=False):
+        rng = np.random.default_rng(1)
+        self.TelescopeObj = TelescopeObj
+        self.source_image = np.ones((5, 5))
+        self.source_rate = rng.random((11, 20))
+        self.background_rate = np.full((11, 20), 0.3)
+        self.nonlinear = nonlinear
+
+    def expose(self, exposure_time):
+        self.exposure_time = exposure_time
+        self.integrated_grism_box_count = self.source_rate * exposure_time
+
+    def total_noise(self, Nreads=1, Nbin=1):
+        t = self.exposure_time
+        variance = (
+            self.integrated_grism_box_count
+            + self.background_rate * t
+            + Nbin * self.TelescopeObj.dark_current * t
+            + Nreads * Nbin * 4.0**2
+        )
+        if self.nonlinear:
+            variance = variance + 1e-4 * t**2
+        self.grism_noise_total = np.sqrt(variance)
+
+
+def simulated_snr_1d(GrismObj, exposure_time, nreads, nbin):
+    GrismObj.expose(exposure_time)
+    GrismObj.total_noise(Nreads=nreads, Nbin=nbin)
+    rows = slice(3, 8)
+    signal = np.sum(GrismObj.integrated_grism_box_count[rows], axis=0)
+    noise = np.sqrt(np.sum(GrismObj.grism_noise_total[rows] ** 2, axis=0))
+    return signal / noise
+
+
+@pytest.mark.parametrize("nonlinear", [False, True])
+def test_sweep_grism_snr_matches_simulation(nonlinear):
+    TelescopeObj = FakeTelescope()
+    GrismObj = FakeGrism(TelescopeObj, nonlinear=nonlinear)
+    exposure_times = np.logspace(0, 4, 7)
+    sweep = sweep_grism_snr(
+        GrismObj, exposure_times, nreads=2, nbin=3, shared=(TelescopeObj,)
+    )
+    expected = [
+        simulated_snr_1d(FakeGrism(TelescopeObj, nonlinear), t, 2, 3)
+        for t in exposure_times
+    ]
+    np.testing.assert_allclose(sweep["snr1d"], expected, rtol=1e-9)
+    np.testing.assert_array_equal(sweep["grism1dx"], np.arange(20))
+
+
+def test_sweep_grism_snr_components():
+    TelescopeObj = FakeTelescope()
+    GrismObj = FakeGrism(TelescopeObj)
+    sweep = sweep_grism_snr(GrismObj, np.array([10.0]), nreads=2, nbin=3)
+    # Sums over the 5 source rows
+    np.testing.assert_allclose(
+        sweep["sourceRate"], np.sum(GrismObj.source_rate[3:8], axis=0)
+    )
+    np.testing.assert_allclose(sweep["backgroundRate"], 5 * 0.3)
+    np.testing.assert_allclose(sweep["darkRate"], 5 * 3 * 0.01)
+    np.testing.assert_allclose(sweep["readVariance"], 5 * 2 * 3 * 4.0**2)
+    # The shared telescope and the dispersed object are not modified
+    assert TelescopeObj.dark_current == 0.01
+    assert not hasattr(GrismObj, "integrated_grism_box_count")
+
+
+def test_copy_grism_shares_objects():
+    TelescopeObj = FakeTelescope()
+    GrismObj = FakeGrism(TelescopeObj)
+    copied = copy_grism(GrismObj, (TelescopeObj,))
+    assert copied.TelescopeObj is TelescopeObj
+    assert copied.source_rate is not GrismObj.source_rate
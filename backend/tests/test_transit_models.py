@@ -0,0 +1,107 @@
+"""
+Tests of the vectorized transit models of planet model grids (see
+`transit_models.py`).
+"""
+
+import numpy as np
+import pytest
+
+from transit_models import (
+    fit_quadratic_limb_darkening,
+    occulted_intensity,
+    projected_separation,
+    quadratic_transit_models,
+)
+
+
+def uniform_overlap_area(z, p):
+    """
+    Exact area of the stellar disk (radius 1) hidden by a planet of radius p at
+    separation z.
+    """
+    if z >= 1 + p:
+        return 0.0
+    if z <= 1 - p:
+        return np.pi * p**2
+    kappa_0 = np.arccos((p**2 + z**2 - 1) / (2 * p * z))
+    kappa_1 = np.arccos((1 - p**2 + z**2) / (2 * z))
+    return p**2 * kappa_0 + kappa_1 - 0.5 * np.sqrt(4 * z**2 - (1 + z**2 - p**2) ** 2)
+
+
+def brute_force_depth(z, p, u1, u2, num=2000):
+    """
+    Transit depth of a quadratically limb-darkened star by summing pixels.
+    """
+    x = np.linspace(z - p, z + p, num)
+    y = np.linspace(-p, p, num)
+    x, y = np.meshgrid(x, y)
+    r_sq = x**2 + y**2
+    behind = ((x - z) ** 2 + y**2 < p**2) & (r_sq < 1)
+    one_minus_mu = 1 - np.sqrt(np.clip(1 - r_sq, 0, 1))
+    intensity = 1 - u1 * one_minus_mu - u2 * one_minus_mu**2
+    pixel_area = (2 * p / (num - 1)) ** 2
+    return np.sum(intensity * behind) * pixel_area / (np.pi * (1 - u1 / 3 - u2 / 6))
+
+
+def test_projected_separation():
+    # At mid-transit the separation is the impact parameter, and the planet is behind
+    # the star half an orbit later
+    z = projected_separation(np.array([0.0, 1.5, 0.75]), 3.0, 0.0, 0.4, 10.0)
+    assert z[0] == pytest.approx(0.4)
+    assert z[1] == np.inf
+    assert z[2] == pytest.approx(10.0)
+
+
+@pytest.mark.parametrize("p", [0.01, 0.1, 0.3])
+def test_uniform_disk_matches_exact_overlap(p):
+    z = np.array([0.0, p / 2, 0.5, 1 - p, 1.0, 1 + p / 2, 1 + p, 1.5])
+    occulted = occulted_intensity(z, np.full(z.size, p))[0]
+    expected = [uniform_overlap_area(value, p) for value in z]
+    np.testing.assert_allclose(occulted, expected, rtol=1e-5, atol=1e-12)
+
+
+@pytest.mark.parametrize("b", [0.0, 0.5, 0.92, 1.02])
+def test_quadratic_limb_darkening_matches_brute_force(b):
+    u1, u2 = 0.4, 0.25
+    model = quadratic_transit_models(
+        np.array([0.0]), [0.1], [3.0], [0.0], [b], [10.0], u1, u2
+    )
+    assert -model[0, 0] == pytest.approx(brute_force_depth(b, 0.1, u1, u2), rel=2e-3)
+
+
+def test_grid_matches_single_models():
+    t = np.linspace(-0.2, 0.2, 400)
+    rprs = np.array([0.05, 0.1, 0.1, 0.15])
+    b = np.array([0.0, 0.3, 0.9, 0.5])
+    ars = np.array([8.0, 10.0, 12.0, 10.0])
+    period, t0 = np.full(4, 3.0), np.zeros(4)
+    grid = quadratic_transit_models(t, rprs, period, t0, b, ars, 0.3, 0.2)
+    assert grid.shape == (4, t.size)
+    for i in range(4):
+        z = projected_separation(t, 3.0, 0.0, b[i], ars[i])
+        behind = z < 1 + rprs[i]
+        occulted = occulted_intensity(z[behind], np.full(np.sum(behind), rprs[i]))
+        expected = np.zeros(t.size)
+        expected[behind] = -(occulted[0] - 0.3 * occulted[1] - 0.2 * occulted[2]) / (
+            np.pi * (1 - 0.3 / 3 - 0.2 / 6)
+        )
+        np.testing.assert_allclose(grid[i], expected, rtol=0, atol=1e-4 * rprs[i] ** 2)
+    # Out of transit the flux does not change
+    assert grid[:, 0].tolist() == [0.0] * 4
+
+
+def test_fit_quadratic_limb_darkening():
+    t = np.linspace(-0.2, 0.2, 500)
+    (model,) = quadratic_transit_models(
+        t, [0.1], [3.0], [0.0], [0.3], [10.0], 0.4, 0.25
+    )
+    u1, u2 = fit_quadratic_limb_darkening(t, model, 0.1, 3.0, 0.0, 0.3, 10.0)
+    assert u1 == pytest.approx(0.4, abs=1e-4)
+    assert u2 == pytest.approx(0.25, abs=1e-4)
+
+
+def test_fit_quadratic_limb_darkening_without_transit():
+    t = np.linspace(1.0, 1.2, 100)  # the transit is at t = 0
+    assert fit_quadratic_limb_darkening(
+        t, np.zeros(t.size), 0.1, 3.0, 0.0, 0.3, 10.0
+    ) == (None, None)
@@ -0,0 +1,122 @@
+"""
+Tests of the JSON serialization and the array encodings of the responses (see
+`utils.py`).
+"""
+
+import base64
+import json
+
+import astropy.units as u
+import numpy as np
+import pytest
+
+import utils
+from utils import (
+    app,
+    dumps,
+    dumps_bytes,
+    encode_2d_array,
+    encode_binary_array,
+    wants_binary_arrays,
+)
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    """
+    Run a test with orjson (if installed) and with the standard library fallback.
+    """
+    if request.param == "orjson":
+        if utils.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(utils, "orjson", None)
+    return request.param
+
+
+def decode_binary_array(encoded):
+    data = base64.b64decode(encoded["data"])
+    return np.frombuffer(data, dtype=encoded["dtype"]).reshape(encoded["shape"])
+
+
+def test_binary_array_round_trip():
+    arr = np.arange(12.0).reshape(3, 4)
+    encoded = encode_binary_array(arr)
+    assert encoded["dtype"] == "<f4"
+    assert encoded["shape"] == [3, 4]
+    np.testing.assert_array_equal(decode_binary_array(encoded), arr)
+
+
+def test_binary_array_keeps_non_finite_values():
+    arr = np.array([[1.0, np.nan], [np.inf, -np.inf]])
+    np.testing.assert_array_equal(decode_binary_array(encode_binary_array(arr)), arr)
+
+
+def test_binary_array_converts_dtype_and_layout():
+    # Big-endian, Fortran-ordered float64 is sent as C-ordered, little-endian float32
+    arr = np.asfortranarray(np.arange(6, dtype=">f8").reshape(2, 3))
+    decoded = decode_binary_array(encode_binary_array(arr))
+    assert decoded.dtype == np.dtype("<f4")
+    np.testing.assert_array_equal(decoded, np.arange(6.0).reshape(2, 3))
+
+
+def test_binary_arrays_only_with_format_binary():
+    for query, expected in (
+        ("", False),
+        ("?format=binary", True),
+        ("?format=BINARY", True),
+        ("?format=json", False),
+    ):
+        with app.test_request_context("/grism" + query):
+            assert wants_binary_arrays() is expected
+    # The binary encoding is not negotiated with the Accept header
+    with app.test_request_context(
+        "/grism", headers={"Accept": "application/octet-stream"}
+    ):
+        assert wants_binary_arrays() is False
+        assert isinstance(encode_2d_array(np.zeros((2, 2))), str)
+    with app.test_request_context("/grism?format=binary"):
+        assert isinstance(encode_2d_array(np.zeros((2, 2))), dict)
+
+
+def test_dumps_replaces_non_finite_values_with_null(encoder):
+    obj = {
+        "list": [1.0, float("nan"), float("inf")],
+        "array": np.array([[1.0, np.nan], [-np.inf, 2.5]]),
+        "scalar": np.float64("nan"),
+    }
+    assert json.loads(dumps(obj)) == {
+        "list": [1.0, None, None],
+        "array": [[1.0, None], [None, 2.5]],
+        "scalar": None,
+    }
+
+
+def test_dumps_numpy_and_astropy_types(encoder):
+    obj = {
+        "float32": np.array([0.1, np.nan], dtype=np.float32),
+        "int": np.arange(3),
+        "bool": np.bool_(True),
+        "zero_dim": np.array(2.0),
+        "non_contiguous": np.arange(6.0).reshape(2, 3)[:, ::2],
+        "quantity": np.array([1.0, np.nan]) * u.nm,
+    }
+    decoded = json.loads(dumps(obj))
+    assert decoded["float32"][0] == pytest.approx(0.1)
+    assert decoded["float32"][1] is None
+    assert decoded["int"] == [0, 1, 2]
+    assert decoded["bool"] is True
+    assert decoded["zero_dim"] == 2.0
+    assert decoded["non_contiguous"] == [[0.0, 2.0], [3.0, 5.0]]
+    assert decoded["quantity"] == [1.0, None]
+
+
+def test_dumps_is_strict_json(encoder):
+    encoded = dumps_bytes({"a": [np.nan, np.inf]})
+    assert isinstance(encoded, bytes)
+    assert b"NaN" not in encoded and b"Infinity" not in encoded
+
+
+def test_dumps_rejects_unknown_objects(encoder):
+    with pytest.raises(TypeError):
+        dumps({"a": object()})
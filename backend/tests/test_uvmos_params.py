@@ -0,0 +1,88 @@
+"""
+Tests of the parsing of the UVMOS request parameters (see `extraction.py`).
+"""
+
+import astropy.units as u
+import numpy as np
+import pytest
+
+from extraction import parse_extraction_box, parse_snr_wavelengths
+
+
+def test_extraction_box_in_pixels():
+    extraction_box = {
+        "width": "3",
+        "heightLowerLim": "5.0",
+        "heightUpperLim": "12",
+        "units": "pixel",
+    }
+    assert parse_extraction_box(extraction_box, 0.1) == {
+        "extraction_width": 3,
+        "extraction_lowerlim": 5,
+        "extraction_upperlim": 12,
+    }
+
+
+def test_extraction_box_in_arcsec():
+    # 0.6 / 0.1 = 5.999999999999999 must give 6 pixels, not 5
+    extraction_box = {
+        "width": "0.6",
+        "heightLowerLim": "0.3",
+        "heightUpperLim": "1.24",
+        "units": "arcsec",
+    }
+    assert parse_extraction_box(extraction_box, 0.1) == {
+        "extraction_width": 6,
+        "extraction_lowerlim": 3,
+        "extraction_upperlim": 12,
+    }
+
+
+def test_extraction_box_without_upper_limit():
+    extraction_box = {
+        "width": "2",
+        "heightLowerLim": "4",
+        "heightUpperLim": "",
+        "units": "pixel",
+    }
+    assert parse_extraction_box(extraction_box, 0.1) == {
+        "extraction_width": 2,
+        "extraction_lowerlim": 4,
+    }
+
+
+def test_extraction_box_invalid():
+    extraction_box = {
+        "width": "wide",
+        "heightLowerLim": "4",
+        "heightUpperLim": "",
+        "units": "pixel",
+    }
+    with pytest.raises(ValueError):
+        parse_extraction_box(extraction_box, 0.1)
+
+
+def test_snr_wavelengths_all():
+    assert parse_snr_wavelengths("all") is None
+    assert parse_snr_wavelengths("ALL") is None
+
+
+def test_snr_wavelength_scalar():
+    wave = parse_snr_wavelengths("250.5")
+    assert wave.unit == u.nm
+    assert wave.ndim == 0
+    assert wave.value == 250.5
+
+
+def test_snr_wavelength_list():
+    wave = parse_snr_wavelengths([200, "250", 300.5])
+    assert wave.unit == u.nm
+    np.testing.assert_array_equal(wave.value, [200.0, 250.0, 300.5])
+
+
+@pytest.mark.parametrize(
+    "wavelength", [[], [[200.0, 300.0]], -10.0, 0.0, "nan", [200.0, "inf"], "blue"]
+)
+def test_snr_wavelengths_invalid(wavelength):
+    with pytest.raises(ValueError):
+        parse_snr_wavelengths(wavelength)
@@ -0,0 +1,256 @@
+"""
+transit_models.py
+
+Vectorized transit light curve models for planet model grids (no castor_etc dependency).
+
+---
+
+        GNU General Public License v3 (GNU GPLv3)
+
+(c) 2022.                            (c) 2022.
+Government of Canada                 Gouvernement du Canada
+National Research Council            Conseil national de recherches
+Ottawa, Canada, K1A 0R6              Ottawa, Canada, K1A 0R6
+All rights reserved                  Tous droits réservés
+
+NRC disclaims any warranties,        Le CNRC dénie toute garantie
+expressed, implied, or               énoncée, implicite ou légale,
+statutory, of any kind with          de quelque nature que ce
+respect to the software,             soit, concernant le logiciel,
+including without limitation         y compris sans restriction
+any warranty of merchantability      toute garantie de valeur
+or fitness for a particular          marchande ou de pertinence
+purpose. NRC shall not be            pour un usage particulier.
+liable in any event for any          Le CNRC ne pourra en aucun cas
+damages, whether direct or           être tenu responsable de tout
+indirect, special or general,        dommage, direct ou indirect,
+consequential or incidental,         particulier ou général,
+arising from the use of the          accessoire ou fortuit, résultant
+software. Neither the name           de l'utilisation du logiciel. Ni
+of the National Research             le nom du Conseil National de
+Council of Canada nor the            Recherches du Canada ni les noms
+names of its contributors may        de ses  participants ne peuvent
+be used to endorse or promote        être utilisés pour approuver ou
+products derived from this           promouvoir les produits dérivés
+software without specific prior      de ce logiciel sans autorisation
+written permission.                  préalable et particulière
+                                     par écrit.
+
+This file is part of the             Ce fichier fait partie du projet
+FORECASTOR ETC GUI project.          FORECASTOR ETC GUI.
+
+FORECASTOR ETC GUI is free           FORECASTOR ETC GUI est un logiciel
+software: you can redistribute       libre ; vous pouvez le redistribuer
+it and/or modify it under the        ou le modifier suivant les termes
+terms of the GNU General Public      de la "GNU General Public
+License as published by the          License" telle que publiée
+Free Software Foundation,            par la Free Software Foundation :
+either version 3 of the              soit la version 3 de cette
+License, or (at your option)         licence, soit (à votre gré)
+any later version.                   toute version ultérieure.
+
+FORECASTOR ETC GUI is distributed    FORECASTOR ETC GUI est distribué
+in the hope that it will be          dans l'espoir qu'il vous
+useful, but WITHOUT ANY WARRANTY;    sera utile, mais SANS AUCUNE
+without even the implied warranty    GARANTIE : sans même la garantie
+of MERCHANTABILITY or FITNESS FOR    implicite de COMMERCIALISABILITÉ
+A PARTICULAR PURPOSE. See the        ni d'ADÉQUATION À UN OBJECTIF
+GNU General Public License for       PARTICULIER. Consultez la Licence
+more details.                        Générale Publique GNU pour plus
+                                     de détails.
+
+You should have received a copy      Vous devriez avoir reçu une copie
+of the GNU General Public            de la Licence Générale Publique
+License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
+ETC GUI. If not, see                 ce n'est pas le cas, consultez :
+<http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
+"""
+
+import numpy as np
+
+# Nodes of the radial integration over the part of the stellar disk behind the planet
+NUM_RADIAL_NODES = 256
+# Separations at which the hidden intensity of each planet size is integrated
+NUM_SEPARATION_NODES = 2048
+
+
+def projected_separation(t, period, t0, b, ars):
+    """
+    Sky-projected planet-star separation of a circular orbit.
+
+    Parameters
+    ----------
+      t :: array of floats
+        The times (same units as `period` and `t0`).
+
+      period, t0, b, ars :: arrays of floats
+        The orbital period, mid-transit time, impact parameter, and semi-major axis (in
+        stellar radii). All inputs are broadcast against each other.
+
+    Returns
+    -------
+      z :: array of floats
+        The separation in stellar radii, set to infinity when the planet is behind the
+        star.
+    """
+    phase = 2.0 * np.pi * (np.asarray(t) - t0) / period
+    z = np.hypot(ars * np.sin(phase), b * np.cos(phase))
+    return np.where(np.cos(phase) > 0, z, np.inf)
+
+
+def occulted_intensity(z, rprs, num_nodes=NUM_RADIAL_NODES):
+    """
+    Intensity of the stellar disk hidden by the planet, for the surface brightness
+    profiles 1, (1 - mu), and (1 - mu)**2 (i.e., the terms of the quadratic limb
+    darkening law), like batman's integration over annuli.
+
+    The annuli that lie entirely behind the planet (radii below rprs - z) are integrated
+    analytically. The annuli that the planet partly overlaps, i.e., radii between
+    |z - rprs| and z + rprs, are integrated numerically, with nodes clustered towards
+    both ends where the integrand has square-root singularities.
+
+    Parameters
+    ----------
+      z, rprs :: 1D arrays of floats
+        The projected separations (see `projected_separation()`) and planet-to-star
+        radius ratios of the points to evaluate.
+
+      num_nodes :: int
+        The number of radial integration nodes.
+
+    Returns
+    -------
+      occulted :: 2D array of floats
+        The (3, number of points) hidden intensities, in units of the intensity at the
+        centre of the disk times the stellar radius squared.
+    """
+    z = np.asarray(z, dtype=float)[:, np.newaxis]
+    rprs = np.asarray(rprs, dtype=float)[:, np.newaxis]
+    #
+    # Disk of radius a fully behind the planet
+    #
+    a_sq = np.clip(rprs - z, 0.0, 1.0) ** 2
+    mu_cubed = (1.0 - a_sq) ** 1.5
+    covered = np.pi * np.stack(
+        [
+            a_sq,
+            a_sq - 2.0 / 3.0 * (1.0 - mu_cubed),
+            2.0 * a_sq - 0.5 * a_sq**2 - 4.0 / 3.0 * (1.0 - mu_cubed),
+        ]
+    )[:, :, 0]
+    #
+    # Annuli partly behind the planet
+    #
+    r_min = np.minimum(np.abs(z - rprs), 1.0)
+    r_max = np.minimum(z + rprs, 1.0)
+    # Midpoint rule in s, with r = r_min + (r_max - r_min) * (1 - cos(pi * s)) / 2
+    s = (np.arange(num_nodes) + 0.5) / num_nodes
+    r = r_min + (r_max - r_min) * (0.5 - 0.5 * np.cos(np.pi * s))
+    dr = (r_max - r_min) * (0.5 * np.pi / num_nodes) * np.sin(np.pi * s)
+    # Angle of the annulus of radius r hidden by the planet
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_half_angle = (r**2 + z**2 - rprs**2) / (2.0 * r * z)
+    cos_half_angle = np.where(z == 0.0, 1.0, cos_half_angle)
+    weight = 2.0 * np.arccos(np.clip(cos_half_angle, -1.0, 1.0)) * r * dr
+    one_minus_mu = 1.0 - np.sqrt(np.clip(1.0 - r**2, 0.0, 1.0))
+    return covered + np.stack(
+        [
+            np.sum(weight, axis=1),
+            np.sum(weight * one_minus_mu, axis=1),
+            np.sum(weight * one_minus_mu**2, axis=1),
+        ]
+    )
+
+
+def _occulted_intensity_grid(z, rprs):
+    """
+    `occulted_intensity()` of (number of models, number of times) separations `z` and
+    (number of models,) `rprs`.
+
+    The hidden intensity of a planet only depends on its separation, so it is integrated
+    once per distinct `rprs` at `NUM_SEPARATION_NODES` separations from 0 to 1 + rprs
+    (incl. the separation 1 - rprs at which the planet starts to cross the limb) and
+    linearly interpolated to all the other points.
+    """
+    rprs = np.asarray(rprs, dtype=float)
+    occulted = np.zeros((3,) + z.shape)
+    for value in np.unique(rprs):
+        rows = np.flatnonzero(rprs == value)
+        z_nodes = np.linspace(0.0, 1.0 + value, NUM_SEPARATION_NODES)
+        z_nodes = np.union1d(z_nodes, [abs(1.0 - value)])
+        occulted_nodes = occulted_intensity(z_nodes, np.full(z_nodes.size, value))
+        z_rows = z[rows]
+        for i in range(3):
+            occulted[i, rows] = np.interp(
+                z_rows, z_nodes, occulted_nodes[i], right=0.0
+            )
+    return occulted
+
+
+def quadratic_transit_models(t, rprs, period, t0, b, ars, u1, u2):
+    """
+    Evaluate the transit light curves of many planets at once, for a star with the
+    quadratic limb darkening law I(mu) = 1 - u1 * (1 - mu) - u2 * (1 - mu)**2.
+
+    Parameters
+    ----------
+      t :: 1D array of floats
+        The times.
+
+      rprs, period, t0, b, ars :: 1D arrays of floats
+        The parameters of each model (see `projected_separation()`).
+
+      u1, u2 :: float
+        The limb darkening coefficients.
+
+    Returns
+    -------
+      models :: 2D array of floats
+        The (number of models, number of times) relative change in flux, i.e., 0 out of
+        transit and -depth at mid-transit.
+    """
+    params = [
+        np.asarray(param, dtype=float)[:, np.newaxis] for param in (period, t0, b, ars)
+    ]
+    z = projected_separation(np.asarray(t, dtype=float)[np.newaxis, :], *params)
+    occulted = _occulted_intensity_grid(z, rprs)
+    total = np.pi * (1.0 - u1 / 3.0 - u2 / 6.0)
+    return -(occulted[0] - u1 * occulted[1] - u2 * occulted[2]) / total
+
+
+def fit_quadratic_limb_darkening(t, model, rprs, period, t0, b, ars):
+    """
+    Find the quadratic limb darkening coefficients that reproduce a transit light curve
+    computed by another code, by linear least squares (the hidden and total intensities
+    are both linear in u1 and u2).
+
+    Parameters
+    ----------
+      t, model :: 1D arrays of floats
+        The times and relative change in flux (see `quadratic_transit_models()`) of the
+        reference light curve.
+
+      rprs, period, t0, b, ars :: float
+        The planet of the reference light curve.
+
+    Returns
+    -------
+      u1, u2 :: floats or None
+        The limb darkening coefficients, or None if the reference light curve has no
+        transit to fit.
+    """
+    t = np.asarray(t, dtype=float)
+    depth = -np.asarray(model, dtype=float)
+    z = projected_separation(t, period, t0, b, ars)
+    in_transit = (z < 1.0 + rprs) & np.isfinite(depth)
+    if not np.any(in_transit):
+        return None, None
+    occulted = occulted_intensity(z[in_transit], np.full(np.sum(in_transit), rprs))
+    depth = depth[in_transit]
+    # depth * pi * (1 - u1/3 - u2/6) = B0 - u1 * B1 - u2 * B2
+    design = np.column_stack(
+        [occulted[1] - depth * np.pi / 3.0, occulted[2] - depth * np.pi / 6.0]
+    )
+    target = occulted[0] - depth * np.pi
+    (u1, u2), *_ = np.linalg.lstsq(design, target, rcond=None)
+    return float(u1), float(u2)
@@ -66,19 +66,52 @@ ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
 
+import os
+
 import astropy.units as u
 from castor_etc.transit import Observation
 
-from flask import jsonify, request
-import pandas as pd
+from flask import Response, jsonify, request
 import numpy as np
 
-from utils import DataHolder, app, bad_request, server_error, logger, log_traceback
-
-import zlib, json, base64
+import gaia_index  # answers Gaia cone searches from the local index
+from jobs import submit_job, wants_async
+from light_curves import (
+    bin_light_curve,
+    bin_light_curve_arrays,
+    load_light_curve,
+    save_light_curve,
+)
+from scene_tiles import save_scene
+from transit_models import fit_quadratic_limb_darkening, quadratic_transit_models
+from utils import (
+    bad_request,
+    dumps_bytes,
+    not_found,
+    server_error,
+    logger,
+    log_traceback,
+    get_data_holder,
+)
+
+# The default number of light curve points per line of `get_light_curve_stream()`
+LIGHT_CURVE_CHUNK_SIZE = int(os.getenv("ETC_LIGHT_CURVE_CHUNK_SIZE", "5000"))
+
+# The maximum number of planet models in a `planetModelGrid` request
+PLANET_GRID_MAX_SIZE = int(os.getenv("ETC_PLANET_GRID_MAX_SIZE", "1000"))
+
+# The planet model parameters of a transit request, in the order of
+# `Observation.specify_pl_model()`
+PLANET_PARAMETERS = ("rprs", "p", "t0", "b", "ars")
+
+# The planet model parameters that can be varied by a `planetModelGrid` request
+PLANET_GRID_PARAMETERS = ("rprs", "b", "ars")
+
+# Maximum difference (relative to the transit depth) between the vectorized planet model
+# and the castor_etc model of the requested planet (see `planet_grid_models()`)
+PLANET_GRID_MODEL_RTOL = float(os.getenv("ETC_PLANET_GRID_MODEL_RTOL", "1e-3"))
 
 
-@app.route("/transit", methods=["PUT"])
 def put_transit_json():
     """
     Create a 'transit' object from the JSON request
@@ -87,6 +120,7 @@ def put_transit_json():
 
     TODO: docstring
     """
+    data_holder = get_data_holder()
     try:
     
         #
@@ -102,7 +136,32 @@ def put_transit_json():
             logger.debug("exposure_parameters: " + str(exposure_parameters))
             planet_model_parameters = request_data["planetModelParameters"]
             logger.debug("planet_model_parameters: " + str(planet_model_parameters))
-        
+            nbin = int(request_data.get("nbin", 1))
+            logger.debug("nbin: " + str(nbin))
+            if nbin < 1:
+                raise ValueError("nbin must be a positive integer")
+            # The light curve can be left out of the response and streamed instead (see
+            # `get_light_curve_stream()`)
+            include_light_curve = request_data.get("includeLightCurve", True)
+            if isinstance(include_light_curve, str):
+                include_light_curve = include_light_curve.lower() != "false"
+            include_light_curve = bool(include_light_curve)
+            logger.debug("include_light_curve: " + str(include_light_curve))
+            # The Gaia magnitude limit of the field (the `srchGmax` of the source form)
+            srch_Gmax = request_data.get("targetParameters", {}).get("srch_Gmax")
+            srch_Gmax = None if srch_Gmax in (None, "") else float(srch_Gmax)
+            logger.debug("srch_Gmax: " + str(srch_Gmax))
+            planets = parse_planet_parameters(planet_model_parameters)
+            planet_grid = request_data.get("planetModelGrid")
+            logger.debug("planet_grid: " + str(planet_grid))
+            if planet_grid is not None:
+                planet_grid = parse_planet_grid(planet_grid, planets)
+
+        except ValueError as e:
+            log_traceback(e)
+            logger.error(str(e))
+            return bad_request(str(e))
+
         except Exception as e:
             log_traceback(e)
             logger.error(
@@ -115,9 +174,41 @@ def put_transit_json():
                 + "do not match required inputs."
             )
         
+        if wants_async():
+            # Run the simulation in the job queue and let the client poll for the result
+            if (
+                data_holder.TelescopeObj is None
+                or data_holder.SourceObj is None
+                or data_holder.BackgroundObj is None
+            ):
+                logger.error(
+                    "Server could not initialize the 'Transit' object from server-side "
+                    + "stored data. Probably missing `Telescope`, `Source`, "
+                    + "and/or `Background` object"
+                )
+                return server_error(
+                    "Server could not initialize the 'Transit' object from server-side "
+                    + "stored data. Probably missing `Telescope`, `Source`, "
+                    + "and/or `Background` object"
+                )
+            return submit_job(
+                "transit",
+                compute_transit,
+                data_holder.TelescopeObj,
+                data_holder.SourceObj,
+                data_holder.BackgroundObj,
+                bandpass,
+                exposure_parameters,
+                planet_model_parameters,
+                nbin,
+                planet_grid,
+                include_light_curve,
+                srch_Gmax,
+            )
+
         try:
-            TransitObj = Observation(
-                DataHolder.TelescopeObj, DataHolder.SourceObj, DataHolder.BackgroundObj, stellar_model_dir = "/arc/projects/CASTOR/stellar_models"
+            TransitObj = make_observation(
+                data_holder.TelescopeObj, data_holder.SourceObj, data_holder.BackgroundObj
             )
         except Exception as e:
             log_traceback(e)
@@ -133,129 +224,527 @@ def put_transit_json():
                 + "and/or `Background` object"
             )
         
-        #
-        # Transit
-        #
+        results = simulate_transit(
+            TransitObj,
+            data_holder.SourceObj,
+            bandpass,
+            exposure_parameters,
+            planet_model_parameters,
+            nbin=nbin,
+            planet_grid=planet_grid,
+            include_light_curve=include_light_curve,
+            srch_Gmax=srch_Gmax,
+        )
 
-        #
-        # 1. Specify CASTOR bandpass
-        #
+        # Store Transit object
+        data_holder.TransitObj = TransitObj
 
-        TransitObj.specify_bandpass(passband_name=str(bandpass['bandpass_id']))
+        return jsonify(**results)
 
-        #
-        # 2. Simulation and Plotting
-        #
+    except Exception as e:
+        log_traceback(e)
+        logger.error(
+            "There was a problem initializing the `Transit ` object and "
+            + "returning some of its attribute in a JSON format"
+        )
 
-        TransitObj.scene_sim()
+        return server_error(
+            "There was a problem initializing the `Transit ` object and "
+            + "returning some of its attributes in a JSON format."
+        )
 
-        # From plot_fov function in transit.py
-        if ( ('gs_i' in TransitObj.gaia.keys()) == False ) & hasattr(TransitObj,'gs_criteria'):
-                    TransitObj.id_guide_stars()
 
-        _f = TransitObj.gaia['scene'] - np.min(TransitObj.gaia['scene']) + 1
+def make_observation(TelescopeObj, SourceObj, BackgroundObj):
+    """
+    Create the transit `Observation` object.
+    """
+    return Observation(
+        TelescopeObj,
+        SourceObj,
+        BackgroundObj,
+        stellar_model_dir="/arc/projects/CASTOR/stellar_models",
+    )
 
-        _f = base64.b64encode(zlib.compress(bytes(json.dumps(_f.tolist()),"utf-8"))).decode("ascii")
 
+def parse_planet_parameters(planet_model_parameters):
+    """
+    Parse the planet model parameters of a transit request. Each parameter is either a
+    number (one planet) or a list with one value per planet (a multi-planet system).
+
+    Parameters
+    ----------
+      planet_model_parameters :: dict
+        The "rprs", "p", "t0", "b", and "ars" of the planet(s).
+
+    Returns
+    -------
+      planets :: dict of 1D arrays of floats
+        The parameters of each planet.
+    """
+    planets = {
+        key: np.atleast_1d(np.asarray(planet_model_parameters[key], dtype=float))
+        for key in PLANET_PARAMETERS
+    }
+    num_planets = {values.size for values in planets.values()}
+    if len(num_planets) != 1 or 0 in num_planets:
+        raise ValueError(
+            "All planet model parameters must have the same (non-zero) number "
+            + "of values."
+        )
+    if any(values.ndim != 1 for values in planets.values()):
+        raise ValueError("Planet model parameters must be numbers or lists of numbers.")
+    return planets
 
-        # print('Initial size=',len(_f.encode("utf-8"))/(10**6),'Mb') #25.18 Mb in size!
 
-        # _size = base64.b64encode(zlib.compress(bytes(_f, "utf-8"))).decode("ascii")
-        # print('Compressed size=',len(_size.encode("utf-8"))/(10**6),'Mb') #10.36 Mb in size!
+def parse_planet_grid(planet_grid, planets):
+    """
+    Parse the `planetModelGrid` of a transit request: the "rprs", "b", and/or "ars"
+    values to evaluate. The light curve model is evaluated at every combination of these
+    values, with the other parameters taken from the (single) planet of the request.
+
+    Parameters
+    ----------
+      planet_grid :: dict
+        The lists of "rprs", "b", and/or "ars" values.
+
+      planets :: dict of 1D arrays of floats
+        The output of `parse_planet_parameters()`.
+
+    Returns
+    -------
+      grid :: 2D array of floats
+        The (rprs, b, ars) of each model, with shape (number of models, 3).
+    """
+    if planets["rprs"].size != 1:
+        raise ValueError("A planet model grid requires a single planet.")
+    unknown = set(planet_grid) - set(PLANET_GRID_PARAMETERS)
+    if unknown:
+        raise ValueError(
+            "Unknown planet model grid parameter(s): " + ", ".join(sorted(unknown))
+        )
+    axes = [
+        np.atleast_1d(np.asarray(planet_grid.get(key, planets[key]), dtype=float))
+        for key in PLANET_GRID_PARAMETERS
+    ]
+    if any(axis.ndim != 1 or axis.size == 0 for axis in axes):
+        raise ValueError(
+            "Planet model grid parameters must be non-empty lists of numbers."
+        )
+    num_models = np.prod([axis.size for axis in axes])
+    if num_models > PLANET_GRID_MAX_SIZE:
+        raise ValueError(
+            f"The planet model grid has {num_models} models "
+            + f"(maximum {PLANET_GRID_MAX_SIZE})."
+        )
+    grids = np.meshgrid(*axes, indexing="ij")
+    return np.stack([grid.ravel() for grid in grids], axis=-1)
+
+
+def simulate_transit(
+    TransitObj,
+    SourceObj,
+    bandpass,
+    exposure_parameters,
+    planet_model_parameters,
+    nbin=1,
+    planet_grid=None,
+    include_light_curve=True,
+    srch_Gmax=None,
+):
+    """
+    Simulate the field of view and the light curve of the given `Observation` object.
 
-        xlim = int(DataHolder.TelescopeObj.transit_ccd_dim[0]/2) + TransitObj.xout * 0.7 * np.array([-1.0,1.0])
-        # ylim = int(DataHolder.TelescopeObj.transit_ccd_dim[1]/2) + TransitObj.yout * 0.7 * np.array([-1.0,1.0])
+    Parameters
+    ----------
+      TransitObj :: `Observation` object
+        The transit observation to simulate.
 
-        #
-        # 3. Stimulate light curve & inject a transit model
-        #
+      SourceObj :: `Source` object
+        The source used to create `TransitObj` (for the Gaia field stars).
 
-        exptime = float(exposure_parameters['exptime']) * u.second
-        nstack = int(exposure_parameters['nstack'])
-        tstart = float(exposure_parameters['tstart']) * u.d
-        tend = float(exposure_parameters['tend']) * u.d
+      bandpass, exposure_parameters, planet_model_parameters :: dict
+        The corresponding items of the JSON request.
 
-        TransitObj.specify_exposure_parameters(exptime=exptime,nstack=nstack, tstart=tstart, tend=tend)
+      nbin :: int
+        The number of light curve points to average into each returned point.
 
-        rprs = float(planet_model_parameters['rprs'])
-        p = float(planet_model_parameters['p'])
-        t0 = float(planet_model_parameters['t0'])
-        b = float(planet_model_parameters['b'])
-        ars = float(planet_model_parameters['ars'])
+      planet_grid :: 2D array of floats or None
+        If not None, the output of `parse_planet_grid()`. The light curve models of the
+        grid are returned in "planet_grid" (see `planet_grid_models()`), reusing the
+        simulated scene and light curve.
 
+      include_light_curve :: bool
+        If False, the light curve arrays are left out of the results. The light curve is
+        saved either way and can be streamed with the "light_curve_meta" ID (see
+        `get_light_curve_stream()`).
 
-        TransitObj.specify_pl_model(RpRs = [rprs], P=[p], t0=[t0], b=[b],aRs=[ars])
+      srch_Gmax :: float or None
+        The faintest G magnitude of the Gaia field stars. If given, the Gaia cone
+        searches of the scene simulation may be answered from the local index (see
+        `gaia_index.search_depth()`), otherwise they go to the Gaia archive.
 
-        TransitObj.lc_sim()
+    Returns
+    -------
+      results :: dict
+        The attributes to show on the frontend.
+    """
+    #
+    # 1. Specify CASTOR bandpass
+    #
 
-        # plot_lc
-        exp_time = -1
+    TransitObj.specify_bandpass(passband_name=str(bandpass['bandpass_id']))
 
-        t_offset = -(TransitObj.lc_t[-1] - TransitObj.lc_t[0]) / 2.
-        t_scale = 1.
-        y_offset = -1.0
-        y_scale = 1.e3
+    #
+    # 2. Simulation and Plotting
+    #
 
-        x_sim_castor = (TransitObj.lc_t + t_offset) * t_scale
+    with gaia_index.search_depth(srch_Gmax):
+        TransitObj.scene_sim()
 
-        y_sim_castor = (TransitObj.lc_fl[:,0] + y_offset) * y_scale
+    # From plot_fov function in transit.py
+    if ( ('gs_i' in TransitObj.gaia.keys()) == False ) & hasattr(TransitObj,'gs_criteria'):
+        TransitObj.id_guide_stars()
+
+    # The full scene is large (~25 MB as JSON text), so only its metadata is returned
+    # and the frontend fetches the tiles of the zoom level it shows (see
+    # `scene_route.py`)
+    _f = TransitObj.gaia['scene'] - np.min(TransitObj.gaia['scene']) + 1
+    scene = save_scene(_f)
+
+    # xlim = int(TelescopeObj.transit_ccd_dim[0]/2) + TransitObj.xout * 0.7 * np.array([-1.0,1.0])
+    # ylim = int(TelescopeObj.transit_ccd_dim[1]/2) + TransitObj.yout * 0.7 * np.array([-1.0,1.0])
+
+    #
+    # 3. Stimulate light curve & inject a transit model
+    #
+
+    exptime = float(exposure_parameters['exptime']) * u.second
+    nstack = int(exposure_parameters['nstack'])
+    tstart = float(exposure_parameters['tstart']) * u.d
+    tend = float(exposure_parameters['tend']) * u.d
+
+    TransitObj.specify_exposure_parameters(exptime=exptime,nstack=nstack, tstart=tstart, tend=tend)
+
+    # One value per planet (the model of a multi-planet system is the combination of
+    # all planets)
+    planets = parse_planet_parameters(planet_model_parameters)
+
+    TransitObj.specify_pl_model(
+        RpRs=list(planets["rprs"]),
+        P=list(planets["p"]),
+        t0=list(planets["t0"]),
+        b=list(planets["b"]),
+        aRs=list(planets["ars"]),
+    )
+
+    TransitObj.lc_sim()
+
+    light_curve = light_curve_arrays(TransitObj)
+    light_curve_meta = save_light_curve(light_curve)
+
+    results = dict(
+        gaia = {
+            "ra": np.asarray(SourceObj.gaia['ra']),
+            "dec": np.asarray(SourceObj.gaia['dec']),
+            "x": np.asarray(SourceObj.gaia['x']),
+            "y": np.asarray(SourceObj.gaia['y']),
+            "gs_i": np.asarray(TransitObj.gaia['gs_i']),
+            "scene": scene,
+        },
+        # scene_sim = {
+        #     "rotation_array": rotation_array,
+        #     "grid_x_array": grid_x_array,
+        #     "grid_y_array": grid_y_array,
+        #     "coord_str_array": coord_str_array
+        # },
+        ccd_dim = TransitObj.ccd_dim,
+        xout = TransitObj.xout,
+        yout = TransitObj.yout,
+        # result_g_ra = result_g_ra,
+        # result_g_dec = result_g_dec,
+        light_curve_meta = light_curve_meta,
+    )
+    if include_light_curve:
+        results["light_curve"] = bin_light_curve_arrays(light_curve, nbin)
+    if planet_grid is not None:
+        results["planet_grid"] = planet_grid_models(TransitObj, planets, planet_grid)
+    return results
+
+
+def planet_grid_models(TransitObj, planets, planet_grid):
+    """
+    Evaluate the light curve models of a planet model grid on the simulated light curve
+    of an `Observation` object (after `lc_sim()`), without simulating the scene or the
+    stellar photometry again.
+
+    The whole grid is evaluated at once with a vectorized transit model (see
+    `transit_models.quadratic_transit_models()`) whose limb darkening coefficients are
+    fitted to the castor_etc model of the requested planet. If it does not match the
+    castor_etc model (e.g., the planet does not transit during the light curve), every
+    grid point is evaluated with castor_etc instead.
+
+    The detection signal-to-noise ratio of each model is the matched-filter SNR of its
+    transit signal given the simulated light curve uncertainties:
+    sqrt(sum((model / error)**2)).
+
+    Parameters
+    ----------
+      TransitObj :: `Observation` object
+        The simulated transit observation. Its planet model is restored afterwards.
+
+      planets :: dict of 1D arrays of floats
+        The output of `parse_planet_parameters()` (a single planet).
+
+      planet_grid :: 2D array of floats
+        The output of `parse_planet_grid()`.
+
+    Returns
+    -------
+      grid_results :: dict
+        The "rprs", "b", and "ars" of each model, the shared "x_transit_model", the
+        "y_transit_model" of each model (in ppt, shape (number of models, 1000)), and
+        the "depth" (in ppt) and "snr" of each model.
+    """
+    exp_time = -1
+    lc_t = np.asarray(TransitObj.lc_t)
+    lc_err = np.asarray(TransitObj.lc_err[:, 0])
+    t_offset = -(lc_t[-1] - lc_t[0]) / 2.
+    y_scale = 1.e3
+
+    # The model grid and the observed times are evaluated together
+    _t_grid = np.linspace(lc_t[0], lc_t[-1], 1000)
+    t_all = np.concatenate([_t_grid, lc_t])
+
+    models = _vectorized_planet_grid_models(TransitObj, planets, planet_grid, t_all)
+    if models is None:
+        logger.debug("Planet model grid falls back to evaluating every model")
+        models = np.empty((len(planet_grid), t_all.size))
+        try:
+            for i, (rprs, b, ars) in enumerate(planet_grid):
+                TransitObj.specify_pl_model(
+                    RpRs=[rprs],
+                    P=list(planets["p"]),
+                    t0=list(planets["t0"]),
+                    b=[b],
+                    aRs=[ars],
+                )
+                models[i] = TransitObj.calc_pl_model(t_grid=t_all, exp_time=exp_time)
+        finally:
+            TransitObj.specify_pl_model(
+                RpRs=list(planets["rprs"]),
+                P=list(planets["p"]),
+                t0=list(planets["t0"]),
+                b=list(planets["b"]),
+                aRs=list(planets["ars"]),
+            )
 
-        y_error = TransitObj.lc_err[:,0] * y_scale
+    grid_models = models[:, : _t_grid.size]
+    observed_models = models[:, _t_grid.size :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snr = np.sqrt(np.nansum((observed_models / lc_err) ** 2, axis=1))
 
-        _t_grid = np.linspace(TransitObj.lc_t[0],TransitObj.lc_t[-1],1000)
-        pl_lc = TransitObj.calc_pl_model(t_grid=_t_grid,exp_time=exp_time) + 1.
+    return {
+        "rprs": planet_grid[:, 0],
+        "b": planet_grid[:, 1],
+        "ars": planet_grid[:, 2],
+        "x_transit_model": _t_grid + t_offset,
+        "y_transit_model": grid_models * y_scale,
+        "depth": -np.min(grid_models, axis=1) * y_scale,
+        "snr": snr,
+    }
 
-        xlim = np.array([TransitObj.lc_t[0], TransitObj.lc_t[-1]])
-        xlim += t_offset
-        xlim *= t_scale
-        xlim += 0.5 * t_scale * (TransitObj.lc_t[1] - TransitObj.lc_t[0]) * np.array([-1.0, 1.0])
 
-        x_transit_model = (_t_grid + t_offset) * t_scale
+def _vectorized_planet_grid_models(TransitObj, planets, planet_grid, t):
+    """
+    Evaluate all the models of a planet model grid at the times `t` with
+    `transit_models.quadratic_transit_models()`, after fitting its limb darkening
+    coefficients to the castor_etc model of the (single) planet of the request.
+
+    Returns
+    -------
+      models :: 2D array of floats or None
+        The (number of models, number of times) models, or None if the vectorized model
+        does not reproduce the castor_etc model of the requested planet to within
+        `PLANET_GRID_MODEL_RTOL` of its depth.
+    """
+    planet = {key: float(planets[key][0]) for key in PLANET_PARAMETERS}
+    reference = np.asarray(TransitObj.calc_pl_model(t_grid=t, exp_time=-1), dtype=float)
+    u1, u2 = fit_quadratic_limb_darkening(
+        t,
+        reference,
+        planet["rprs"],
+        planet["p"],
+        planet["t0"],
+        planet["b"],
+        planet["ars"],
+    )
+    if u1 is None:
+        return None
+    check = quadratic_transit_models(
+        t,
+        [planet["rprs"]],
+        [planet["p"]],
+        [planet["t0"]],
+        [planet["b"]],
+        [planet["ars"]],
+        u1,
+        u2,
+    )[0]
+    depth = np.nanmax(np.abs(reference))
+    if not np.nanmax(np.abs(check - reference)) <= PLANET_GRID_MODEL_RTOL * depth:
+        return None
+    num_models = len(planet_grid)
+    return quadratic_transit_models(
+        t,
+        planet_grid[:, 0],
+        np.full(num_models, planet["p"]),
+        np.full(num_models, planet["t0"]),
+        planet_grid[:, 1],
+        planet_grid[:, 2],
+        u1,
+        u2,
+    )
+
+
+def compute_transit(
+    TelescopeObj,
+    SourceObj,
+    BackgroundObj,
+    bandpass,
+    exposure_parameters,
+    planet_model_parameters,
+    nbin=1,
+    planet_grid=None,
+    include_light_curve=True,
+    srch_Gmax=None,
+):
+    """
+    Job queue entry point (see `jobs.py`): create the `Observation` object and return the
+    results of `simulate_transit()`.
+    """
+    TransitObj = make_observation(TelescopeObj, SourceObj, BackgroundObj)
+    return simulate_transit(
+        TransitObj,
+        SourceObj,
+        bandpass,
+        exposure_parameters,
+        planet_model_parameters,
+        nbin=nbin,
+        planet_grid=planet_grid,
+        include_light_curve=include_light_curve,
+        srch_Gmax=srch_Gmax,
+    )
+
+
+def light_curve_arrays(TransitObj):
+    """
+    Return the simulated light curve and the transit model of an `Observation` object
+    (after `lc_sim()`) in the units shown on the frontend (from the plot_lc function in
+    transit.py): times relative to the middle of the observation, and fluxes in ppt.
+
+    Returns
+    -------
+      light_curve :: dict
+        The "x_sim_castor", "y_sim_castor", and "y_error" of the simulated light
+        curve, the "xlim" of the plot, and the "x_transit_model" and "y_transit_model".
+    """
+    exp_time = -1
 
-        y_transit_model = (pl_lc + y_offset) * y_scale
+    t_offset = -(TransitObj.lc_t[-1] - TransitObj.lc_t[0]) / 2.
+    t_scale = 1.
+    y_offset = -1.0
+    y_scale = 1.e3
 
-        # Store Transit object
-        DataHolder.TransitObj = TransitObj
-
-        return jsonify(
-            gaia = {
-                "ra": list(DataHolder.SourceObj.gaia['ra']),
-                "dec": list(DataHolder.SourceObj.gaia['dec']),
-                "x": list(DataHolder.SourceObj.gaia['x']),
-                "y": list(DataHolder.SourceObj.gaia['y']),
-                "gs_i": list(np.float64(TransitObj.gaia['gs_i'])),
-                "_f": _f
-            },
-            # scene_sim = {
-            #     "rotation_array": rotation_array,
-            #     "grid_x_array": grid_x_array,
-            #     "grid_y_array": grid_y_array,
-            #     "coord_str_array": coord_str_array
-            # },
-            ccd_dim = TransitObj.ccd_dim,
-            xout = TransitObj.xout,
-            yout = TransitObj.yout,
-            # result_g_ra = result_g_ra,
-            # result_g_dec = result_g_dec,
-            light_curve = {
-                "x_sim_castor": list(x_sim_castor),
-                "y_sim_castor": list(y_sim_castor),
-                "y_error": list(y_error),
-                "xlim": list(xlim),
-                "x_transit_model": list(x_transit_model),
-                "y_transit_model": list(y_transit_model),
-            }
-        )
-        
+    lc_t = np.asarray(TransitObj.lc_t)
+    lc_fl = np.asarray(TransitObj.lc_fl[:, 0])
+    lc_err = np.asarray(TransitObj.lc_err[:, 0])
+
+    x_sim_castor = (lc_t + t_offset) * t_scale
+
+    y_sim_castor = (lc_fl + y_offset) * y_scale
+
+    y_error = lc_err * y_scale
 
+    _t_grid = np.linspace(TransitObj.lc_t[0],TransitObj.lc_t[-1],1000)
+    pl_lc = TransitObj.calc_pl_model(t_grid=_t_grid,exp_time=exp_time) + 1.
+
+    xlim = np.array([TransitObj.lc_t[0], TransitObj.lc_t[-1]])
+    xlim += t_offset
+    xlim *= t_scale
+    xlim += 0.5 * t_scale * (TransitObj.lc_t[1] - TransitObj.lc_t[0]) * np.array([-1.0, 1.0])
+
+    x_transit_model = (_t_grid + t_offset) * t_scale
+
+    y_transit_model = (pl_lc + y_offset) * y_scale
+
+    return {
+        "x_sim_castor": x_sim_castor,
+        "y_sim_castor": y_sim_castor,
+        "y_error": y_error,
+        "xlim": xlim,
+        "x_transit_model": x_transit_model,
+        "y_transit_model": y_transit_model,
+    }
+
+
+def get_light_curve_stream(light_curve_id):
+    """
+    Stream a saved light curve (see the "light_curve_meta" of the `transit` results,
+    of both synchronous and job queue requests) as newline-delimited JSON
+    (application/x-ndjson), so that the frontend can draw the first points before the
+    whole light curve is received. The points are read from disk in chunks, so memory
+    use stays bounded for long observations.
+
+    The optional `nbin` query parameter bins the light curve (see `bin_light_curve()`),
+    and `chunk` sets the number of (binned) points per line.
+
+    Returns
+    -------
+      response :: Flask streamed response
+        The first line has the "xlim", "x_transit_model", "y_transit_model", and the
+        number of (binned) points ("num_points"). Each following line has the next
+        "x_sim_castor", "y_sim_castor", and "y_error" values.
+    """
+    try:
+        nbin = int(request.args.get("nbin", "1"))
+        chunk_size = int(request.args.get("chunk", str(LIGHT_CURVE_CHUNK_SIZE)))
+        if nbin < 1 or chunk_size < 1:
+            raise ValueError("nbin and chunk must be positive integers")
     except Exception as e:
         log_traceback(e)
-        logger.error(
-            "There was a problem initializing the `Transit ` object and "
-            + "returning some of its attribute in a JSON format"
-        )
-
-        return server_error(
-            "There was a problem initializing the `Transit ` object and "
-            + "returning some of its attributes in a JSON format."
-        )
\ No newline at end of file
+        logger.error("The light curve nbin and chunk must be positive integers.")
+        return bad_request("The light curve nbin and chunk must be positive integers.")
+    meta, points, model = load_light_curve(light_curve_id)
+    if meta is None:
+        msg = f"Light curve {light_curve_id} does not exist (or has expired)."
+        logger.error(msg)
+        return not_found(msg)
+
+    def generate():
+        num_points = len(points)
+        yield dumps_bytes(
+            {
+                "xlim": meta["xlim"],
+                "x_transit_model": model[0],
+                "y_transit_model": model[1],
+                "num_points": -(-num_points // nbin),
+            }
+        ) + b"\n"
+        # Chunks are a multiple of `nbin` points, so that no bin spans two chunks
+        step = chunk_size * nbin
+        for start in range(0, num_points, step):
+            chunk = np.array(points[start : start + step])
+            x_sim_castor, y_sim_castor, y_error = bin_light_curve(
+                chunk[:, 0], chunk[:, 1], chunk[:, 2], nbin
+            )
+            yield dumps_bytes(
+                {
+                    "x_sim_castor": x_sim_castor,
+                    "y_sim_castor": y_sim_castor,
+                    "y_error": y_error,
+                }
+            ) + b"\n"
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.headers["X-Accel-Buffering"] = "no"  # do not buffer in nginx
+    return response
@@ -65,20 +65,33 @@ License along with FORECASTOR        GNU avec FORECASTOR ETC GUI ; si
 ETC GUI. If not, see                 ce n'est pas le cas, consultez :
 <http://www.gnu.org/licenses/>.      <http://www.gnu.org/licenses/>.
 """
+import base64
+import json
 import logging
+import math
 import os
 from traceback import format_exception
 
-from flask import Flask, Response, jsonify
+import numpy as np
+from flask import Flask, Response, g, jsonify, request
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
+try:
+    import orjson  # optional, but much faster for large arrays
+except ImportError:
+    orjson = None
+
+from session_store import is_valid_session_id, make_backend, new_session_id
+
 skaha_sessionid = os.getenv("skaha_sessionid")
 
 if skaha_sessionid is None:
     # --- Python ---
     app = Flask(__name__)
-    cors = CORS(app=app)
+    # Credentials are needed so the session cookie is sent by the development frontend
+    cors = CORS(app=app, supports_credentials=True)
     #
     # Configure logger
     #
@@ -113,6 +126,101 @@ else:
     logger.debug("Flask believes the session ID is: " + skaha_sessionid)
     logger.debug("Static URL path is set to: /" + str(app.static_url_path))
 
+#
+# Configure JSON serialization
+#
+def _nan_to_none_list(arr):
+    """
+    Convert a NumPy array to a (nested) list, replacing NaNs and infs with None.
+    """
+    if arr.dtype.kind == "f":
+        not_finite = ~np.isfinite(arr)
+        if not_finite.any():
+            arr = arr.astype(object)
+            arr[not_finite] = None
+    return arr.tolist()
+
+
+def _to_builtin(obj):
+    """
+    Convert objects the JSON encoders cannot handle natively (e.g., `astropy.Quantity`
+    objects, NumPy scalars, 0-d or non-contiguous arrays) to Python objects. Non-finite
+    floats are converted to None.
+    """
+    if hasattr(obj, "unit") and hasattr(obj, "value"):
+        # `astropy.Quantity` (N.B. this is also an `np.ndarray` subclass)
+        obj = obj.value
+    if isinstance(obj, np.ndarray):
+        if obj.ndim == 0:
+            obj = obj.item()
+        else:
+            return _nan_to_none_list(obj)
+    if isinstance(obj, np.generic):
+        obj = obj.item()
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, (list, tuple, dict)) or obj is None:
+        return obj
+    if isinstance(obj, (str, int)):
+        return obj
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _sanitize(obj):
+    """
+    Recursively convert `obj` into Python objects that the standard library JSON encoder
+    serializes as valid JSON (i.e., NaNs and infs replaced by None).
+    """
+    if isinstance(obj, dict):
+        return {key: _sanitize(val) for key, val in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(val) for val in obj]
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, (str, int, bool)) or obj is None:
+        return obj
+    return _sanitize(_to_builtin(obj))
+
+
+def dumps_bytes(obj):
+    """
+    Serialize `obj` to JSON (as UTF-8 bytes). NumPy arrays and scalars (including float32
+    and 0-d arrays) and `astropy.Quantity` objects are supported, and NaNs/infs are
+    serialized as null.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=_to_builtin, option=orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(
+        _sanitize(obj), separators=(",", ":"), allow_nan=False
+    ).encode("utf-8")
+
+
+def dumps(obj):
+    """
+    Same as `dumps_bytes()` but return a string.
+    """
+    return dumps_bytes(obj).decode("utf-8")
+
+
+class ArrayJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider using `dumps_bytes()`, so that routes can pass NumPy arrays and
+    scalars straight to `jsonify()`.
+    """
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+app.json = ArrayJSONProvider(app)
+
+
 #
 # Configure file uploads
 #
@@ -137,7 +245,8 @@ def save_file(file):
         "." in bad_filename
         and bad_filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
     ):
-        good_filename = secure_filename(bad_filename)
+        # Prefix with the session ID so concurrent users cannot overwrite each other's files
+        good_filename = get_session_id() + "_" + secure_filename(bad_filename)
         secure_filepath = os.path.join(app.config["UPLOAD_FOLDER"], good_filename)
         file.save(secure_filepath)
         logger.info(f"Saved file {bad_filename} to {secure_filepath}")
@@ -152,26 +261,189 @@ class DataHolder:
     Class to store data between Flask requests. Idea from
     <https://stackoverflow.com/q/63195823>.
 
-    Note that this approach is NOT safe for multiple or concurrent users. I am simply
-    taking advantage of the fact that all sessions will be run inside individual Docker
-    containers with a maximum limit of 1 container per person.
+    Each browser session gets its own `DataHolder` instance (see `get_data_holder()`),
+    which is kept in the configured session store between requests. This allows multiple
+    users to share one deployment with several gunicorn workers and/or threads.
+    """
+
+    def __init__(self):
+        # Set/unset them via data_holder.<attribute> = ...
+        self.TelescopeObj = None
+        self.BackgroundObj = None
+        self.SourceObj = None
+        self.PhotometryObj = None
+        self.SpectroscopyObj = None
+        self.TransitObj = None
+        self.GrismObj = None
+        self.UVMOSObj = None
+
+        # Content-addressed key of the current `Telescope` object (for caching)
+        self.telescope_key = None
+        # Key of the current `Source` object's geometry (i.e., type and physical
+        # parameters, not its spectrum) for the aperture cache of `photometry_route.py`
+        self.source_key = None
+        # Keys of the current `Source` object's geometry and spectrum and of the current
+        # `Background` object (for the grism cache of `grism_route.py`)
+        self.source_content_key = None
+        self.background_key = None
+
+        # To determine if source weights should use log scaling
+        self.use_log_source_weights = False
+
+        # Only modified sessions need to be written back to the session store
+        self._modified = False
+
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        if name != "_modified":
+            super().__setattr__("_modified", True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_modified", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__init__()  # defaults for attributes added after the session was stored
+        self.__dict__.update(state)
+        self.__dict__["_modified"] = False
 
-    For multi-user support, something along the lines of redis + cookie-based session
-    storage would be required.
+
+#
+# Configure session storage
+#
+SESSION_COOKIE_NAME = "castor_etc_session"
+SESSION_HEADER_NAME = "X-Session-ID"
+_session_ttl = os.getenv("ETC_SESSION_TTL", "14400")  # seconds
+session_backend = make_backend(
+    kind=os.getenv("ETC_SESSION_BACKEND", "memory"),
+    maxsize=int(os.getenv("ETC_SESSION_MAXSIZE", "256")),
+    ttl=None if _session_ttl.lower() == "none" else float(_session_ttl),
+    directory=os.getenv(
+        "ETC_SESSION_DIR", os.path.join(os.getcwd(), "flask_sessions")
+    ),
+    url=os.getenv("ETC_REDIS_URL"),
+)
+logger.debug("Session backend: " + type(session_backend).__name__)
+
+
+def get_session_id():
+    """
+    Return the session ID of the current request, creating a new one if the client did not
+    send a valid session cookie (or `X-Session-ID` header).
+    """
+    if "session_id" not in g:
+        session_id = request.cookies.get(SESSION_COOKIE_NAME) or request.headers.get(
+            SESSION_HEADER_NAME
+        )
+        if not is_valid_session_id(session_id):
+            session_id = new_session_id()
+            g.is_new_session = True
+            logger.debug("Created new session " + session_id)
+        g.session_id = session_id
+    return g.session_id
+
+
+def get_data_holder():
+    """
+    Return the `DataHolder` object belonging to the session of the current request. The
+    object is loaded from the session store on first access and saved back after the
+    request if it was modified.
+    """
+    if "data_holder" not in g:
+        session_id = get_session_id()
+        data_holder = session_backend.load(session_id)
+        if data_holder is None:
+            data_holder = DataHolder()
+        g.data_holder = data_holder
+    return g.data_holder
+
+
+@app.after_request
+def save_session(response):
+    """
+    Write the current session's `DataHolder` back to the session store (if modified) and
+    make sure the client has the session cookie.
+    """
+    data_holder = g.get("data_holder")
+    if data_holder is not None and data_holder._modified:
+        try:
+            session_backend.save(g.session_id, data_holder)
+            data_holder._modified = False
+        except Exception as e:
+            log_traceback(e)
+            logger.error("Could not save session " + g.session_id)
+    if g.get("is_new_session") or (
+        "session_id" in g and request.cookies.get(SESSION_COOKIE_NAME) != g.session_id
+    ):
+        response.set_cookie(
+            SESSION_COOKIE_NAME,
+            g.session_id,
+            max_age=None if session_backend.ttl is None else int(session_backend.ttl),
+            path="/",
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+def wants_binary_arrays():
+    """
+    Check whether the client asked for 2D arrays in the binary encoding via the
+    `format=binary` query parameter. JSON is used by default. (The binary arrays are
+    still sent in a JSON response, so this is not negotiated with the `Accept` header.)
     """
+    return request.args.get("format", "").lower() == "binary"
 
-    # Class variables
-    # Set/unset them via DataHolder.<class_variable> = ...
-    TelescopeObj = None
-    BackgroundObj = None
-    SourceObj = None
-    PhotometryObj = None
-    SpectroscopyObj = None
-    TransitObj = None
-    GrismObj = None
 
-    # To determine if source weights should use log scaling
-    use_log_source_weights = False
+def encode_binary_array(arr):
+    """
+    Encode a NumPy array as a base64 string of its little-endian float32 buffer. NaNs and
+    infs are preserved.
+
+    Returns
+    -------
+      encoded :: dict
+        Dictionary with the keys "dtype" (always "<f4"), "shape" (list of ints, in C
+        order), and "data" (base64-encoded buffer). In JavaScript, decode with, e.g.,
+        `new Float32Array(Uint8Array.from(atob(data), (c) => c.charCodeAt(0)).buffer)`.
+    """
+    # No copy if the array is already a C-contiguous little-endian float32 array
+    arr = np.ascontiguousarray(arr, dtype="<f4")
+    return {
+        "dtype": "<f4",
+        "shape": list(arr.shape),
+        "data": base64.b64encode(arr.data).decode("ascii"),
+    }
+
+
+def encode_2d_array(arr, binary=None):
+    """
+    Encode a 2D array for a JSON response in the format negotiated with the client (see
+    `wants_binary_arrays()`).
+
+    Parameters
+    ----------
+      arr :: array-like
+        The array to encode.
+
+      binary :: bool or None
+        If True, use the binary encoding. If None, use the format requested by the client
+        of the current request (N.B. pass a bool when there is no request context, e.g.,
+        in the job queue).
+
+    Returns
+    -------
+      encoded :: str or dict
+        By default, a JSON string of the nested list of values with NaN replaced by null.
+        If the client requested binary arrays, the dictionary from
+        `encode_binary_array()`.
+    """
+    if binary is None:
+        binary = wants_binary_arrays()
+    if binary:
+        return encode_binary_array(arr)
+    return dumps(arr)
 
 
 def bad_request(message):
@@ -183,6 +455,15 @@ def bad_request(message):
     return response
 
 
+def not_found(message):
+    """
+    Return a 404 error with the given message as JSON.
+    """
+    response = jsonify({"error": message})
+    response.status_code = 404
+    return response
+
+
 def server_error(message):
     """
     Return a 500 error with the given message as JSON.
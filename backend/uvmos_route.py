@@ -70,13 +70,21 @@ import astropy.units as u
 from castor_etc.uvmos_spectroscopy import UVMOS_Spectroscopy
 from flask import jsonify, request
 
-from utils import DataHolder, app, bad_request, server_error, logger, log_traceback
+from extraction import parse_extraction_box, parse_snr_wavelengths
+from jobs import submit_job, wants_async
+from utils import (
+    bad_request,
+    server_error,
+    logger,
+    log_traceback,
+    get_data_holder,
+    encode_2d_array,
+    wants_binary_arrays,
+)
 
-import pandas as pd
 import numpy as np
 
 
-@app.route("/uvmos", methods=["PUT"])
 def put_uvmos_json():
     """
     Create a 'UVMOS Spectroscopy' object from the JSON request
@@ -85,6 +93,7 @@ def put_uvmos_json():
 
     TODO: docstring
     """
+    data_holder = get_data_holder()
     try:
         #
         # Check inputs
@@ -101,6 +110,17 @@ def put_uvmos_json():
             logger.debug("spectral_range: " + str(spectral_range))
             snr_input = request_data["snrInput"]
             logger.debug("snr_input: " + str(snr_input))
+            parse_snr_wavelengths(snr_input["wavelength"])
+            if snr_input["val_type"] not in ("snr", "t"):
+                logger.error(
+                    f"The given uvmos spectroscopy target value type, {snr_input['val_type']}, "
+                    + "is not valid and must be either 'snr' or 't'. " 
+                )
+
+                return bad_request(
+                    f"The given uvmos spectroscopy target value type, {snr_input['val_type']}, "
+                    + "is not valid and must be either 'snr' or 't'. " 
+                )
 
         except Exception as e:
             log_traceback(e)
@@ -114,10 +134,40 @@ def put_uvmos_json():
                 + "do not match required inputs."
             )
         
+        if wants_async():
+            # Run the simulation in the job queue and let the client poll for the result
+            if (
+                data_holder.TelescopeObj is None
+                or data_holder.SourceObj is None
+                or data_holder.BackgroundObj is None
+            ):
+                logger.error(
+                    "Sever could not initialize the `UVMOS Spectroscopy` object from server-side "
+                    + "stored data. Probably missing `Telescope`, `Source`, "
+                    + "and/or `Background` object"
+                )
+                return server_error(
+                    "Sever could not initialize the `UVMOS Spectroscopy` object from server-side "
+                    + "stored data. Probably missing `Telescope`, `Source`, "
+                    + "and/or `Background` object"
+                )
+            return submit_job(
+                "uvmos",
+                compute_uvmos,
+                data_holder.TelescopeObj,
+                data_holder.SourceObj,
+                data_holder.BackgroundObj,
+                extraction_box,
+                slit,
+                spectral_range,
+                snr_input,
+                wants_binary_arrays(),
+            )
+
         try:
             UVMOSObj = UVMOS_Spectroscopy(
-                DataHolder.TelescopeObj, DataHolder.SourceObj,
-                DataHolder.BackgroundObj
+                data_holder.TelescopeObj, data_holder.SourceObj,
+                data_holder.BackgroundObj
             )
         except Exception as e:
             log_traceback(e)
@@ -133,115 +183,20 @@ def put_uvmos_json():
                 + "and/or `Background` object"
             )
         
-        #
-        # Do uvmos spectroscopy
-        #
-
-        #
-        # 1. Spectral Range
-        #
-
-        UVMOSObj.min_wave = (float(spectral_range['minwavelength']) * u.nm).to(u.AA)
-
-        UVMOSObj.max_wave = (float(spectral_range['maxwavelength']) * u.nm).to(u.AA)
-
-        #
-        # 2. Slit spectroscopy
-        #
-        
-        UVMOSObj.specify_slit(slit_width = float(slit['width']) * u.arcsec, slit_height = float(slit['length']) * u.arcsec)
-
-        #
-        # 3. Extraction box, parameters are type 'int' in uvmos_spectroscopy.py
-        extraction_width = float(extraction_box['width']) #converting from string to a float
-        extraction_height_lowerlim = float(extraction_box['heightLowerLim']) #converting from a string to a float
-        pixel_scale = DataHolder.TelescopeObj.px_scale.value 
-        
-
-        # If units are pixels, then we need to convert the floating point digit into an integer.
-        if extraction_box['units'] == 'pixel':
-            if extraction_box['heightUpperLim'] == '':
-                    UVMOSObj.calc_source_CASTORSpectrum(extraction_width = int(extraction_width), extraction_lowerlim = int(extraction_height_lowerlim))
-
-                    UVMOSObj.calc_background_CASTORSpectrum(extraction_width = int(extraction_width), extraction_lowerlim = int(extraction_height_lowerlim))
-
-            else:
-                    extraction_height_upperlim = int(extraction_box['heightUpperLim'])
-                    UVMOSObj.calc_source_CASTORSpectrum(extraction_width = int(extraction_width), extraction_lowerlim = int(extraction_height_lowerlim), extraction_upperlim = extraction_height_upperlim)
-
-                    UVMOSObj.calc_background_CASTORSpectrum(extraction_width = int(extraction_width), extraction_lowerlim = int(extraction_height_lowerlim),extraction_upperlim = extraction_height_upperlim)
-        # When units are arcsec, first we need to divide by the pixel scale to convert units to pixel, then round them to the nearest 1 digit, i.e., 0.6/0.1 = 0.5999999999999 and int(0.6/0.1) = 5, which is not correct, so after rounding, we convert the result into an int() type.
-        else:
-            extraction_width = int(np.round(extraction_width/pixel_scale,0)) #pixel
-            extraction_height_lowerlim = int(np.round(extraction_height_lowerlim/pixel_scale,0)) #pixel
-            if extraction_box['heightUpperLim'] == '':
-                    UVMOSObj.calc_source_CASTORSpectrum(extraction_width = extraction_width, extraction_lowerlim = extraction_height_lowerlim)
+        results = simulate_uvmos(
+            UVMOSObj,
+            data_holder.TelescopeObj,
+            extraction_box,
+            slit,
+            spectral_range,
+            snr_input,
+            binary_arrays=wants_binary_arrays(),
+        )
 
-                    UVMOSObj.calc_background_CASTORSpectrum(extraction_width = extraction_width, extraction_lowerlim = extraction_height_lowerlim)
+        data_holder.UVMOSObj = UVMOSObj
 
-            else:
-                    extraction_height_upperlim = int(np.round(float(extraction_box['heightUpperLim'])/pixel_scale,0)) 
-                    UVMOSObj.calc_source_CASTORSpectrum(extraction_width = extraction_width, extraction_lowerlim = extraction_height_lowerlim, extraction_upperlim = extraction_height_upperlim)
+        return jsonify(**results)
 
-                    UVMOSObj.calc_background_CASTORSpectrum(extraction_width = extraction_width, extraction_lowerlim = extraction_height_lowerlim,extraction_upperlim = extraction_height_upperlim)
-        #
-        # 4. SNR calculations
-        #
-        wave = (float(snr_input["wavelength"]) * u.nm)
-        if snr_input["val_type"] == "snr":
-                snr = float(snr_input["val"])
-                snr_result = UVMOSObj.calc_t_from_snr(snr = snr, wave = wave.to(u.AA))
-
-        elif snr_input["val_type"] == "t":
-             t = float(snr_input["val"]) # seconds
-             snr_result = UVMOSObj.calc_snr_from_t(t = t, wave = wave.to(u.AA))
-
-        else:
-             logger.error(
-                  f"The given uvmos spectroscopy target value type, {snr_input['val_type']}, "
-                  + "is not valid and must be either 'snr' or 't'. " 
-             )
-
-             return bad_request(
-                  f"The given uvmos spectroscopy target value type, {snr_input['val_type']}, "
-                  + "is not valid and must be either 'snr' or 't'. " 
-             )
-
-        slit_width_pix = UVMOSObj.slit_width_pix
-        slit_height_pix = UVMOSObj.slit_height_pix
-
-        slit_width = UVMOSObj.slit_width.value
-        slit_height = UVMOSObj.slit_height.value
-
-        source_detector = pd.DataFrame(UVMOSObj.show_slit_image(wave=wave.value)[0]).to_json(
-             orient="values"
-        )
-        
-        DataHolder.UVMOSObj = UVMOSObj
- 
-        return ( jsonify(
-             snrResults = snr_result.item(), # SNR calculation above returns a 0 dimensional array.
-             spectrum = {
-                  "waves": UVMOSObj.waves_CASTORSpectrum,
-                  "source_response": UVMOSObj.source_CASTORSpectrum,
-                  "background_response": UVMOSObj.background_CASTORSpectrum.tolist(),
-                  "extracted_numpixs": UVMOSObj.source_extracted_numpixs
-             },
-             sourcePixelWeight = {
-                  "source_detector": source_detector,
-                  "centerPix": UVMOSObj.show_slit_image(wave=wave.value)[1],
-             },
-             slitWidthPixel = slit_width_pix,
-             slitHeightPixel = slit_height_pix,
-             showSlit = {
-                "slitWidth": slit_width,
-                "slitHeight": slit_height,
-                "FWHM": UVMOSObj.FWHM.value,
-             },
-        )
-        )
-    
-        
     except Exception as e:
         log_traceback(e)
         logger.error(
@@ -254,3 +209,197 @@ def put_uvmos_json():
             + "returning some of its attributes in a JSON format."
         )
 
+
+def simulate_uvmos(
+    UVMOSObj,
+    TelescopeObj,
+    extraction_box,
+    slit,
+    spectral_range,
+    snr_input,
+    binary_arrays=False,
+):
+    """
+    Extract the source and background spectra through the given slit and compute the SNR
+    (or the exposure time) at the requested wavelength.
+
+    Parameters
+    ----------
+      UVMOSObj :: `UVMOS_Spectroscopy` object
+        The UVMOS observation to simulate.
+
+      TelescopeObj :: `Telescope` object
+        The telescope used to create `UVMOSObj` (for its pixel scale).
+
+      extraction_box, slit, spectral_range, snr_input :: dict
+        The corresponding items of the JSON request.
+
+      binary_arrays :: bool
+        If True, encode the source on the detector with the binary encoding (see
+        `encode_2d_array()`).
+
+    Returns
+    -------
+      results :: dict
+        The attributes to show on the frontend.
+    """
+    #
+    # Do uvmos spectroscopy
+    #
+
+    #
+    # 1. Spectral Range
+    #
+
+    UVMOSObj.min_wave = (float(spectral_range['minwavelength']) * u.nm).to(u.AA)
+
+    UVMOSObj.max_wave = (float(spectral_range['maxwavelength']) * u.nm).to(u.AA)
+
+    #
+    # 2. Slit spectroscopy
+    #
+    
+    UVMOSObj.specify_slit(slit_width = float(slit['width']) * u.arcsec, slit_height = float(slit['length']) * u.arcsec)
+
+    #
+    # 3. Extraction box, parameters are type 'int' in uvmos_spectroscopy.py
+    #
+    extraction_params = parse_extraction_box(
+        extraction_box, TelescopeObj.px_scale.value
+    )
+    extract_spectra(UVMOSObj, extraction_params)
+    #
+    # 4. SNR calculations
+    #
+    # A single wavelength (nm), a list of wavelengths (nm), or "all" the wavelengths of
+    # the extracted spectra
+    wave = parse_snr_wavelengths(snr_input["wavelength"])
+    if wave is None:
+        wave = u.Quantity(UVMOSObj.waves_CASTORSpectrum, u.AA).to(u.nm)
+    snr_result = uvmos_snr_or_t(
+        UVMOSObj, snr_input["val_type"], float(snr_input["val"]), wave.to(u.AA)
+    )
+
+    slit_width_pix = UVMOSObj.slit_width_pix
+    slit_height_pix = UVMOSObj.slit_height_pix
+
+    slit_width = UVMOSObj.slit_width.value
+    slit_height = UVMOSObj.slit_height.value
+
+    # Render the slit image once for both the source weights and the center pixel (at
+    # the median wavelength if the SNR is calculated at several wavelengths)
+    slit_image, center_pix = UVMOSObj.show_slit_image(
+        wave=float(np.median(wave.value))
+    )[:2]
+    source_detector = encode_2d_array(slit_image, binary=binary_arrays)
+
+    if snr_result.ndim == 0:
+        # SNR calculation above returns a 0 dimensional array.
+        snr_result = snr_result.item()
+    else:
+        snr_result = {"waves": wave.to(u.AA).value, "values": snr_result}
+
+    return ( dict(
+         snrResults = snr_result,
+         spectrum = {
+              "waves": UVMOSObj.waves_CASTORSpectrum,
+              "source_response": UVMOSObj.source_CASTORSpectrum,
+              "background_response": UVMOSObj.background_CASTORSpectrum,
+              "extracted_numpixs": UVMOSObj.source_extracted_numpixs
+         },
+         sourcePixelWeight = {
+              "source_detector": source_detector,
+              "centerPix": center_pix,
+         },
+         slitWidthPixel = slit_width_pix,
+         slitHeightPixel = slit_height_pix,
+         showSlit = {
+            "slitWidth": slit_width,
+            "slitHeight": slit_height,
+            "FWHM": UVMOSObj.FWHM.value,
+         },
+    )
+    )
+
+
+def uvmos_snr_or_t(UVMOSObj, val_type, val, wave):
+    """
+    Vectorized `UVMOS_Spectroscopy.calc_t_from_snr()` (if `val_type` is "snr") or
+    `calc_snr_from_t()` (if `val_type` is "t") over many wavelengths, reusing the
+    extracted source and background spectra.
+
+    The wavelength array is passed to the calculation in one call. If castor_etc does
+    not return one value per wavelength, the calculation is done for each wavelength
+    instead.
+
+    Parameters
+    ----------
+      UVMOSObj :: `UVMOS_Spectroscopy` object
+        The UVMOS observation, with its source and background spectra extracted.
+
+      val_type :: "snr" or "t"
+        Whether `val` is a target SNR or an exposure time (s).
+
+      val :: float
+        The target SNR or exposure time.
+
+      wave :: `astropy.Quantity`
+        The wavelength(s), scalar or 1D.
+
+    Returns
+    -------
+      result :: array of floats
+        The exposure time (s) or SNR at each wavelength, with the shape of `wave`.
+    """
+    if val_type == "snr":
+        def calc(wave):
+            return UVMOSObj.calc_t_from_snr(snr=val, wave=wave)
+    else:
+        def calc(wave):
+            return UVMOSObj.calc_snr_from_t(t=val, wave=wave)
+
+    if wave.ndim == 0:
+        return np.asarray(calc(wave))
+    try:
+        result = np.asarray(calc(wave), dtype=float)
+    except Exception:
+        result = None  # e.g., the calculation only supports scalar wavelengths
+    if result is None or result.shape != wave.shape:
+        logger.debug("UVMOS SNR calculation falls back to one call per wavelength")
+        result = np.array([np.asarray(calc(w)).item() for w in wave], dtype=float)
+    return result
+
+
+def extract_spectra(UVMOSObj, extraction_params):
+    """
+    Extract the source and background spectra of the `UVMOS_Spectroscopy` object with
+    the same extraction geometry (see `parse_extraction_box()`).
+    """
+    UVMOSObj.calc_source_CASTORSpectrum(**extraction_params)
+    UVMOSObj.calc_background_CASTORSpectrum(**extraction_params)
+
+
+def compute_uvmos(
+    TelescopeObj,
+    SourceObj,
+    BackgroundObj,
+    extraction_box,
+    slit,
+    spectral_range,
+    snr_input,
+    binary_arrays,
+):
+    """
+    Job queue entry point (see `jobs.py`): create the `UVMOS_Spectroscopy` object and
+    return the results of `simulate_uvmos()`.
+    """
+    UVMOSObj = UVMOS_Spectroscopy(TelescopeObj, SourceObj, BackgroundObj)
+    return simulate_uvmos(
+        UVMOSObj,
+        TelescopeObj,
+        extraction_box,
+        slit,
+        spectral_range,
+        snr_input,
+        binary_arrays,
+    )
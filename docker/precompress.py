@@ -0,0 +1,51 @@
+"""
+precompress.py
+
+Write gzip (`.gz`) and, if the `brotli` package is installed, brotli (`.br`) compressed
+copies of the text-based files of the React build, so that the Flask backend can serve
+them without compressing on the fly (see `backend/static_files.py`).
+
+Usage: python3 precompress.py <build directory>
+"""
+
+import gzip
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".css", ".html", ".ico", ".js", ".json", ".map", ".svg", ".txt", ".xml"
+}
+MIN_SIZE = 1024  # bytes. Smaller files are not worth compressing
+
+
+def precompress(directory):
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, filename)
+            with open(path, "rb") as f:
+                data = f.read()
+            if len(data) < MIN_SIZE:
+                continue
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                with open(path + ".gz", "wb") as f:
+                    f.write(compressed)
+            if brotli is not None:
+                compressed = brotli.compress(data, quality=11)
+                if len(compressed) < len(data):
+                    with open(path + ".br", "wb") as f:
+                        f.write(compressed)
+            print(f"Precompressed {path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("Usage: python3 precompress.py <build directory>")
+    precompress(sys.argv[1])
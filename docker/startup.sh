@@ -5,6 +5,24 @@
 # it is running in gunicorn
 skaha_sessionid=${1:-test123}
 TIMEOUT=120
+# Each browser session has its own server-side state (see `backend/utils.py`). The default
+# in-memory session store is per-process, so use more than 1 worker only together with
+# ETC_SESSION_BACKEND=disk or ETC_SESSION_BACKEND=redis (and ETC_REDIS_URL).
+WORKERS=${WORKERS:-1}
+THREADS=${THREADS:-4}
+# Asynchronous jobs are kept in the memory of the worker that accepted them (see
+# `backend/jobs.py`), so a client polling another worker would not find its job
+export ETC_ASYNC_JOBS=${ETC_ASYNC_JOBS:-true}
+if [ "$WORKERS" -gt 1 ] && [ "${ETC_ASYNC_JOBS,,}" = "true" ]; then
+    echo "WORKERS=$WORKERS requires ETC_ASYNC_JOBS=false (async jobs need 1 worker)" >&2
+    exit 1
+fi
+# Import the castor_etc backends once in the gunicorn master process (with `--preload`) so
+# forked workers share them copy-on-write and start serving immediately
+export ETC_PRELOAD_BACKENDS=true
+# Answer Gaia cone searches (Gaia spectra, transit fields) from a local tile index, which
+# is filled on demand from the Gaia archive (see `backend/gaia_index.py`)
+export ETC_GAIA_INDEX_DIR=${ETC_GAIA_INDEX_DIR:-/arc/projects/CASTOR/gaia_index}
 
 echo "Starting gunicorn..."
 
@@ -13,4 +31,7 @@ gunicorn -b 0.0.0.0:5000 connector:app \
         --log-level=debug \
         --log-file=/dev/stdout \
         --timeout $TIMEOUT \
+        --workers $WORKERS \
+        --threads $THREADS \
+        --preload \
         -e skaha_sessionid=${skaha_sessionid}
@@ -291,9 +291,13 @@ const TelescopeForm: React.FC<TelescopeFormProps> = ({
             await axios
               .put(API_URL + "telescope", data)
               .then((response) => response.data)
-              .then((response) =>
-                sessionStorage.setItem(FORM_PARAMS, JSON.stringify(response))
-              )
+              .then(async (response) => {
+                // The passband curves do not depend on the form values, so they are
+                // served (and cached by the browser via ETags) separately
+                const passbands = await axios.get(API_URL + "passbands");
+                response["fullPassbandCurves"] = passbands.data;
+                sessionStorage.setItem(FORM_PARAMS, JSON.stringify(response));
+              })
               .then(() => {
                 setIsSent(true)
                 setIsPhotometrySavedAndUnsubmitted(true);
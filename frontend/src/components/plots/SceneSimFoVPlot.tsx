@@ -63,9 +63,64 @@
 import { themeBackgroundColor } from "components/DarkModeTheme";
 import ResponsivePlot from "../ResponsivePlot";
 import { useEffect, useState } from "react";
+import axios from "axios";
+import { API_URL } from "env";
 
 import localForage from "localforage";
 
+// Tiled, multi-resolution scene from the backend (see backend/scene_tiles.py)
+type SceneMeta = {
+  id: string;
+  tileSize: number;
+  levels: number[][]; // [rows, cols] of each level, from full resolution down
+  dtype: string;
+  vmin: number; // log10 value of 0
+  vmax: number; // log10 value of 65535
+};
+
+// Show the highest resolution level that is at most this many pixels wide/high
+const MAX_SCENE_DISPLAY_PIXELS = 1024;
+
+const pickSceneLevel = (scene: SceneMeta) => {
+  const level = scene.levels.findIndex(
+    ([rows, cols]) => Math.max(rows, cols) <= MAX_SCENE_DISPLAY_PIXELS
+  );
+  return level === -1 ? scene.levels.length - 1 : level;
+};
+
+// Fetch all tiles of one level and return the log10 scene values
+const fetchSceneLevel = async (scene: SceneMeta, level: number) => {
+  const [rows, cols] = scene.levels[level];
+  const tileSize = scene.tileSize;
+  const z: number[][] = Array.from({ length: rows }, () => new Array(cols).fill(0));
+  const valueScale = (scene.vmax - scene.vmin) / 65535;
+  const requests = [];
+  for (let tileY = 0; tileY * tileSize < rows; tileY++) {
+    for (let tileX = 0; tileX * tileSize < cols; tileX++) {
+      requests.push(
+        axios
+          .get(API_URL + `transit/scene/${scene.id}/${level}/${tileX}/${tileY}`, {
+            responseType: "arraybuffer",
+          })
+          .then((response) => {
+            const [tileRows, tileCols] = String(response.headers["x-tile-shape"])
+              .split(",")
+              .map(Number);
+            const values = new Uint16Array(response.data);
+            for (let r = 0; r < tileRows; r++) {
+              const row = z[tileY * tileSize + r];
+              for (let c = 0; c < tileCols; c++) {
+                row[tileX * tileSize + c] = scene.vmin + values[r * tileCols + c] * valueScale;
+              }
+            }
+          })
+      );
+    }
+  }
+  await Promise.all(requests);
+  return z;
+};
+
 type SceneSimFoVPlotProps = {
   numTransitSubmit: number;
 };
@@ -76,15 +131,13 @@ const SceneSimFoVPlot: React.FC<SceneSimFoVPlotProps> = ({
     const data = [];
     const annotations = [];
 
-    const pako = require('pako')
-
     const [plotData, setPlotData] = useState<{ccd_dim: number[], gaia: {
         ra: number[],
         dec: number[],
         x: number[],
         y: number[]
         gs_i: number[],
-        _f: string,
+        scene?: SceneMeta,
     }, xout: number, yout: number}>({
         ccd_dim: [],
         // scene_sim: {
@@ -99,7 +152,6 @@ const SceneSimFoVPlot: React.FC<SceneSimFoVPlotProps> = ({
             x: [],
             y: [],
             gs_i: [],
-            _f: ''
         },
         xout: 0,
         yout: 0,
@@ -107,21 +159,32 @@ const SceneSimFoVPlot: React.FC<SceneSimFoVPlotProps> = ({
         // result_g_dec: '[]',
     });
 
+    // log10 values of the displayed scene level
+    const [sceneLog, setSceneLog] = useState<number[][] | null>(null);
+
     useEffect(() => {
         localForage.getItem("transitParams").then((res: any) => {
             setPlotData(JSON.parse(res))} )
     }, [numTransitSubmit])
+
+    useEffect(() => {
+        const scene = plotData?.gaia?.scene;
+        if (!scene) {
+            setSceneLog(null);
+            return;
+        }
+        let isCancelled = false;
+        fetchSceneLevel(scene, pickSceneLevel(scene))
+            .then((z) => { if (!isCancelled) setSceneLog(z) })
+            .catch((error) => console.log(error));
+        return () => { isCancelled = true };
+    }, [plotData])
     
     if (plotData !== null){
         
-        let _f = plotData.gaia._f
-
-        // compressed json response is decompressed in the frontend
-        // https://stackoverflow.com/questions/72947222/ 
-        if (_f){
-            let compressedData = Uint8Array.from(window.atob(_f), (c) => c.charCodeAt(0));
-            let decompressedData = pako.inflate(compressedData, {to: "string"});
-            let jsonObject = JSON.parse(decompressedData)
+        if (sceneLog !== null){
+            // Tiles of the level that fits the plot (already log10-scaled)
+            let jsonObject = sceneLog
 
             // Adding scene
 
@@ -137,8 +200,7 @@ const SceneSimFoVPlot: React.FC<SceneSimFoVPlotProps> = ({
 
             data.push(
                  {
-                z: jsonObject.map((row: number[]) =>
-                row.map((value: number) => Math.log10(value))),
+                z: jsonObject,
                 type: "heatmap",
                 x0: extent[0],
                 dx: px_scale_x,
@@ -62,9 +62,14 @@
 
 import React from "react";
 import ReactDOM from "react-dom";
+import axios from "axios";
 import "./index.css";
 import DarkThemeApp from "./App";
 
+// Send the session cookie with every API request (also needed for local development,
+// where the API is served from a different port)
+axios.defaults.withCredentials = true;
+
 ReactDOM.render(
   <React.StrictMode>
     <DarkThemeApp />